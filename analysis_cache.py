@@ -0,0 +1,216 @@
+# Persistent cache for /api/analyze-audio results
+# Entries are keyed by what the audio *is* - the S3 ETag, or a sha256 of the
+# bytes for anything else - plus the analysis type and parameters, so a
+# result is reused until the audio itself changes. Stored in songs.db so all
+# gunicorn workers share it; the least recently used entries are evicted
+# once the cache grows past ANALYSIS_CACHE_MB.
+# Hit/miss counters for every cache (this one, renders, the disk caches) and
+# the last-use times of analysis and render hits are kept in memory per
+# process and written by a writer thread every STATS_FLUSH_SECONDS, so a
+# cache hit never costs a SQLite write.
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+import db
+import storage
+
+MAX_BYTES = int(os.environ.get('ANALYSIS_CACHE_MB', 64)) * 1024 * 1024
+STATS_FLUSH_SECONDS = float(os.environ.get('CACHE_STATS_FLUSH_SECONDS') or 5)
+
+# Bump when the analysis code changes so old results stop matching
+ANALYSIS_VERSION = 2
+
+
+def s3_fingerprint(audio_url):
+    """'etag:...' for audio in our bucket (one HEAD request, no download), else None"""
+    location = storage.parse_s3_url(audio_url)
+    if not location or not storage.has_credentials():
+        return None
+    bucket, key = location
+    try:
+        head = storage.get_s3_client().head_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        print(f"⚠️ Could not HEAD {key} for analysis cache: {e}")
+        return None
+    etag = head['ETag'].strip('"')
+    return f"etag:{bucket}/{key}:{etag}"
+
+
+def cache_key(fingerprint, analysis_type, params):
+    raw = json.dumps([ANALYSIS_VERSION, fingerprint, analysis_type, params], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# {name: [hits, misses]} counted in this process since the last flush
+_pending = {}
+# {(table, cache_key): time of the latest hit} since the last flush - the rows' new LRU positions
+_touched = {}
+_pending_lock = threading.Lock()
+_writer_pid = None
+# Tables whose rows record_use may touch (both keyed by cache_key, with a last_used_at)
+TOUCHED_TABLES = ('analysis_cache', 'renders')
+
+
+def record_lookup(name, hit):
+    """Count a hit or miss for cache `name` (added to cache_stats by the next flush)"""
+    _start_writer()
+    with _pending_lock:
+        counts = _pending.setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def record_use(table, key):
+    """Note a hit on a cache_key row of `table` (its last_used_at is written by the next flush)"""
+    _start_writer()
+    with _pending_lock:
+        _touched[(table, key)] = time.time()
+
+
+def flush_stats(conn=None):
+    """Write this process's pending counters and last-use times in one transaction. Returns how many caches were updated."""
+    with _pending_lock:
+        batch = [(name, hits, misses) for name, (hits, misses) in _pending.items()]
+        touched = list(_touched.items())
+        _pending.clear()
+        _touched.clear()
+    if not batch and not touched:
+        return 0
+    own_conn = conn is None
+    if own_conn:
+        conn = db.connect()
+    try:
+        conn.executemany('''INSERT INTO cache_stats (name, hits, misses) VALUES (?, ?, ?)
+                            ON CONFLICT(name) DO UPDATE SET hits = hits + excluded.hits,
+                                                            misses = misses + excluded.misses''', batch)
+        for table in TOUCHED_TABLES:
+            conn.executemany(f"UPDATE {table} SET last_used_at = ? WHERE cache_key = ?",
+                             [(used, key) for (touched_table, key), used in touched if touched_table == table])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        # Keep them for the next flush rather than losing them
+        with _pending_lock:
+            for name, hits, misses in batch:
+                counts = _pending.setdefault(name, [0, 0])
+                counts[0] += hits
+                counts[1] += misses
+            for row, used in touched:
+                _touched[row] = max(used, _touched.get(row, 0))
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return len(batch)
+
+
+def get(key, conn=None):
+    """Cached result for `key` (refreshing its LRU position), or None. Counts the hit/miss."""
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT result FROM analysis_cache WHERE cache_key = ?", (key,))
+    row = c.fetchone()
+    if row:
+        record_use('analysis_cache', key)
+    record_lookup('analysis', bool(row))
+    return json.loads(row[0]) if row else None
+
+
+def put(key, fingerprint, analysis_type, result, conn=None):
+    """Store a result and evict least recently used entries beyond MAX_BYTES"""
+    conn = conn or db.get_db()
+    # Write pending last-use times first so eviction sees every recent hit
+    flush_stats(conn)
+    payload = json.dumps(result)
+    c = conn.cursor()
+    c.execute('''INSERT OR REPLACE INTO analysis_cache
+                 (cache_key, fingerprint, analysis_type, result, size_bytes, last_used_at)
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (key, fingerprint, analysis_type, payload, len(payload), time.time()))
+    evict(conn)
+    conn.commit()
+
+
+def evict(conn, max_bytes=None):
+    """Drop least recently used entries until the cache fits in max_bytes. Returns the count removed."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM analysis_cache")
+    excess = c.fetchone()[0] - max_bytes
+    if excess <= 0:
+        return 0
+    c.execute("SELECT cache_key, size_bytes FROM analysis_cache ORDER BY last_used_at")
+    doomed = []
+    for row in c.fetchall():
+        if excess <= 0:
+            break
+        doomed.append((row[0],))
+        excess -= row[1]
+    c.executemany("DELETE FROM analysis_cache WHERE cache_key = ?", doomed)
+    return len(doomed)
+
+
+def stats(conn=None):
+    """Entry count, size and hit/miss counters for every cache that reports to cache_stats"""
+    flush_stats()
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT name, hits, misses FROM cache_stats")
+    result = {}
+    for row in c.fetchall():
+        lookups = row[1] + row[2]
+        result[row[0]] = {
+            'hits': row[1],
+            'misses': row[2],
+            'hit_rate': round(row[1] / lookups, 3) if lookups else None
+        }
+    c.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM analysis_cache")
+    entries, size = c.fetchone()
+    result.setdefault('analysis', {'hits': 0, 'misses': 0, 'hit_rate': None})
+    result['analysis'].update({'entries': entries, 'size_bytes': size, 'max_bytes': MAX_BYTES})
+    return result
+
+
+def _write_loop():
+    conn = db.connect()
+    while True:
+        time.sleep(STATS_FLUSH_SECONDS)
+        try:
+            flush_stats(conn)
+        except Exception as e:
+            print(f"❌ Cache stats writer error: {e}")
+
+
+def _start_writer():
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _pending_lock:
+        if _writer_pid == os.getpid():
+            return
+        threading.Thread(target=_write_loop, name='cache-stats-writer', daemon=True).start()
+        _writer_pid = os.getpid()
+
+
+def _flush_at_exit():
+    try:
+        flush_stats()
+    except Exception as e:
+        print(f"❌ Could not write cache stats at exit: {e}")
+
+
+def _after_fork():
+    # The parent's pending counts are the parent's to write
+    global _pending_lock, _writer_pid
+    _pending_lock = threading.Lock()
+    _writer_pid = None
+    _pending.clear()
+    _touched.clear()
+
+
+atexit.register(_flush_at_exit)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -1,13 +1,33 @@
 from flask import Flask, render_template, request, jsonify, send_file
 import os
+import re
+import html
 import json
-import sqlite3
 from datetime import datetime
-import subprocess
 import traceback
+import threading
+import time
 import urllib.request
-import boto3
+import sqlite3
 from botocore.exceptions import ClientError
+import jobs
+import transfer
+import storage
+import db
+import events
+import migrations
+import analysis_cache
+import audio_tasks
+import audio_cache
+import pcm_cache
+import render_cache
+import dsp
+import zip_import
+import ingest_events
+import queries
+from queries import (INBOX_SELECT, encode_page_cursor, decode_page_cursor, keyset_page,
+                     inbox_filters)
+import desktop_watcher
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -17,227 +37,238 @@ app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max
 
-# Global variable to store last error for voice feedback
-last_download_error = None
+# Background ingest workers (per gunicorn worker process)
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+RECORDING_MAX_ATTEMPTS = int(os.environ.get('RECORDING_MAX_ATTEMPTS', 6))
+
+# Listing pagination
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+# Server-Sent Events (inbox push)
+# Open streams per worker: a quarter of its gthread threads (gunicorn.conf.py) by default, so
+# page loads, uploads and Twilio webhooks keep the rest; clients over the cap poll instead
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
+SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS') or max(1, GUNICORN_THREADS // 4))
+SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', 300))
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 2000
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_CLIENTS)
+
+# Local audio serving (static/uploads, static/spliced)
+UPLOAD_MAX_AGE_SECONDS = 86400
+AUDIO_READ_CHUNK = 256 * 1024
+
+# Full-text search
+SEARCH_PAGE_SIZE_DEFAULT = 20
+SEARCH_SNIPPET_TOKENS = 16
 
 # Create directories
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs('static/spliced', exist_ok=True)
 
 def init_db():
-    conn = sqlite3.connect('songs.db')
-    c = conn.cursor()
+    """Bring songs.db up to the latest schema version (see migrations.py)"""
+    conn = db.get_db()
+    applied = migrations.migrate(conn)
+    # The pre-render triggers only queue jobs while this is > 0
+    jobs.set_setting('transpose_prerender_semitones', audio_tasks.TRANSPOSE_PRERENDER_SEMITONES, conn)
+    conn.commit()
+    print(f"Database at schema version {migrations.current_version(conn)} ({len(applied)} migrations applied)")
+
+@app.before_request
+def ensure_background_workers():
+    """Start the job workers, the desktop watcher and the change log watcher (which also prunes the log)
+    lazily so each forked gunicorn worker gets its own threads"""
+    jobs.start_workers(INGEST_WORKERS, db_path=db.DB_PATH)
+    desktop_watcher.start()
+    events.start_watcher()
+
+app.teardown_appcontext(db.release)
+
+# Initialize database on startup (safe for production - won't drop existing data).
+# Runs at import so gunicorn with preload_app gets the schema too.
+init_db()
+
+def page_limit():
+    """Page size from ?limit=, clamped to PAGE_SIZE_MAX"""
+    limit = request.args.get('limit', PAGE_SIZE_DEFAULT, type=int) or PAGE_SIZE_DEFAULT
+    return max(1, min(limit, PAGE_SIZE_MAX))
+
+def inbox_item(row):
+    """JSON-ready inbox item from a queries.INBOX_ITEM_COLUMNS row.
+
+    s3_url is the stored object URL; play_url is a freshly signed one (from
+    storage's signing cache), preferring the compact rendition. play_url is
+    None if signing fails - the page shows the item as unplayable and asks
+    /api/play-urls again rather than falling back to the private s3_url.
+    """
+    item = {
+        'id': row[0], 'sender_name': row[1], 'sender_phone': row[2], 'content_type': row[3],
+        'title': row[4], 'content': row[5], 's3_url': row[6], 'date_folder': row[7], 'created_at': row[8],
+        'job_status': row[9], 'play_url': None, 'play_type': None
+    }
+    try:
+        if row[10] and storage.has_credentials():
+            item['play_url'] = storage.presign(storage.bucket_name(), row[10])
+            item['play_type'] = row[11]
+        else:
+            item['play_url'] = storage.play_url(row[6])
+    except Exception as e:
+        print(f"⚠️ Could not sign play URL for inbox item {row[0]}: {e}")
+    return item
 
-    # Create songs table
-    c.execute('''CREATE TABLE IF NOT EXISTS songs
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  title TEXT,
-                  lyrics TEXT,
-                  notes TEXT,
-                  audio_files TEXT,
-                  voice_notes TEXT,
-                  spliced_file TEXT,
-                  source TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-
-    # Create inbox table for team messages
-    c.execute('''CREATE TABLE IF NOT EXISTS inbox
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  sender_name TEXT,
-                  sender_phone TEXT,
-                  content_type TEXT,
-                  title TEXT,
-                  content TEXT,
-                  s3_url TEXT,
-                  date_folder TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-
-    # Create projects table
-    c.execute('''CREATE TABLE IF NOT EXISTS projects
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  notes TEXT,
-                  lyrics TEXT,
-                  track_count INTEGER DEFAULT 0,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-
-    # Create phrases table
-    c.execute('''CREATE TABLE IF NOT EXISTS phrases
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  title TEXT NOT NULL,
-                  content TEXT,
-                  s3_url TEXT,
-                  duration TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-
-    # Create project_items table for linking inbox items to projects
-    c.execute('''CREATE TABLE IF NOT EXISTS project_items
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  project_id INTEGER NOT NULL,
-                  inbox_id INTEGER NOT NULL,
-                  position INTEGER DEFAULT 0,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (project_id) REFERENCES projects (id),
-                  FOREIGN KEY (inbox_id) REFERENCES inbox (id))''')
+def fetch_inbox_page(c, args, limit):
+    """One page of inbox items (newest first) matching the request filters"""
+    where, params = inbox_filters(args)
+    rows, next_cursor = keyset_page(c, INBOX_SELECT, where, params, 'created_at', limit, args.get('cursor'))
+    return [inbox_item(row) for row in rows], next_cursor
 
-    conn.commit()
-    conn.close()
-    print("Database initialized with songs, inbox, projects, and phrases tables")
+def current_inbox_cursor(c):
+    """Sequence number of the latest inbox change (0 if none yet)"""
+    c.execute(queries.LATEST_CHANGE_SQL)
+    return c.fetchone()[0]
 
 @app.route('/')
 def index():
-    """Main page with all inbox content loaded"""
+    """Main page with the first page of inbox content loaded (the rest loads on scroll)"""
     try:
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
-        c.execute('''SELECT id, sender_name, sender_phone, content_type, title, content, s3_url, date_folder, created_at
-                     FROM inbox
-                     ORDER BY created_at DESC''')
-        inbox_items = []
-        for row in c.fetchall():
-            inbox_items.append({
-                'id': row[0],
-                'sender_name': row[1],
-                'sender_phone': row[2],
-                'content_type': row[3],
-                'title': row[4],
-                'content': row[5],
-                's3_url': row[6],
-                'date_folder': row[7],
-                'created_at': row[8]
-            })
-        conn.close()
+        # Read the cursor first so anything written while rendering is picked up by the next sync
+        inbox_cursor = current_inbox_cursor(c)
+        inbox_items, next_page = fetch_inbox_page(c, request.args, page_limit())
 
-        # Auto-import desktop files on load
-        auto_import_desktop_files()
-
-        return render_template('index.html', inbox_items=inbox_items)
+        return render_template('index.html', inbox_items=inbox_items, inbox_cursor=inbox_cursor,
+                               next_page=next_page, play_url_refresh_seconds=PLAY_URL_REFRESH_SECONDS)
     except Exception as e:
         print(f"Error loading inbox: {e}")
-        return render_template('index.html', inbox_items=[])
+        return render_template('index.html', inbox_items=[], inbox_cursor=0, next_page=None,
+                               play_url_refresh_seconds=PLAY_URL_REFRESH_SECONDS)
 
-def auto_import_desktop_files():
-    """Auto-import audio files from desktop without user action"""
+@app.route('/api/inbox')
+def api_inbox():
+    """Paged inbox API (?cursor=, ?limit=, ?sender=, ?content_type=, ?date_from=, ?date_to=)"""
     try:
-        import os
-        import glob
-
-        # Check if we have AWS credentials first
-        aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-        aws_bucket = os.environ.get('AWS_BUCKET_NAME')
-
-        if not all([aws_access_key, aws_secret_key, aws_bucket]):
-            print("⚠️  Skipping auto-import: Missing AWS credentials")
-            return
-
-        desktop_patterns = [
-            '/Users/asiamurray/Desktop/*.mp3',
-            '/Users/asiamurray/Desktop/*.wav',
-            '/Users/asiamurray/Desktop/*.m4a'
-        ]
+        conn = db.get_db()
+        c = conn.cursor()
+        items, next_cursor = fetch_inbox_page(c, request.args, page_limit())
+        return jsonify({'success': True, 'items': items, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
-        # Check if desktop path exists
-        desktop_path = '/Users/asiamurray/Desktop'
-        if not os.path.exists(desktop_path):
-            print("ℹ️  Desktop path not found, skipping auto-import")
-            return
+def inbox_changes_between(c, since, cursor):
+    """Items upserted and ids deleted with change seq in (since, cursor]"""
+    # Rows come in seq order, so the last op seen for an item is its latest
+    c.execute(queries.CHANGES_BETWEEN_SQL, (since, cursor))
+    latest_op = {row[0]: row[1] for row in c.fetchall()}
+    deleted = [inbox_id for inbox_id, op in latest_op.items() if op == 'delete']
+    upserted = [inbox_id for inbox_id, op in latest_op.items() if op == 'upsert']
+
+    items = []
+    # Chunk the IN list to stay under SQLite's bound-parameter limit
+    for i in range(0, len(upserted), 500):
+        chunk = upserted[i:i + 500]
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(f"{INBOX_SELECT} WHERE id IN ({placeholders})", chunk)
+        items.extend(inbox_item(row) for row in c.fetchall())
+    items.sort(key=lambda item: item['id'])
+    return items, deleted
+
+@app.route('/api/inbox/sync')
+def api_inbox_sync():
+    """Incremental inbox sync: items added, changed or deleted since the client's cursor"""
+    try:
+        since = request.args.get('since', 0, type=int)
 
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
+        cursor = current_inbox_cursor(c)
 
-        # Get existing files to avoid duplicates
-        c.execute("SELECT content FROM inbox WHERE sender_name = 'Desktop Import'")
-        existing = {row[0] for row in c.fetchall()}
+        # A cursor from the future (database reset) or from before the pruned change log
+        # can't be brought up to date incrementally - the client reloads the inbox
+        if since > cursor or not events.replayable(conn, since):
+            return jsonify({'success': True, 'reset': True, 'cursor': cursor})
 
-        imported = 0
-        errors = 0
-        for pattern in desktop_patterns:
-            for file_path in glob.glob(pattern):
-                filename = os.path.basename(file_path)
-                content_key = f"Desktop: {filename}"
+        # Nothing new since the client's last poll - 304 with no body
+        etag = f'W/"inbox-{cursor}"'
+        if cursor == since or etag in request.headers.get('If-None-Match', ''):
+            return '', 304, {'ETag': etag, 'Cache-Control': 'no-cache'}
 
-                if content_key in existing:
-                    continue
+        items, deleted = inbox_changes_between(c, since, cursor)
 
-                try:
-                    with open(file_path, 'rb') as f:
-                        file_data = f.read()
-
-                    # Upload to S3 with error handling
-                    try:
-                        s3_client = boto3.client(
-                            's3',
-                            aws_access_key_id=aws_access_key,
-                            aws_secret_access_key=aws_secret_key,
-                            region_name=os.environ.get('AWS_REGION', 'us-east-1')
-                        )
-
-                        date_folder = datetime.now().strftime('%Y-%m-%d')
-                        s3_key = f"recordings/{date_folder}/desktop_{filename}"
-
-                        s3_client.put_object(
-                            Bucket=aws_bucket,
-                            Key=s3_key,
-                            Body=file_data,
-                            ContentType='audio/mpeg' if filename.endswith('.mp3') else 'audio/wav'
-                        )
-
-                        signed_url = s3_client.generate_presigned_url(
-                            'get_object',
-                            Params={'Bucket': aws_bucket, 'Key': s3_key},
-                            ExpiresIn=3600
-                        )
-
-                        # Add to inbox
-                        c.execute("""INSERT INTO inbox
-                                     (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                                     VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                  ('Desktop Import', 'LOCAL', 'voice', content_key, content_key, signed_url, date_folder))
-
-                        imported += 1
-                        print(f"✅ Auto-imported: {filename}")
-
-                    except Exception as s3_error:
-                        # If S3 fails, still add to inbox without S3 URL
-                        print(f"⚠️  S3 upload failed for {filename}, adding to inbox anyway: {s3_error}")
-                        c.execute("""INSERT INTO inbox
-                                     (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                                     VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                  ('Desktop Import', 'LOCAL', 'voice', content_key,
-                                   f"Desktop file: {filename} (S3 upload failed)", None, datetime.now().strftime('%Y-%m-%d')))
-                        imported += 1
+        response = jsonify({'success': True, 'cursor': cursor, 'items': items, 'deleted': deleted})
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
-                except Exception as e:
-                    print(f"❌ Import failed {filename}: {e}")
-                    errors += 1
+@app.route('/api/inbox/stream')
+def api_inbox_stream():
+    """Server-Sent Events stream of inbox changes (resumes from Last-Event-ID)"""
+    # Each open stream holds a gthread worker thread - cap them so page loads and webhooks always get one
+    if not _sse_slots.acquire(blocking=False):
+        return 'Too many open streams', 503, {'Retry-After': '30'}
 
-        if imported:
-            conn.commit()
-            print(f"📁 Auto-imported {imported} desktop files ({errors} errors)")
-        conn.close()
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since', 0)
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        last_id = 0
+
+    def generate():
+        since = last_id
+        # Tell the browser how long to wait before reconnecting
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        if not events.replayable(db.get_db(), since):
+            # The changes since the client's cursor were pruned - it reloads the inbox instead
+            yield "event: reset\ndata: {}\n\n"
+            return
+        started = time.monotonic()
+        while time.monotonic() - started < SSE_MAX_SECONDS:
+            cursor = events.wait_for_change(since, timeout=SSE_KEEPALIVE_SECONDS)
+            if cursor <= since:
+                yield ": keepalive\n\n"
+                continue
+
+            c = db.get_db().cursor()
+            items, deleted = inbox_changes_between(c, since, cursor)
+            since = cursor
+            data = json.dumps({'cursor': cursor, 'items': items, 'deleted': deleted})
+            yield f"id: {cursor}\nevent: inbox\ndata: {data}\n\n"
+        # Streams end after SSE_MAX_SECONDS; EventSource reconnects with Last-Event-ID
+
+    response = app.response_class(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs when the client disconnects or the stream ends, even if it never started
+    response.call_on_close(_sse_slots.release)
+    return response
 
+@app.route('/api/inbox/<int:item_id>/status')
+def inbox_item_status(item_id):
+    """Background job status for an inbox item (queued, running, done, failed) and its ingest events"""
+    try:
+        conn = db.get_db()
+        job = jobs.get_job_status(item_id, conn=conn)
+        events = ingest_events.history(job_id=job['id'], conn=conn) if job else []
+        return jsonify({'success': True, 'job': job, 'events': events})
     except Exception as e:
-        print(f"❌ Auto-import error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/inbox')
-def api_inbox():
-    """Real-time inbox API for auto-refresh"""
+@app.route('/api/ingest-events')
+def api_ingest_events():
+    """Ingest history for one recording (?sid= RecordingSid/MessageSid, ?job_id=), else the latest errors"""
     try:
-        conn = sqlite3.connect('songs.db')
-        c = conn.cursor()
-        c.execute('''SELECT id, sender_name, sender_phone, content_type, title, content, s3_url, date_folder, created_at
-                     FROM inbox ORDER BY created_at DESC''')
-
-        items = []
-        for row in c.fetchall():
-            items.append({
-                'id': row[0], 'sender_name': row[1], 'sender_phone': row[2], 'content_type': row[3],
-                'title': row[4], 'content': row[5], 's3_url': row[6], 'date_folder': row[7], 'created_at': row[8]
-            })
-        conn.close()
-        return jsonify({'success': True, 'items': items})
+        sid = request.args.get('sid')
+        job_id = request.args.get('job_id', type=int)
+        if sid or job_id:
+            return jsonify({'success': True, 'events': ingest_events.history(sid=sid, job_id=job_id)})
+        return jsonify({'success': True, 'events': ingest_events.recent_errors()})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -249,11 +280,10 @@ def update_title():
         item_id = data.get('id')
         new_title = data.get('title')
 
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
         c.execute("UPDATE inbox SET title = ? WHERE id = ?", (new_title, item_id))
         conn.commit()
-        conn.close()
 
         return jsonify({'success': True})
     except Exception as e:
@@ -266,11 +296,10 @@ def delete_item():
         data = request.json
         item_id = data.get('id')
 
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
         c.execute("DELETE FROM inbox WHERE id = ?", (item_id,))
         conn.commit()
-        conn.close()
 
         return jsonify({'success': True})
     except Exception as e:
@@ -283,7 +312,7 @@ def send_to_phrases():
         data = request.json
         item_id = data.get('id')
 
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
 
         # Get original item
@@ -298,7 +327,6 @@ def send_to_phrases():
                       ('PHRASES', row[2], row[3], f"📝 {row[4]}", row[5], row[6], row[7]))
 
         conn.commit()
-        conn.close()
 
         return jsonify({'success': True})
     except Exception as e:
@@ -307,11 +335,10 @@ def send_to_phrases():
 @app.route('/api/songs')
 def get_songs():
     try:
-        conn = sqlite3.connect('songs.db')
-        conn.row_factory = sqlite3.Row
+        conn = db.get_db()
         c = conn.cursor()
-        c.execute("SELECT * FROM songs ORDER BY created_at DESC")
-        rows = c.fetchall()
+        rows, next_cursor = keyset_page(c, queries.SONGS_SELECT, [], [], 'created_at',
+                                        page_limit(), request.args.get('cursor'))
         
         songs = []
         for row in rows:
@@ -327,8 +354,9 @@ def get_songs():
                 song['voice_notes'] = []
             songs.append(song)
             
-        conn.close()
-        return jsonify({'songs': songs})
+        return jsonify({'songs': songs, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'songs': [], 'error': str(e)}), 400
     except Exception as e:
         print(f"Error loading songs: {e}")
         traceback.print_exc()
@@ -368,63 +396,99 @@ def upload_files():
 
 @app.route('/api/splice', methods=['POST'])
 def splice_audio():
+    """Concatenate uploaded files, with optional crossfades and {"silence": seconds} gaps - queued on the DSP pool"""
     try:
         data = request.json
         files = data.get('files', [])
+        crossfade = float(data.get('crossfade', 0))  # seconds of overlap between adjacent clips
         
         if not files:
             return jsonify({'success': False, 'error': 'No files to splice'})
         
-        # Try using pydub if available
-        try:
-            from pydub import AudioSegment
-            combined = AudioSegment.empty()
-            
-            for file_info in files:
-                # Handle both path string and file object
-                if isinstance(file_info, str):
-                    filepath = file_info.replace('/static/', 'static/')
-                    saved_name = os.path.basename(filepath)
-                else:
-                    saved_name = file_info.get('saved_name', '')
-                    filepath = os.path.join('static/uploads', saved_name)
-                
-                if os.path.exists(filepath):
-                    if filepath.endswith('.opus'):
-                        audio = AudioSegment.from_ogg(filepath)
-                    else:
-                        audio = AudioSegment.from_file(filepath)
-                    combined += audio
-            
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_filename = f'spliced_{timestamp}.mp3'
-            output_path = os.path.join('static/spliced', output_filename)
-            combined.export(output_path, format="mp3")
-            
-        except ImportError:
-            # Fallback: just copy first file as placeholder
-            import shutil
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_filename = f'spliced_{timestamp}.mp3'
-            output_path = os.path.join('static/spliced', output_filename)
-            
-            if isinstance(files[0], str):
-                first_file = files[0].replace('/static/', 'static/')
-            else:
-                first_file = os.path.join('static/uploads', files[0]['saved_name'])
-            
-            shutil.copy(first_file, output_path)
-        
-        return jsonify({
-            'success': True, 
-            'spliced_file': f'/static/spliced/{output_filename}',
-            'filename': output_filename
-        })
+        return submit_dsp('splice', audio_tasks.splice, files=files, crossfade=crossfade)
     except Exception as e:
         print(f"Splice error: {e}")
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)})
 
+def serve_audio(directory, filename, cache_control):
+    """Conditional, byte-range aware response for a local audio file.
+
+    Seeking in <audio> sends Range requests; those get a 206 with just the
+    requested bytes. The body is the WSGI server's file_wrapper around the
+    file seeked to the range start, which gunicorn sends with sendfile(2)
+    up to Content-Length - no copy through Python.
+    """
+    import mimetypes
+    from werkzeug.security import safe_join
+    from werkzeug.http import http_date, parse_date
+
+    path = safe_join(directory, filename)
+    if not path or not os.path.isfile(path):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+
+    response = app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+                                  direct_passthrough=True)
+    response.set_etag(etag)
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Accept-Ranges'] = 'bytes'
+
+    if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+    if request.if_none_match.contains(etag) or (
+            not request.if_none_match and if_modified_since and int(stat.st_mtime) <= if_modified_since.timestamp()):
+        response.status_code = 304
+        return response
+
+    start, stop = 0, size
+    # If-Range: only honour the range if the client's copy is still this file
+    if_range = request.if_range
+    range_valid = (not if_range.etag or if_range.etag == etag) and \
+                  (not if_range.date or int(stat.st_mtime) <= if_range.date.timestamp())
+    if request.range and range_valid:
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, stop = byte_range
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+
+    length = stop - start
+    f = open(path, 'rb')
+    f.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper:
+        response.response = file_wrapper(f, AUDIO_READ_CHUNK)
+    else:
+        # Dev server: its file wrapper would read to EOF, so stop at the end of the range ourselves
+        def read_range():
+            remaining = length
+            with f:
+                while remaining > 0:
+                    chunk = f.read(min(AUDIO_READ_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        response.response = read_range()
+    response.headers['Content-Length'] = str(length)
+    return response
+
+@app.route('/static/spliced/<path:filename>')
+def serve_spliced(filename):
+    """Spliced output and project mixdowns: content-addressed names, never rewritten"""
+    return serve_audio('static/spliced', filename, audio_tasks.IMMUTABLE_CACHE_CONTROL)
+
+@app.route('/static/uploads/<path:filename>')
+def serve_upload(filename):
+    """Uploaded audio: timestamped names, cached for a day and revalidated by ETag after that"""
+    return serve_audio(app.config['UPLOAD_FOLDER'], filename, f'public, max-age={UPLOAD_MAX_AGE_SECONDS}')
+
 @app.route('/api/save_song', methods=['POST'])
 def save_song():
     try:
@@ -445,7 +509,7 @@ def save_song():
         audio_files_json = json.dumps(audio_files)
         voice_notes_json = json.dumps(voice_notes)
         
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
         
         if song_id:
@@ -467,7 +531,6 @@ def save_song():
             result_id = c.lastrowid
         
         conn.commit()
-        conn.close()
         
         return jsonify({'success': True, 'id': result_id})
         
@@ -487,8 +550,7 @@ def merge_songs():
         if not source_song_id or not target_song_id:
             return jsonify({'success': False, 'error': 'Missing song IDs'})
         
-        conn = sqlite3.connect('songs.db')
-        conn.row_factory = sqlite3.Row
+        conn = db.get_db()
         c = conn.cursor()
         
         # Get both songs
@@ -518,7 +580,6 @@ def merge_songs():
             c.execute("DELETE FROM songs WHERE id=?", (source_song_id,))
         
         conn.commit()
-        conn.close()
         
         return jsonify({'success': True})
         
@@ -530,11 +591,10 @@ def merge_songs():
 @app.route('/api/delete_song/<int:song_id>', methods=['DELETE'])
 def delete_song(song_id):
     try:
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
         c.execute("DELETE FROM songs WHERE id=?", (song_id,))
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -549,7 +609,7 @@ def promote_phrase():
         if not phrase_id:
             return jsonify({'success': False, 'error': 'Missing phrase ID'})
         
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
         
         # For now, we'll just add a note to indicate it's been promoted
@@ -566,7 +626,6 @@ def promote_phrase():
                 c.execute("UPDATE songs SET notes=? WHERE id=?", (updated_notes, phrase_id))
                 conn.commit()
         
-        conn.close()
         return jsonify({'success': True})
         
     except Exception as e:
@@ -578,8 +637,7 @@ def promote_phrase():
 def get_inbox():
     """Get organized inbox content by sender and date"""
     try:
-        conn = sqlite3.connect('songs.db')
-        conn.row_factory = sqlite3.Row
+        conn = db.get_db()
         c = conn.cursor()
 
         # Get all inbox items organized by sender and date
@@ -600,7 +658,6 @@ def get_inbox():
 
             organized[sender][date].append(item)
 
-        conn.close()
         return jsonify({'inbox': organized})
 
     except Exception as e:
@@ -612,11 +669,10 @@ def get_inbox():
 def delete_inbox_item(item_id):
     """Delete an item from the inbox"""
     try:
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
         c.execute("DELETE FROM inbox WHERE id=?", (item_id,))
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
         print(f"Delete error: {e}")
@@ -624,46 +680,43 @@ def delete_inbox_item(item_id):
 
 @app.route('/api/refresh-url/<int:item_id>')
 def refresh_url(item_id):
-    """Generate a fresh signed URL for an S3 item"""
+    """Playable URL for one item (the listings and /api/play-urls already embed these)"""
     try:
-        conn = sqlite3.connect('songs.db')
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute("SELECT * FROM inbox WHERE id=?", (item_id,))
-        item = c.fetchone()
+        c = db.get_db().cursor()
+        c.execute(f"{INBOX_SELECT} WHERE id = ?", (item_id,))
+        row = c.fetchone()
+        if not row or not row[6]:
+            return jsonify({'success': False, 'error': 'Item not found'})
+        return jsonify({'success': True, 'url': inbox_item(row)['play_url']})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
-        if item and item['s3_url']:
-            try:
-                # Extract S3 key from the stored URL
-                import urllib.parse
-                parsed = urllib.parse.urlparse(item['s3_url'])
-
-                # Handle both old format and new signed URLs
-                if 'amazonaws.com' in parsed.netloc:
-                    # Extract key from path, removing leading slash
-                    s3_key = parsed.path.lstrip('/')
-
-                    # Remove bucket name if it's in the path (for old URLs)
-                    if s3_key.startswith(f"{AWS_BUCKET_NAME}/"):
-                        s3_key = s3_key[len(f"{AWS_BUCKET_NAME}/"):]
-                else:
-                    # If URL format is unexpected, try using content field as fallback
-                    s3_key = f"recordings/{datetime.now().strftime('%Y/%m/%d')}/unknown_file.wav"
-
-                # Generate new signed URL
-                new_url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': AWS_BUCKET_NAME, 'Key': s3_key},
-                    ExpiresIn=86400  # 24 hours
-                )
-            except Exception as parse_error:
-                print(f"URL parsing error: {parse_error}")
-                return jsonify({'success': False, 'error': f'Invalid URL format: {parse_error}'})
-
-            return jsonify({'success': True, 'url': new_url})
-
-        return jsonify({'success': False, 'error': 'Item not found'})
+# Most ids /api/play-urls signs in one call
+PLAY_URLS_MAX_IDS = 500
+# How often the page re-fetches its play URLs - well inside the time a signed URL has left when served
+PLAY_URL_REFRESH_SECONDS = storage.PRESIGN_REFRESH_SECONDS // 2
+
+@app.route('/api/play-urls', methods=['POST'])
+def play_urls():
+    """Fresh playable URLs for a page of items in one call: {"ids": [...]} -> {"urls": {id: url}}
 
+    The page calls this when its URLs are getting old instead of re-fetching
+    items one by one; refresh_after_seconds says when to ask again.
+    """
+    try:
+        ids = [int(item_id) for item_id in (request.json or {}).get('ids', [])][:PLAY_URLS_MAX_IDS]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'ids must be a list of item ids'}), 400
+    try:
+        c = db.get_db().cursor()
+        urls = {}
+        if ids:
+            c.execute(f"{INBOX_SELECT} WHERE id IN ({','.join('?' * len(ids))})", ids)
+            for row in c.fetchall():
+                item = inbox_item(row)
+                if item['play_url']:
+                    urls[item['id']] = {'url': item['play_url'], 'type': item['play_type']}
+        return jsonify({'success': True, 'urls': urls, 'refresh_after_seconds': PLAY_URL_REFRESH_SECONDS})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -672,7 +725,7 @@ def test_aws():
     """Test AWS S3 connection"""
     try:
         # Test S3 connection by listing bucket
-        response = s3_client.list_objects_v2(Bucket=AWS_BUCKET_NAME, MaxKeys=1)
+        response = storage.get_s3_client().list_objects_v2(Bucket=AWS_BUCKET_NAME, MaxKeys=1)
 
         return jsonify({
             'success': True,
@@ -690,8 +743,7 @@ def test_aws():
 @app.route('/api/debug_song/<int:song_id>')
 def debug_song(song_id):
     """Debug endpoint to see what's actually saved"""
-    conn = sqlite3.connect('songs.db')
-    conn.row_factory = sqlite3.Row
+    conn = db.get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM songs WHERE id=?", (song_id,))
     row = c.fetchone()
@@ -718,14 +770,6 @@ TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
 AWS_BUCKET_NAME = os.environ.get('AWS_BUCKET_NAME', 'ladyembertest1')
 
-# S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.environ.get('AWS_REGION', 'us-east-1')
-)
-
 
 @app.route('/twilio/voice', methods=['POST'])
 def handle_incoming_call():
@@ -789,30 +833,13 @@ def handle_incoming_call():
 
 @app.route('/twilio/recording', methods=['POST'])
 def handle_recording():
-    """Process completed recording and save to S3"""
+    """Record the completed call in the inbox and queue the S3 upload"""
     try:
-        # Clear any previous error
-        global last_download_error
-        last_download_error = None
-
-        # Always save a record first so we can see the webhook was called
         sender_name = detect_sender_name(request.values.get('From', ''))
         date_folder = datetime.now().strftime('%Y-%m-%d')
 
-        conn = sqlite3.connect('songs.db')
-        c = conn.cursor()
-        c.execute("""INSERT INTO inbox
-                     (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                  (sender_name, request.values.get('From', ''), 'voice',
-                   f"{sender_name} - Processing Recording", "Recording webhook received - processing...", None, date_folder))
-        webhook_record_id = c.lastrowid
-        conn.commit()
-        conn.close()
-
         recording_url = request.values.get('RecordingUrl', '')
         recording_sid = request.values.get('RecordingSid', '')
-        call_sid = request.values.get('CallSid', '')
         from_number = request.values.get('From', '')
         recording_duration = request.values.get('RecordingDuration', '0')
 
@@ -821,18 +848,15 @@ def handle_recording():
             print("⚠️  No recording URL - recording may have been too short or silent")
 
             # Still save a record in the inbox for tracking
-            sender_name = detect_sender_name(from_number)
-            date_folder = datetime.now().strftime('%Y-%m-%d')
             title = f"{sender_name} - No Recording ({datetime.now().strftime('%H:%M')})"
 
-            conn = sqlite3.connect('songs.db')
+            conn = db.get_db()
             c = conn.cursor()
             c.execute("""INSERT INTO inbox
                          (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
                          VALUES (?, ?, ?, ?, ?, ?, ?)""",
                       (sender_name, from_number, 'voice', title, f"Call received but no recording captured (duration: {recording_duration}s)", None, date_folder))
             conn.commit()
-            conn.close()
 
             # Return helpful TwiML
             helpful_response = '''<?xml version="1.0" encoding="UTF-8"?>
@@ -843,81 +867,18 @@ def handle_recording():
             return helpful_response, 200, {'Content-Type': 'application/xml'}
 
         elif recording_url and recording_sid:
-            print(f"✅ Both URL and SID exist - proceeding with upload")
-            filename = f"call_recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
-
-            # Upload to S3 - Add .wav extension to Twilio URL for proper download
-            if not recording_url.endswith('.wav'):
-                download_url = recording_url + '.wav'
-                print(f"📤 Using download URL: {download_url}")
-            else:
-                download_url = recording_url
-                print(f"📤 Using original URL: {download_url}")
-
-            print(f"📤 Attempting S3 upload...")
-            s3_url = upload_to_s3(download_url, filename)
-            print(f"📤 S3 upload result: {s3_url}")
-
-            if s3_url:
-                # Update the existing record with success info
-                title = f"{sender_name} - Voice {datetime.now().strftime('%H:%M')}"
-
-                conn = sqlite3.connect('songs.db')
-                c = conn.cursor()
-
-                c.execute("""UPDATE inbox
-                             SET title = ?, content = ?, s3_url = ?
-                             WHERE id = ?""",
-                          (title, f"Voice recording - {filename}", s3_url, webhook_record_id))
-
-                conn.commit()
-                conn.close()
-
-                print(f"🎤 Voice recording from {sender_name}: {filename} -> {s3_url}")
-
-                # Return confirmation TwiML
-                confirmation = '''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">Recording received and saved successfully! You can view it on the website. Goodbye.</Say>
-    <Hangup/>
-</Response>'''
-                return confirmation, 200, {'Content-Type': 'application/xml'}
-            else:
-                print("❌ S3 upload failed")
-
-                # Update record with failure info
-                conn = sqlite3.connect('songs.db')
-                c = conn.cursor()
+            record_id, job = queue_recording_ingest(sender_name, from_number, recording_url, recording_sid,
+                                                    "Recording webhook received - processing...")
+            print(f"✅ Recording {recording_sid} is job {job and job['id']} ({job and job['status']}) "
+                  f"for inbox record {record_id}")
 
-                # Include the actual error in the database
-                error_detail = f"S3 upload failed. Error: {last_download_error if last_download_error else 'Unknown error'}"
-
-                c.execute("""UPDATE inbox
-                             SET title = ?, content = ?
-                             WHERE id = ?""",
-                          (f"{sender_name} - Upload Failed", error_detail, webhook_record_id))
-                conn.commit()
-                conn.close()
-
-                # Get last error from database
-                error_to_speak = "Unknown error occurred"
-                try:
-                    conn = sqlite3.connect('songs.db')
-                    c = conn.cursor()
-                    c.execute("SELECT content FROM inbox WHERE id = 99999")
-                    result = c.fetchone()
-                    if result:
-                        error_to_speak = result[0]
-                    conn.close()
-                except:
-                    pass
-
-                error_response = f'''<?xml version="1.0" encoding="UTF-8"?>
+            # Return confirmation TwiML straight away - the upload happens in the background
+            confirmation = '''<?xml version="1.0" encoding="UTF-8"?>
 <Response>
-    <Say voice="alice">Sorry, upload failed. Error: {error_to_speak}. Goodbye.</Say>
+    <Say voice="alice">Recording received! It will appear on the website in a moment. Goodbye.</Say>
     <Hangup/>
 </Response>'''
-                return error_response, 200, {'Content-Type': 'application/xml'}
+            return confirmation, 200, {'Content-Type': 'application/xml'}
 
         else:
             # Case where there's a URL but no SID (unusual but possible)
@@ -943,11 +904,10 @@ def handle_recording():
 
 @app.route('/twilio/recording-status', methods=['POST'])
 def handle_recording_status():
-    """Handle recording status updates and process completed recordings"""
+    """Handle recording status updates and queue completed recordings for upload"""
     recording_sid = request.values.get('RecordingSid', '')
     status = request.values.get('RecordingStatus', '')
     recording_url = request.values.get('RecordingUrl', '')
-    call_sid = request.values.get('CallSid', '')
     from_number = request.values.get('From', '')
     recording_duration = request.values.get('RecordingDuration', '0')
 
@@ -957,83 +917,424 @@ def handle_recording_status():
 
     if status == 'completed' and recording_url and recording_sid:
         try:
-            # Get sender info
             sender_name = detect_sender_name(from_number)
-            date_folder = datetime.now().strftime('%Y-%m-%d')
+            record_id, job = queue_recording_ingest(sender_name, from_number, recording_url, recording_sid,
+                                                    "Recording status webhook received - processing...")
+            if not job:
+                return f"RECORDED: inbox record {record_id}", 200
+            print(f"✅ Inbox record {record_id} is job {job['id']} ({job['status']})")
+            return f"{job['status'].upper()}: job {job['id']}", 200
 
-            # Create database record first
-            conn = sqlite3.connect('songs.db')
-            c = conn.cursor()
-            c.execute("""INSERT INTO inbox
-                         (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                         VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                      (sender_name, from_number, 'voice',
-                       f"{sender_name} - Processing Recording", "Recording status webhook received - processing...", None, date_folder))
-            webhook_record_id = c.lastrowid
-            conn.commit()
-            conn.close()
+        except Exception as e:
+            print(f"❌ Recording status processing error: {e}")
+            traceback.print_exc()
+            return f"ERROR: {str(e)}", 200
 
-            print(f"✅ Created database record {webhook_record_id}")
+    return "OK", 200
 
-            # Generate filename
-            filename = f"call_recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
+def insert_once(c, insert_sql, params, existing_sql, key):
+    """Run an INSERT OR IGNORE guarded by a unique index.
+
+    Returns (id, True) for the new row, or (id, False) for the row that already holds `key`.
+    If that row is deleted before it can be read back, the insert is tried again.
+    """
+    for attempt in range(3):
+        c.execute(insert_sql, params)
+        if c.rowcount:
+            return c.lastrowid, True
+        c.execute(existing_sql, key)
+        row = c.fetchone()
+        if row:
+            return row[0], False
+    raise sqlite3.IntegrityError(f"Insert ignored but no existing row for {key}")
 
-            # Add .wav extension to Twilio URL for proper download
-            if not recording_url.endswith('.wav'):
-                download_url = recording_url + '.wav'
-                print(f"📤 Using download URL: {download_url}")
-            else:
-                download_url = recording_url
-                print(f"📤 Using original URL: {download_url}")
+def queue_recording_ingest(sender_name, from_number, recording_url, recording_sid, note):
+    """Insert the 'Processing Recording' inbox row and its upload job in one transaction.
 
-            print(f"📤 Attempting S3 upload...")
-            s3_url = upload_to_s3(download_url, filename)
-            print(f"📤 S3 upload result: {s3_url}")
+    Idempotent per RecordingSid: Twilio may call both /twilio/recording and
+    /twilio/recording-status for one recording, and the second call gets the
+    first call's row and job back instead of a duplicate download.
+    Returns (inbox id, job) - the job as a dict with at least id and status,
+    read straight from the jobs table, or None.
+    """
+    now = datetime.now()
+    date_folder = now.strftime('%Y-%m-%d')
 
-            if s3_url:
-                # Update the existing record with success info
-                title = f"{sender_name} - Voice {datetime.now().strftime('%H:%M')}"
+    # Add .wav extension to Twilio URL for proper download
+    download_url = recording_url if recording_url.endswith('.wav') else recording_url + '.wav'
 
-                conn = sqlite3.connect('songs.db')
-                c = conn.cursor()
+    conn = db.get_db()
+    c = conn.cursor()
+    # OR IGNORE + the unique recording_sid index settles two webhooks racing each other
+    record_id, inserted = insert_once(
+        c, """INSERT OR IGNORE INTO inbox
+              (sender_name, sender_phone, content_type, title, content, s3_url, date_folder, recording_sid)
+              VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (sender_name, from_number, 'voice', f"{sender_name} - Processing Recording", note, None, date_folder,
+         recording_sid),
+        "SELECT id FROM inbox WHERE recording_sid = ?", (recording_sid,))
+    if not inserted:
+        conn.rollback()
+        job = jobs.get_job_status(record_id, conn)
+        print(f"↩️  Recording {recording_sid} already queued as inbox record {record_id}")
+        ingest_events.record('already_queued', note, sid=recording_sid, job_id=job['id'] if job else None,
+                             inbox_id=record_id, source='twilio_recording')
+        return record_id, job
+    job_id = jobs.enqueue('twilio_recording', {
+        'download_url': download_url,
+        'recording_sid': recording_sid,
+        'filename': f"call_recording_{now.strftime('%Y%m%d_%H%M%S')}.wav",
+        'sender_name': sender_name,
+        'received_at': now.strftime('%H:%M'),
+    }, inbox_id=record_id, max_attempts=RECORDING_MAX_ATTEMPTS, conn=conn)
+    conn.commit()
+    ingest_events.record('queued', note, sid=recording_sid, job_id=job_id, inbox_id=record_id,
+                         source='twilio_recording')
+    return record_id, {'id': job_id, 'status': 'queued'}
+
+def queue_mms_ingest(sender_name, from_number, media_url, media_content_type, message_sid, media_index, body):
+    """Insert a 'Processing Voice Message' inbox row for one MMS audio attachment plus its upload job.
+
+    The download runs on the ingest workers like a call recording (404s retried with backoff),
+    so the webhook answers Twilio straight away. Idempotent per (MessageSid, attachment index):
+    a redelivered webhook gets the first delivery's row and job back.
+    Returns (inbox id, job id).
+    """
+    now = datetime.now()
+    file_extension = '.m4a' if 'mp4' in media_content_type else '.wav'
+    content = f"Voice message via MMS{' - ' + body if body else ''}"
+
+    conn = db.get_db()
+    c = conn.cursor()
+    # OR IGNORE + the unique (message_sid, message_part) index settles two deliveries racing each other
+    record_id, inserted = insert_once(
+        c, """INSERT OR IGNORE INTO inbox
+              (sender_name, sender_phone, content_type, title, content, s3_url, date_folder,
+               message_sid, message_part)
+              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (sender_name, from_number, 'voice', f"{sender_name} - Processing Voice Message",
+         content, None, now.strftime('%Y-%m-%d'), message_sid, media_index),
+        "SELECT id FROM inbox WHERE message_sid = ? AND message_part = ?", (message_sid, media_index))
+    if not inserted:
+        conn.rollback()
+        job = jobs.get_job_status(record_id, conn)
+        print(f"↩️  MMS {message_sid} attachment {media_index} already queued as inbox record {record_id}")
+        ingest_events.record('already_queued', f"Attachment {media_index}", sid=message_sid,
+                             job_id=job['id'] if job else None, inbox_id=record_id, source='twilio_mms')
+        return record_id, job['id'] if job else None
+    job_id = jobs.enqueue('twilio_mms', {
+        'download_url': media_url,
+        'message_sid': message_sid,
+        'filename': f"mms_audio_{now.strftime('%Y%m%d_%H%M%S')}{file_extension}",
+        'media_content_type': media_content_type,
+        'sender_name': sender_name,
+        'received_at': now.strftime('%H:%M'),
+        'title': f"{sender_name} - Voice Message {now.strftime('%H:%M')}",
+        'content': content,
+    }, inbox_id=record_id, max_attempts=RECORDING_MAX_ATTEMPTS, conn=conn)
+    conn.commit()
+    ingest_events.record('queued', f"{media_content_type} from {sender_name}", sid=message_sid,
+                         job_id=job_id, inbox_id=record_id, source='twilio_mms')
+    return record_id, job_id
+
+def recording_event(payload, job, event, message=None, level='info'):
+    """Log an ingest event for a recording or MMS job, keyed by its RecordingSid/MessageSid and job id"""
+    ingest_events.record(event, message, level, sid=payload.get('recording_sid') or payload.get('message_sid'),
+                         job_id=job['id'], inbox_id=job['inbox_id'], source=job['kind'])
+
+@jobs.register('twilio_recording')
+@jobs.register('twilio_mms')
+def process_recording_job(payload, job):
+    """Background worker: download a Twilio recording or MMS attachment, upload it to S3 and update the inbox row
+
+    The download is spooled to a temp file while it is hashed, so a recording that is
+    already in the inbox (same RecordingSid uploaded, or the same audio under another
+    sid) is recognised before anything is written to S3.
+    """
+    filename = payload['filename']
+    sid = payload.get('recording_sid') or payload.get('message_sid')
+    conn = db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT s3_url FROM inbox WHERE id = ?", (job['inbox_id'],))
+    row = c.fetchone()
+    if not row or row['s3_url']:
+        # A redelivered job for a recording that already landed (or whose row was deleted)
+        print(f"↩️  Recording {sid} already stored, nothing to do")
+        recording_event(payload, job, 'already_stored', row['s3_url'] if row else 'inbox row deleted')
+        return {'already_stored': True}
 
-                c.execute("""UPDATE inbox
-                             SET title = ?, content = ?, s3_url = ?
-                             WHERE id = ?""",
-                          (title, f"Voice recording - {filename}", s3_url, webhook_record_id))
+    print(f"📥 Job {job['id']} attempt {job['attempts']}: {payload['download_url']}")
+    try:
+        response = open_twilio_download(payload['download_url'])
+        with response:
+            spooled, size, content_hash = transfer.spool(response)
+    except urllib.error.HTTPError as http_error:
+        if http_error.code == 404:
+            # Recording not ready yet on Twilio's side - try again later without holding a thread
+            recording_event(payload, job, 'not_ready', f"Attempt {job['attempts']}: Twilio returned 404")
+            raise jobs.RetryLater("Recording not ready (404)")
+        recording_event(payload, job, 'attempt_failed', f"Attempt {job['attempts']}: {http_error}", 'error')
+        raise
+    except Exception as e:
+        recording_event(payload, job, 'attempt_failed',
+                        f"Attempt {job['attempts']}: {type(e).__name__}: {str(e)}", 'error')
+        raise
+
+    with spooled:
+        c.execute("SELECT id FROM inbox WHERE content_hash = ?", (content_hash,))
+        original = c.fetchone()
+        if original:
+            # Exactly this audio is already in the inbox - drop the placeholder row, upload nothing
+            c.execute("DELETE FROM inbox WHERE id = ?", (job['inbox_id'],))
+            conn.commit()
+            print(f"♊ Recording {sid} duplicates inbox record {original['id']}, skipped upload")
+            recording_event(payload, job, 'duplicate', f"Same audio as inbox record {original['id']}")
+            return {'bytes': size, 'content_hash': content_hash, 'duplicate_of': original['id']}
 
-                conn.commit()
-                conn.close()
+        try:
+            s3_url, stats = stream_recording_to_s3(spooled, filename,
+                                                   payload.get('media_content_type', 'audio/wav'))
+        except Exception as e:
+            recording_event(payload, job, 'attempt_failed',
+                            f"Attempt {job['attempts']}: {type(e).__name__}: {str(e)}", 'error')
+            raise
 
-                print(f"🎤 Voice recording from {sender_name}: {filename} -> {s3_url}")
-                return "SUCCESS: Recording uploaded to S3", 200
+    for retry in (True, False):
+        try:
+            c.execute("""UPDATE inbox
+                         SET title = ?, content = ?, s3_url = ?, content_hash = ?
+                         WHERE id = ?""",
+                      (payload.get('title') or f"{payload['sender_name']} - Voice {payload['received_at']}",
+                       payload.get('content') or f"Voice recording - {filename}",
+                       s3_url, stats['content_hash'], job['inbox_id']))
+            break
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            c.execute("SELECT id FROM inbox WHERE content_hash = ?", (stats['content_hash'],))
+            original = c.fetchone()
+            if original is None:
+                if retry:
+                    # The row we collided with was deleted meanwhile - ours is the only copy now
+                    continue
+                raise
+        # Another job stored the same audio while this one was uploading - drop our copy and placeholder row
+        original_id = original[0]
+        bucket, key = storage.parse_s3_url(s3_url)
+        storage.get_s3_client().delete_object(Bucket=bucket, Key=key)
+        c.execute("DELETE FROM inbox WHERE id = ?", (job['inbox_id'],))
+        conn.commit()
+        print(f"♊ Recording {sid} duplicates inbox record {original_id}, discarded")
+        recording_event(payload, job, 'duplicate', f"Same audio as inbox record {original_id}")
+        return {**stats, 'duplicate_of': original_id}
+    conn.commit()
+    recording_event(payload, job, 'uploaded', f"{stats['bytes']} bytes -> {s3_url}")
 
-            else:
-                # Upload failed - update record with error
-                conn = sqlite3.connect('songs.db')
-                c = conn.cursor()
+    print(f"🎤 Voice recording from {payload['sender_name']}: {filename} -> {s3_url}")
+    return stats
 
-                # Get the last error
-                error_msg = last_download_error if last_download_error else "Upload failed - unknown error"
+def _recording_job_failed(payload, job, error_msg):
+    """Mark the inbox row as failed once a recording job runs out of attempts"""
+    conn = db.get_db()
+    c = conn.cursor()
+    c.execute("""UPDATE inbox
+                 SET title = ?, content = ?
+                 WHERE id = ?""",
+              (f"{payload['sender_name']} - Upload Failed", f"S3 upload failed. Error: {error_msg}", job['inbox_id']))
+    conn.commit()
+    recording_event(payload, job, 'failed', f"Gave up after {job['attempts']} attempts: {error_msg}", 'error')
 
-                c.execute("""UPDATE inbox
-                             SET title = ?, content = ?
-                             WHERE id = ?""",
-                          (f"{sender_name} - Upload Failed", f"S3 upload failed. Error: {error_msg}", webhook_record_id))
+process_recording_job.on_failure = _recording_job_failed
 
-                conn.commit()
-                conn.close()
+# Waveform peaks (queued by the inbox_waveform_* triggers in migrations.py)
+WAVEFORM_WIDTH_DEFAULT = 100
+WAVEFORM_WIDTH_MAX = 2000
 
-                print(f"❌ S3 upload failed for {sender_name}: {error_msg}")
-                return f"FAILED: Upload error - {error_msg}", 200
+@jobs.register('waveform')
+def process_waveform_job(payload, job):
+    """Background worker: decode an inbox item's audio once and store its peak pyramid (on the DSP pool)"""
+    inbox_id = payload['inbox_id']
+    c = db.get_db().cursor()
+    c.execute("SELECT s3_url FROM inbox WHERE id = ?", (inbox_id,))
+    row = c.fetchone()
+    if not row or not row[0]:
+        return {'skipped': 'no audio'}
 
-        except Exception as e:
-            print(f"❌ Recording status processing error: {e}")
-            import traceback
-            traceback.print_exc()
-            return f"ERROR: {str(e)}", 200
+    try:
+        return dsp.call('waveform', audio_tasks.store_waveform, inbox_id=inbox_id, audio_url=row[0])
+    except dsp.QueueFull as e:
+        raise jobs.RetryLater(str(e), delay=e.retry_after)
+
+@jobs.register('rendition')
+def process_rendition_job(payload, job):
+    """Background worker: transcode an inbox item's audio to a compact playback rendition next to the original"""
+    inbox_id = payload['inbox_id']
+    conn = db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT s3_url FROM inbox WHERE id = ?", (inbox_id,))
+    row = c.fetchone()
+    location = storage.parse_s3_url(row[0]) if row and row[0] else None
+    if not location:
+        return {'skipped': 'audio not in S3'}
+    bucket, original_key = location
+
+    path = audio_tasks.fetch_audio(row[0])
+    original_bytes = os.path.getsize(path)
+    original_duration = audio_tasks.probe_duration(path)
+    rendition_path, content_type, extension = audio_tasks.transcode_rendition(path)
+    try:
+        rendition_bytes = os.path.getsize(rendition_path)
+        rendition_duration = audio_tasks.probe_duration(rendition_path)
+        rendition_key = None
+        # Already-compact uploads (MMS m4a, small mp3s) keep playing the original
+        if rendition_bytes < original_bytes:
+            rendition_key = f"renditions/{os.path.splitext(original_key)[0]}{extension}"
+            transfer.upload_path_to_s3(storage.get_s3_client(), rendition_path, bucket, rendition_key,
+                                       content_type)
+    finally:
+        os.unlink(rendition_path)
+
+    c.execute("""INSERT OR REPLACE INTO renditions
+                 (inbox_id, original_key, original_bytes, original_duration,
+                  rendition_key, content_type, rendition_bytes, rendition_duration)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+              (inbox_id, original_key, original_bytes, original_duration,
+               rendition_key, content_type if rendition_key else None,
+               rendition_bytes if rendition_key else None, rendition_duration if rendition_key else None))
+    conn.commit()
+    print(f"🎧 Rendition for inbox {inbox_id}: {original_bytes} -> {rendition_bytes} bytes")
+    return {'original_bytes': original_bytes, 'rendition_bytes': rendition_bytes, 'rendition_key': rendition_key}
+
+@jobs.register('transpose_prerender')
+def process_transpose_prerender_job(payload, job):
+    """Background worker: render +/- TRANSPOSE_PRERENDER_SEMITONES shifts of a new voice note ahead of use.
+
+    The pitch shifts run on the DSP pool one at a time, so pre-renders never
+    take more than one pool process from interactive requests.
+    """
+    span = audio_tasks.TRANSPOSE_PRERENDER_SEMITONES
+    if not span:
+        return {'skipped': 'pre-render disabled'}
+    inbox_id = payload['inbox_id']
+    c = db.get_db().cursor()
+    c.execute("SELECT s3_url FROM inbox WHERE id = ?", (inbox_id,))
+    row = c.fetchone()
+    if not row or not row[0]:
+        return {'skipped': 'no audio'}
 
-    return "OK", 200
+    rendered = []
+    for semitones in range(-span, span + 1):
+        if semitones == 0:
+            continue
+        try:
+            if dsp.call('transpose_prerender', audio_tasks.prerender_transposition,
+                        audio_url=row[0], semitones=semitones):
+                rendered.append(semitones)
+        except dsp.QueueFull as e:
+            # Interactive work has the pool - finish the rest later (done shifts are cached and skipped)
+            raise jobs.RetryLater(str(e), delay=e.retry_after * 6)
+        jobs.heartbeat(job['id'])
+    return {'rendered': rendered}
+
+@app.route('/api/renditions/backfill', methods=['POST'])
+def backfill_renditions():
+    """Queue rendition jobs for voice items ingested before renditions existed (?limit=, default 100)"""
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        conn = db.get_db()
+        c = conn.cursor()
+        c.execute("""SELECT id FROM inbox
+                     WHERE content_type = 'voice' AND s3_url IS NOT NULL
+                       AND id NOT IN (SELECT inbox_id FROM renditions)
+                       AND '{"inbox_id": ' || id || '}' NOT IN (
+                           SELECT payload FROM jobs WHERE kind = 'rendition' AND status IN ('queued', 'running'))
+                     ORDER BY id DESC LIMIT ?""", (limit,))
+        ids = [row[0] for row in c.fetchall()]
+        for inbox_id in ids:
+            jobs.enqueue('rendition', {'inbox_id': inbox_id}, max_attempts=3, conn=conn)
+        conn.commit()
+        return jsonify({'success': True, 'queued': len(ids)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def queue_waveform(inbox_id, retry=False):
+    """Waveform job state for an item that has no peaks yet, queueing a job if it never had one
+    (backfills items ingested earlier). A job that failed after its attempts, or finished without
+    peaks, is only queued again when retry is set - polling a bad file mustn't retry it forever."""
+    conn = db.get_db()
+    job = jobs.latest_for_payload('waveform', {'inbox_id': inbox_id}, conn)
+    if job and (job['status'] in ('queued', 'running') or not retry):
+        return job
+    job_id = jobs.enqueue('waveform', {'inbox_id': inbox_id}, max_attempts=3, conn=conn)
+    conn.commit()
+    return {'id': job_id, 'status': 'queued', 'attempts': 0, 'max_attempts': 3, 'last_error': None}
+
+def resample_peaks(mins, maxs, width):
+    """Merge min/max pairs down to `width` buckets (never up - short clips return what they have)"""
+    count = len(mins)
+    if count <= width:
+        return list(mins), list(maxs)
+    out_min, out_max = [], []
+    for i in range(width):
+        start, end = i * count // width, (i + 1) * count // width
+        out_min.append(min(mins[start:end]))
+        out_max.append(max(maxs[start:end]))
+    return out_min, out_max
+
+@app.route('/api/waveform/<int:item_id>', methods=['GET'])
+def api_waveform(item_id):
+    """Peaks for drawing an inbox item's waveform at ?width= buckets (int8 min/max, -127..127)"""
+    from array import array
+    try:
+        width = request.args.get('width', WAVEFORM_WIDTH_DEFAULT, type=int) or WAVEFORM_WIDTH_DEFAULT
+        width = max(1, min(width, WAVEFORM_WIDTH_MAX))
+
+        conn = db.get_db()
+        c = conn.cursor()
+        c.execute("SELECT duration, levels, peaks, created_at FROM waveforms WHERE inbox_id = ?", (item_id,))
+        row = c.fetchone()
+        if not row:
+            job = queue_waveform(item_id)
+            if job['status'] in ('queued', 'running'):
+                return jsonify({'success': True, 'status': 'pending'}), 202
+            # 'failed' (or 'unavailable' when the job found no audio) until POST /api/waveform/<id>/retry
+            return jsonify({'success': True, 'status': 'failed' if job['status'] == 'failed' else 'unavailable',
+                            'error': job['last_error'], 'attempts': job['attempts'],
+                            'retry_url': f'/api/waveform/{item_id}/retry'})
+
+        etag = f'"waveform-{item_id}-{row[3]}-{width}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = app.response_class(status=304)
+        else:
+            levels = json.loads(row[1])
+            # Coarsest level that still has at least `width` peaks, else the finest there is
+            level = next((lv for lv in reversed(levels) if lv[1] >= width), levels[0] if levels else None)
+            mins, maxs = [], []
+            if level:
+                samples_per_peak, count, offset = level
+                pairs = array('b', row[2][offset:offset + count * 2])
+                mins, maxs = resample_peaks(pairs[0::2], pairs[1::2], width)
+            response = jsonify({
+                'success': True,
+                'status': 'ready',
+                'duration': row[0],
+                'width': len(mins),
+                'min': mins,
+                'max': maxs
+            })
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/waveform/<int:item_id>/retry', methods=['POST'])
+def retry_waveform(item_id):
+    """Queue a fresh waveform job for an item whose last one failed"""
+    try:
+        job = queue_waveform(item_id, retry=True)
+        return jsonify({'success': True, 'job': job}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/twilio/sms', methods=['POST'])
 def handle_sms():
@@ -1041,6 +1342,7 @@ def handle_sms():
     from_number = request.values.get('From', '')
     body = request.values.get('Body', '')
     num_media = int(request.values.get('NumMedia', 0))
+    message_sid = request.values.get('MessageSid') or None
 
     sender_name = detect_sender_name(from_number)
     print(f"📱 SMS/MMS from {sender_name}: {body} (Media: {num_media})")
@@ -1054,166 +1356,69 @@ def handle_sms():
             # Check if it's an audio file
             if media_content_type and media_content_type.startswith('audio/'):
                 try:
-                    file_extension = '.m4a' if 'mp4' in media_content_type else '.wav'
-                    filename = f"mms_audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}{file_extension}"
-
-                    s3_url = upload_to_s3(media_url, filename)
-
-                    if s3_url:
-                        conn = sqlite3.connect('songs.db')
-                        c = conn.cursor()
-                        c.execute("""INSERT INTO inbox
-                                     (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                                     VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                  (sender_name, from_number, 'voice',
-                                   f"{sender_name} - Voice Message {datetime.now().strftime('%H:%M')}",
-                                   f"Voice message via MMS{' - ' + body if body else ''}",
-                                   s3_url, datetime.now().strftime('%Y-%m-%d')))
-                        conn.commit()
-                        conn.close()
-                        print(f"🎤 Voice message from {sender_name}: {filename}")
+                    record_id, job_id = queue_mms_ingest(sender_name, from_number, media_url,
+                                                         media_content_type, message_sid, i, body)
+                    print(f"🎤 Voice message from {sender_name} queued: inbox record {record_id}, job {job_id}")
                 except Exception as e:
                     print(f"❌ MMS audio error: {e}")
 
-    # Handle text part if present
+    # Handle text part if present - stored as message part -1 (media parts are 0..n) so a redelivery is ignored
     if body:
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
-        c.execute("""INSERT INTO inbox
-                     (sender_name, sender_phone, content_type, title, content, date_folder)
-                     VALUES (?, ?, ?, ?, ?, ?)""",
+        c.execute("""INSERT OR IGNORE INTO inbox
+                     (sender_name, sender_phone, content_type, title, content, date_folder,
+                      message_sid, message_part)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
                   (sender_name, from_number, 'text',
                    f"{sender_name} - Text {datetime.now().strftime('%H:%M')}",
-                   body, datetime.now().strftime('%Y-%m-%d')))
+                   body, datetime.now().strftime('%Y-%m-%d'), message_sid, -1))
         conn.commit()
-        conn.close()
 
     return "OK", 200
 
+def submit_dsp(kind, func, **kwargs):
+    """Queue func on the DSP process pool: 202 with a task to poll, or 429 when the pool is saturated"""
+    try:
+        task_id = dsp.submit(kind, func, **kwargs)
+    except dsp.QueueFull as e:
+        response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'status': 'queued',
+        'status_url': f'/api/dsp/{task_id}'
+    }), 202
+
 @app.route('/api/analyze-audio', methods=['POST'])
 def analyze_audio():
-    """Analyze audio for pitch, key detection, and frequency content (Melodyne-style)"""
-    try:
-        import numpy as np
-        import scipy.signal
-        import librosa
-        import tempfile
-        import requests
+    """Analyze audio for pitch, key detection, and frequency content (Melodyne-style)
 
+    Cached S3 analyses are answered directly; anything else is queued on the DSP pool (poll /api/dsp/<task_id>).
+    """
+    try:
         data = request.json
         audio_url = data.get('audio_url')
         analysis_type = data.get('analysis_type', 'full')  # 'pitch', 'key', 'full'
+        pitch_format = data.get('pitch_format', 'points')  # 'points' (list of dicts) or 'columns' (parallel arrays)
 
         if not audio_url:
             return jsonify({'success': False, 'error': 'No audio URL provided'}), 400
 
-        # Download audio file to temporary location
-        response = requests.get(audio_url, timeout=30)
-        if response.status_code != 200:
-            return jsonify({'success': False, 'error': 'Failed to download audio'}), 400
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-            temp_file.write(response.content)
-            temp_path = temp_file.name
-
-        try:
-            # Load audio with librosa (handles various formats)
-            y, sr = librosa.load(temp_path)
-
-            results = {}
-
-            # Pitch tracking (fundamental frequency over time)
-            if analysis_type in ['pitch', 'full']:
-                pitches, magnitudes = librosa.piptrack(y=y, sr=sr, threshold=0.1)
-
-                # Extract fundamental frequency over time
-                pitch_track = []
-                times = librosa.frames_to_time(np.arange(pitches.shape[1]), sr=sr)
-
-                for t in range(pitches.shape[1]):
-                    index = magnitudes[:, t].argmax()
-                    pitch = pitches[index, t]
-
-                    if pitch > 0:
-                        # Convert Hz to MIDI note
-                        midi_note = librosa.hz_to_midi(pitch)
-                        note_name = librosa.midi_to_note(midi_note)
-                        pitch_track.append({
-                            'time': float(times[t]),
-                            'frequency': float(pitch),
-                            'midi_note': float(midi_note),
-                            'note_name': note_name,
-                            'confidence': float(magnitudes[index, t])
-                        })
-
-                results['pitch_track'] = pitch_track
-
-            # Key detection
-            if analysis_type in ['key', 'full']:
-                # Use chroma features for key detection
-                chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-                chroma_mean = np.mean(chroma, axis=1)
-
-                # Simple key detection using chroma vector correlation
-                key_profiles = {
-                    'C': [1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1],
-                    'C#': [1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0],
-                    'D': [0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1],
-                    'D#': [1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0],
-                    'E': [0, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1],
-                    'F': [1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0],
-                    'F#': [0, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1],
-                    'G': [1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1],
-                    'G#': [1, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0],
-                    'A': [0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1],
-                    'A#': [1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 0],
-                    'B': [0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1]
-                }
-
-                correlations = {}
-                for key, profile in key_profiles.items():
-                    correlation = np.corrcoef(chroma_mean, profile)[0, 1]
-                    correlations[key] = float(correlation) if not np.isnan(correlation) else 0
-
-                detected_key = max(correlations, key=correlations.get)
-                key_confidence = correlations[detected_key]
-
-                results['key_detection'] = {
-                    'detected_key': detected_key,
-                    'confidence': key_confidence,
-                    'all_correlations': correlations
-                }
-
-            # Spectral analysis
-            if analysis_type in ['spectral', 'full']:
-                # Get spectral features
-                spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-                spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-                mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-
-                results['spectral_analysis'] = {
-                    'spectral_centroid_mean': float(np.mean(spectral_centroids)),
-                    'spectral_rolloff_mean': float(np.mean(spectral_rolloff)),
-                    'mfcc_features': mfccs.tolist(),
-                    'tempo': float(librosa.beat.tempo(y=y, sr=sr)[0]),
-                    'duration': float(len(y) / sr)
-                }
-
-            # Clean up temp file
-            import os
-            os.unlink(temp_path)
-
-            return jsonify({
-                'success': True,
-                'analysis_results': results,
-                'sample_rate': sr,
-                'duration': float(len(y) / sr)
-            })
+        # S3 audio is identified by its ETag, so a repeat analysis needs no download and no pool slot
+        fingerprint = analysis_cache.s3_fingerprint(audio_url)
+        if fingerprint:
+            cache_key = analysis_cache.cache_key(fingerprint, analysis_type, audio_tasks.ANALYSIS_PARAMS)
+            cached = analysis_cache.get(cache_key)
+            if cached:
+                return jsonify({'success': True, 'cached': True,
+                                **audio_tasks.format_analysis(cached, pitch_format)})
 
-        except Exception as analysis_error:
-            import os
-            os.unlink(temp_path)
-            raise analysis_error
+        return submit_dsp('analyze', audio_tasks.analyze, audio_url=audio_url,
+                          analysis_type=analysis_type, pitch_format=pitch_format)
 
     except Exception as e:
         print(f"❌ Audio analysis error: {e}")
@@ -1224,15 +1429,34 @@ def analyze_audio():
             'error': str(e)
         }), 500
 
+@app.route('/api/dsp/<int:task_id>', methods=['GET'])
+def dsp_task_status(task_id):
+    """Poll a DSP task - once status is 'done', `result` holds the original endpoint's response body"""
+    try:
+        task = dsp.get_task(task_id)
+        if not task:
+            return jsonify({'success': False, 'error': 'Task not found'}), 404
+        return jsonify({'success': True, 'task': task, 'pool': dsp.pool_status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and sizes of the server-side caches"""
+    try:
+        caches = analysis_cache.stats()
+        caches.setdefault('audio', {'hits': 0, 'misses': 0, 'hit_rate': None}).update(audio_cache.usage())
+        caches.setdefault('pcm', {'hits': 0, 'misses': 0, 'hit_rate': None}).update(pcm_cache.usage())
+        for kind, usage in render_cache.usage().items():
+            caches.setdefault(kind, {'hits': 0, 'misses': 0, 'hit_rate': None}).update(usage)
+        return jsonify({'success': True, 'caches': caches})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/transpose-audio', methods=['POST'])
 def transpose_audio():
-    """Transpose audio to a different key (pitch shifting)"""
+    """Transpose audio to a different key (pitch shifting) - queued on the DSP pool"""
     try:
-        import librosa
-        import soundfile as sf
-        import tempfile
-        import requests
-
         data = request.json
         audio_url = data.get('audio_url')
         semitones = float(data.get('semitones', 0))  # Number of semitones to transpose
@@ -1240,71 +1464,14 @@ def transpose_audio():
         if not audio_url:
             return jsonify({'success': False, 'error': 'No audio URL provided'}), 400
 
-        # Download original audio
-        response = requests.get(audio_url, timeout=30)
-        if response.status_code != 200:
-            return jsonify({'success': False, 'error': 'Failed to download audio'}), 400
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_input:
-            temp_input.write(response.content)
-            input_path = temp_input.name
-
-        # Load audio
-        y, sr = librosa.load(input_path)
-
-        # Apply pitch shifting
-        y_shifted = librosa.effects.pitch_shift(y, sr=sr, n_steps=semitones)
-
-        # Save transposed audio to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_output:
-            output_path = temp_output.name
-
-        sf.write(output_path, y_shifted, sr)
+        # Renders are keyed by the source's ETag, so a repeat shift of S3 audio is answered without the pool
+        fingerprint = analysis_cache.s3_fingerprint(audio_url)
+        if fingerprint:
+            cached = audio_tasks.cached_transposition(fingerprint, semitones)
+            if cached:
+                return jsonify(cached)
 
-        # Upload transposed audio to S3
-        with open(output_path, 'rb') as f:
-            transposed_data = f.read()
-
-        from datetime import datetime
-        filename = f"transposed_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{semitones}st.wav"
-
-        # Upload to S3 using existing infrastructure
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.environ.get('AWS_REGION', 'us-east-1')
-        )
-
-        aws_bucket = os.environ.get('AWS_BUCKET_NAME')
-        date_folder = datetime.now().strftime('%Y-%m-%d')
-        s3_key = f"recordings/{date_folder}/transposed_{filename}"
-
-        s3_client.put_object(
-            Bucket=aws_bucket,
-            Key=s3_key,
-            Body=transposed_data,
-            ContentType='audio/wav'
-        )
-
-        # Generate signed URL
-        signed_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': aws_bucket, 'Key': s3_key},
-            ExpiresIn=3600
-        )
-
-        # Clean up temp files
-        import os
-        os.unlink(input_path)
-        os.unlink(output_path)
-
-        return jsonify({
-            'success': True,
-            'transposed_url': signed_url,
-            'original_semitones': semitones,
-            'filename': filename
-        })
+        return submit_dsp('transpose', audio_tasks.transpose, audio_url=audio_url, semitones=semitones)
 
     except Exception as e:
         print(f"❌ Audio transpose error: {e}")
@@ -1317,125 +1484,64 @@ def transpose_audio():
 
 @app.route('/import/s3-zip', methods=['POST'])
 def import_s3_zip():
-    """Import audio files from S3 zip archive"""
+    """Import audio files from an S3 zip archive - runs as a background job (poll status_url)"""
     try:
-        import zipfile
-        import tempfile
-        import os
-        from datetime import datetime
-
-        # Get S3 zip file path from request
-        zip_key = request.json.get('zip_key', 'your-zip-file.zip')
-
-        print(f"📦 Starting S3 zip import: {zip_key}")
-
-        # Download zip from S3
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.environ.get('AWS_REGION', 'us-east-1')
-        )
-
-        aws_bucket = os.environ.get('AWS_BUCKET_NAME')
-
-        # Download zip to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_zip:
-            print(f"📥 Downloading {zip_key} from S3 bucket {aws_bucket}...")
-            try:
-                s3_client.download_fileobj(aws_bucket, zip_key, temp_zip)
-                print(f"✅ Successfully downloaded {zip_key}")
-            except ClientError as e:
-                error_code = e.response['Error']['Code']
-                if error_code == 'NoSuchKey':
-                    return jsonify({
-                        'success': False,
-                        'error': f'File not found in S3: {zip_key}',
-                        'available_files': 'Use /api/debug-aws to check bucket contents'
-                    })
-                elif error_code == 'NoSuchBucket':
-                    return jsonify({
-                        'success': False,
-                        'error': f'Bucket not found: {aws_bucket}',
-                        'debug': 'Check AWS credentials and bucket name'
-                    })
-                else:
-                    raise e
-            temp_zip_path = temp_zip.name
-
-        imported_count = 0
-        skipped_count = 0
-
-        # Extract and process audio files
-        with zipfile.ZipFile(temp_zip_path, 'r') as zip_ref:
-            for file_info in zip_ref.filelist:
-                if not file_info.filename.lower().endswith(('.mp3', '.wav', '.m4a', '.flac', '.ogg')):
-                    continue
-
-                try:
-                    # Extract file to temporary location
-                    with zip_ref.open(file_info) as zip_file:
-                        audio_data = zip_file.read()
-
-                    # Generate new filename and S3 key
-                    original_name = os.path.basename(file_info.filename)
-                    date_folder = datetime.now().strftime('%Y-%m-%d')
-                    s3_key = f"recordings/{date_folder}/imported_{original_name}"
-
-                    # Upload to S3
-                    s3_client.put_object(
-                        Bucket=aws_bucket,
-                        Key=s3_key,
-                        Body=audio_data,
-                        ContentType='audio/mpeg' if original_name.lower().endswith('.mp3') else 'audio/wav'
-                    )
-
-                    # Generate signed URL
-                    signed_url = s3_client.generate_presigned_url(
-                        'get_object',
-                        Params={'Bucket': aws_bucket, 'Key': s3_key},
-                        ExpiresIn=3600
-                    )
-
-                    # Create database record
-                    conn = sqlite3.connect('songs.db')
-                    c = conn.cursor()
-                    c.execute("""INSERT INTO inbox
-                                 (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                                 VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                              ('Lady Ember', 'IMPORTED', 'voice',
-                               f"Imported: {original_name}",
-                               f"Imported from zip archive - {original_name}",
-                               signed_url, date_folder))
-                    conn.commit()
-                    conn.close()
-
-                    imported_count += 1
-                    print(f"✅ Imported: {original_name}")
-
-                except Exception as e:
-                    print(f"❌ Failed to import {file_info.filename}: {e}")
-                    skipped_count += 1
-                    continue
-
-        # Clean up temp file
-        os.unlink(temp_zip_path)
+        zip_key = (request.json or {}).get('zip_key')
+        if not zip_key:
+            return jsonify({'success': False, 'error': 'No zip_key provided'}), 400
 
+        import_id = zip_import.create(zip_key)
+        print(f"📦 Queued S3 zip import {import_id}: {zip_key}")
         return jsonify({
             'success': True,
-            'imported_count': imported_count,
-            'skipped_count': skipped_count,
-            'message': f'Successfully imported {imported_count} audio files'
-        })
-
+            'import_id': import_id,
+            'status': 'queued',
+            'status_url': f'/import/s3-zip/{import_id}'
+        }), 202
     except Exception as e:
         print(f"❌ S3 zip import error: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/import/s3-zip/<int:import_id>', methods=['GET'])
+def zip_import_status(import_id):
+    """Progress of a zip import: status, per-status file counts and the files that failed"""
+    try:
+        progress = zip_import.progress(import_id)
+        if not progress:
+            return jsonify({'success': False, 'error': 'Import not found'}), 404
+        return jsonify({'success': True, 'import': progress})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/import/s3-zip/<int:import_id>/retry', methods=['POST'])
+def retry_zip_import(import_id):
+    """Re-run an import; files that already made it in are skipped"""
+    try:
+        conn = db.get_db()
+        c = conn.cursor()
+        c.execute("SELECT status FROM zip_imports WHERE id = ?", (import_id,))
+        row = c.fetchone()
+        if not row:
+            return jsonify({'success': False, 'error': 'Import not found'}), 404
+        if row[0] in ('queued', 'running'):
+            return jsonify({'success': False, 'error': f'Import is already {row[0]}'}), 409
+        zip_import.queue(import_id, conn)
+        conn.commit()
+        return jsonify({'success': True, 'import_id': import_id, 'status_url': f'/import/s3-zip/{import_id}'}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@jobs.register('zip_import')
+def process_zip_import_job(payload, job):
+    """Background worker: bulk-import a zip archive's audio (see zip_import.py)"""
+    try:
+        return zip_import.run(payload['import_id'], job['id'])
+    except zip_import.ArchiveMissing as e:
+        # Retrying won't make the archive appear
+        zip_import.failed(payload['import_id'], str(e))
+        return {'status': 'failed', 'error': str(e)}
+
+process_zip_import_job.on_failure = lambda payload, job, error_msg: zip_import.failed(payload['import_id'], error_msg)
 
 @app.route('/test/version', methods=['GET'])
 def test_version():
@@ -1446,6 +1552,26 @@ def test_version():
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')
     })
 
+@app.route('/test/query-plans', methods=['GET'])
+def test_query_plans():
+    """EXPLAIN QUERY PLAN for each hot query (queries.hot_queries) - fails if any does a full scan or a sort"""
+    try:
+        conn = db.get_db()
+        results = {name: migrations.explain(conn, sql, params)
+                   for name, (sql, params) in queries.hot_queries().items()}
+        failing = [name for name, result in results.items() if not result['uses_index']]
+        return jsonify({
+            'success': not failing,
+            'schema_version': migrations.current_version(conn),
+            'failing': failing,
+            'queries': results
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
 @app.route('/test/upload', methods=['GET'])
 def test_upload():
     """Test S3 upload with a dummy file"""
@@ -1454,25 +1580,14 @@ def test_upload():
         test_content = b"Test recording file"
         filename = f"test_recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
 
-        # Get AWS credentials
-        aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-        aws_bucket = os.environ.get('AWS_BUCKET_NAME')
-        aws_region = os.environ.get('AWS_REGION', 'us-east-1')
-
-        if not all([aws_access_key, aws_secret_key, aws_bucket]):
+        if not storage.has_credentials():
             return jsonify({
                 'success': False,
                 'error': 'Missing AWS credentials'
             })
 
-        # Create S3 client
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=aws_region
-        )
+        s3_client = storage.get_s3_client()
+        aws_bucket = storage.bucket_name()
 
         # Create S3 key with folder structure
         date_folder = datetime.now().strftime('%Y-%m-%d')
@@ -1486,12 +1601,7 @@ def test_upload():
             ContentType='text/plain'
         )
 
-        # Generate signed URL
-        signed_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': aws_bucket, 'Key': s3_key},
-            ExpiresIn=3600
-        )
+        signed_url = storage.presign(aws_bucket, s3_key)
 
         return jsonify({
             'success': True,
@@ -1518,22 +1628,24 @@ def test_full_upload():
         test_recording_url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Recordings/{recording_sid}"
 
         # Test the actual upload_to_s3 function
-        result = upload_to_s3(test_recording_url, f"test_upload_{datetime.now().strftime('%H%M%S')}.wav")
-
-        if result:
-            return jsonify({
-                'success': True,
-                'message': 'Full upload successful',
-                's3_url': result,
-                'url_tested': test_recording_url
-            })
-        else:
+        try:
+            result = upload_to_s3(test_recording_url, f"test_upload_{datetime.now().strftime('%H%M%S')}.wav",
+                                  sid=recording_sid, source='test')
+        except Exception as e:
             return jsonify({
                 'success': False,
-                'error': last_download_error if last_download_error else 'No error captured',
-                'url_tested': test_recording_url
+                'error': f"{type(e).__name__}: {str(e)}",
+                'url_tested': test_recording_url,
+                'events': ingest_events.history(sid=recording_sid)
             })
 
+        return jsonify({
+            'success': True,
+            'message': 'Full upload successful',
+            's3_url': result,
+            'url_tested': test_recording_url
+        })
+
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1545,30 +1657,21 @@ def test_full_upload():
 def test_aws_connection():
     """Test endpoint to verify AWS S3 connection"""
     try:
-        aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-        aws_bucket = os.environ.get('AWS_BUCKET_NAME')
-        aws_region = os.environ.get('AWS_REGION', 'us-east-1')
+        settings = storage.aws_settings()
+        aws_bucket = settings['bucket']
+        aws_region = settings['region']
 
-        if not all([aws_access_key, aws_secret_key, aws_bucket]):
+        if not storage.has_credentials():
             return jsonify({
                 'success': False,
                 'error': 'Missing AWS credentials',
-                'has_access_key': bool(aws_access_key),
-                'has_secret_key': bool(aws_secret_key),
+                'has_access_key': bool(settings['access_key']),
+                'has_secret_key': bool(settings['secret_key']),
                 'has_bucket': bool(aws_bucket)
             })
 
-        # Test S3 connection
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=aws_region
-        )
-
         # Try to list bucket (this tests basic connectivity)
-        response = s3_client.head_bucket(Bucket=aws_bucket)
+        response = storage.get_s3_client().head_bucket(Bucket=aws_bucket)
 
         return jsonify({
             'success': True,
@@ -1656,172 +1759,82 @@ def handle_menu():
 
 
 
-def upload_to_s3(file_url, filename):
-    """Upload a file from URL to S3 bucket with proper authentication"""
-    global last_download_error
-    try:
-        # Get AWS credentials from environment
-        aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-        aws_bucket = os.environ.get('AWS_BUCKET_NAME')
-        aws_region = os.environ.get('AWS_REGION', 'us-east-1')
+def open_twilio_download(file_url):
+    """Open an authenticated streaming download from Twilio (single attempt, raises on error)"""
+    import urllib.request
+    import ssl
 
-        if not all([aws_access_key, aws_secret_key, aws_bucket]):
-            error_msg = "Missing AWS credentials"
-            print(f"❌ {error_msg}")
-            last_download_error = error_msg
-            return None
-
-        # Create S3 client
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=aws_region
-        )
+    twilio_account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+    twilio_auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
 
-        print(f"📥 Attempting to download from Twilio: {file_url}")
+    if not all([twilio_account_sid, twilio_auth_token]):
+        raise RuntimeError("Missing Twilio credentials")
 
-        # Download file from Twilio with authentication
-        import urllib.request
-        import urllib.parse
-        import ssl
+    # Create authentication handler for Twilio
+    ssl_context = ssl.create_default_context()
+    password_mgr = urllib.request.HTTPPasswordMgrWithDefaultRealm()
+    password_mgr.add_password(None, "https://api.twilio.com", twilio_account_sid, twilio_auth_token)
+    auth_handler = urllib.request.HTTPBasicAuthHandler(password_mgr)
+    https_handler = urllib.request.HTTPSHandler(context=ssl_context)
+    opener = urllib.request.build_opener(auth_handler, https_handler)
 
-        # Extract credentials
-        twilio_account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
-        twilio_auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    print(f"🔐 Attempting authenticated download from: {file_url[:80]}...")
+    response = opener.open(file_url, timeout=45)
+    print(f"✅ Twilio responded (type: {response.headers.get('Content-Type', 'unknown')}, "
+          f"length: {response.headers.get('Content-Length', 'unknown')})")
+    return response
 
-        if not all([twilio_account_sid, twilio_auth_token]):
-            error_msg = "Missing Twilio credentials"
-            print(f"❌ {error_msg}")
-            last_download_error = error_msg
-            return None
+def stream_recording_to_s3(fileobj, filename, content_type='audio/wav'):
+    """Stream a recording into recordings/YYYY-MM-DD/filename.
 
-        # Create SSL context for HTTPS
-        ssl_context = ssl.create_default_context()
+    Returns (object URL, transfer_stats). Raises on error.
+    """
+    if not storage.has_credentials():
+        raise RuntimeError("Missing AWS credentials")
 
-        # Create authentication handler for Twilio
-        password_mgr = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-        password_mgr.add_password(None, "https://api.twilio.com", twilio_account_sid, twilio_auth_token)
-        auth_handler = urllib.request.HTTPBasicAuthHandler(password_mgr)
-        https_handler = urllib.request.HTTPSHandler(context=ssl_context)
-        opener = urllib.request.build_opener(auth_handler, https_handler)
+    s3_client = storage.get_s3_client()
+    aws_bucket = storage.bucket_name()
 
-        print(f"🔐 Attempting authenticated download from: {file_url[:80]}...")
+    date_folder = datetime.now().strftime('%Y-%m-%d')
+    s3_key = f"recordings/{date_folder}/{filename}"
 
-        # Download the file with retry for 404 errors (timing issue)
-        max_retries = 5  # More generous retry count
-        retry_delay = 3  # Start with longer delay
+    print(f"📤 Streaming to S3: s3://{aws_bucket}/{s3_key}")
+    stats = transfer.stream_to_s3(s3_client, fileobj, aws_bucket, s3_key, content_type)
 
-        for attempt in range(max_retries):
-            try:
-                print(f"📥 Download attempt {attempt + 1}/{max_retries}...")
-                response = opener.open(file_url, timeout=45)
-                content_type = response.headers.get('Content-Type', 'unknown')
-                file_data = response.read()
-                print(f"✅ Downloaded {len(file_data)} bytes from Twilio (type: {content_type})")
-
-                if len(file_data) < 1000:
-                    print(f"⚠️  WARNING: File seems too small for audio: {len(file_data)} bytes")
-
-                # Success - break out of retry loop
-                break
-
-            except urllib.error.HTTPError as http_error:
-                if http_error.code == 404 and attempt < max_retries - 1:
-                    # 404 error - recording might not be ready yet, wait and retry
-                    print(f"⏳ Recording not ready (404), waiting {retry_delay}s before retry {attempt + 2}...")
-                    import time
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                    continue
-                else:
-                    # Final attempt failed or non-404 error
-                    raise http_error
-            except Exception as download_error:
-                # Other non-HTTP errors - final attempt
-                if attempt == max_retries - 1:
-                    # This was the last attempt, handle the error
-                    error_msg = f"{type(download_error).__name__}: {str(download_error)}"
-                    print(f"❌ Twilio download failed after {max_retries} attempts: {error_msg}")
-
-                    # Set the global error variable
-                    last_download_error = error_msg
-
-                    # Store error and return None
-                    raise download_error
-                else:
-                    # Not the last attempt, retry
-                    raise download_error
+    if stats['bytes'] < 1000:
+        print(f"⚠️  WARNING: File seems too small for audio: {stats['bytes']} bytes")
 
+    print(f"✅ Successfully uploaded to S3: {s3_key}")
+    return storage.object_url(aws_bucket, s3_key), stats
+
+def upload_to_s3(file_url, filename, sid=None, source='test'):
+    """Download a Twilio file and stream it to S3 in one attempt. Returns the object URL.
+
+    Used by /test/full-upload; webhooks queue a twilio_recording or twilio_mms job instead,
+    which retries a not-yet-ready (404) file with backoff rather than sleeping in a thread.
+    Failures are raised to the caller and logged to ingest_events under `sid`.
+    """
+    print(f"📥 Attempting to download from Twilio: {file_url}")
+    try:
+        response = open_twilio_download(file_url)
     except Exception as download_error:
         error_msg = f"{type(download_error).__name__}: {str(download_error)}"
         print(f"❌ Twilio download failed: {error_msg}")
+        ingest_events.record('download_failed', f"{filename}: {error_msg}", 'error', sid=sid, source=source)
+        raise
 
-        # Set the global error variable
-        last_download_error = error_msg
-
-        # Store error in database for cross-process access
-        try:
-            conn = sqlite3.connect('songs.db')
-            c = conn.cursor()
-            c.execute("""INSERT OR REPLACE INTO inbox
-                         (id, sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                         VALUES (99999, 'SYSTEM', 'ERROR', 'error', 'Last Error', ?, NULL, ?)""",
-                      (error_msg, datetime.now().strftime('%Y-%m-%d')))
-            conn.commit()
-            conn.close()
-        except:
-            pass
-
-        return None
-
-    # Create S3 key with folder structure: recordings/YYYY-MM-DD/filename
-    date_folder = datetime.now().strftime('%Y-%m-%d')
-    s3_key = f"recordings/{date_folder}/{filename}"
-
-    # Upload to S3
+    # Stream the response body straight into S3
     try:
-        print(f"📤 Uploading to S3: s3://{aws_bucket}/{s3_key}")
-        s3_client.put_object(
-            Bucket=aws_bucket,
-            Key=s3_key,
-            Body=file_data,
-            ContentType='audio/wav'
-        )
-
-        # Generate signed URL for private access (expires in 1 hour)
-        signed_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': aws_bucket, 'Key': s3_key},
-            ExpiresIn=3600  # 1 hour
-        )
-
-        print(f"✅ Successfully uploaded to S3: {s3_key}")
-        return signed_url
-
+        with response:
+            s3_url, stats = stream_recording_to_s3(response, filename)
     except Exception as e:
-        error_msg = f"S3 upload error: {type(e).__name__}: {str(e)}"
-        print(f"❌ {error_msg}")
+        error_msg = f"{type(e).__name__}: {str(e)}"
+        print(f"❌ S3 upload error: {error_msg}")
         traceback.print_exc()
-
-        # Save error for voice feedback
-        last_download_error = error_msg
-
-        # Save error to database for debugging
-        try:
-            conn = sqlite3.connect('songs.db')
-            c = conn.cursor()
-            c.execute("""INSERT INTO inbox
-                         (sender_name, sender_phone, content_type, title, content, s3_url, date_folder)
-                         VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                      ("System", "DEBUG", "error", "S3 Upload Error", error_msg, None, datetime.now().strftime('%Y-%m-%d')))
-            conn.commit()
-            conn.close()
-        except:
-            pass  # Don't let debug logging break the main flow
-
-        return None
+        ingest_events.record('upload_failed', f"{filename}: {error_msg}", 'error', sid=sid, source=source)
+        raise
+    ingest_events.record('uploaded', f"{filename}: {stats['bytes']} bytes -> {s3_url}", sid=sid, source=source)
+    return s3_url
 
 def detect_sender_name(phone_number):
     """Detect sender name from phone number - you can customize this"""
@@ -1849,13 +1862,13 @@ def detect_sender_name(phone_number):
 def api_get_projects():
     """Get all projects for the projects tab"""
     try:
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
-        c.execute('''SELECT id, name, notes, lyrics, track_count, created_at, updated_at
-                     FROM projects
-                     ORDER BY updated_at DESC''')
+        rows, next_cursor = keyset_page(
+            c, queries.PROJECTS_SELECT,
+            [], [], 'updated_at', page_limit(), request.args.get('cursor'))
         projects = []
-        for row in c.fetchall():
+        for row in rows:
             projects.append({
                 'id': row[0],
                 'name': row[1],
@@ -1865,32 +1878,168 @@ def api_get_projects():
                 'created_at': row[5],
                 'updated_at': row[6]
             })
-        conn.close()
-        return jsonify({'success': True, 'projects': projects})
+        return jsonify({'success': True, 'projects': projects, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/send-to-project', methods=['POST'])
+def send_to_project():
+    """Append an inbox item to the named project, creating the project if needed"""
+    try:
+        data = request.json
+        item_id = data.get('item_id')
+        project_name = (data.get('project_name') or '').strip()
+        if not item_id or not project_name:
+            return jsonify({'success': False, 'error': 'item_id and project_name are required'}), 400
+
+        conn = db.get_db()
+        c = conn.cursor()
+        c.execute("SELECT id FROM projects WHERE name = ? ORDER BY id LIMIT 1", (project_name,))
+        row = c.fetchone()
+        if row:
+            project_id = row[0]
+        else:
+            c.execute("INSERT INTO projects (name) VALUES (?)", (project_name,))
+            project_id = c.lastrowid
+
+        c.execute("""INSERT INTO project_items (project_id, inbox_id, position)
+                     SELECT ?, ?, COALESCE(MAX(position), -1) + 1 FROM project_items WHERE project_id = ?""",
+                  (project_id, item_id, project_id))
+        c.execute("""UPDATE projects SET updated_at = CURRENT_TIMESTAMP,
+                     track_count = (SELECT COUNT(*) FROM project_items WHERE project_id = ?)
+                     WHERE id = ?""", (project_id, project_id))
+        conn.commit()
+        return jsonify({'success': True, 'project_id': project_id})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/play-project/<int:project_id>', methods=['POST'])
+def play_project(project_id):
+    """Mixdown of a project's voice notes in position order, with cue points - answered from the stored
+    mixdown while the project is unchanged, otherwise rendered on the DSP pool (poll /api/dsp/<task_id>)"""
+    try:
+        c = db.get_db().cursor()
+        c.execute(queries.PROJECT_MIXDOWN_SQL, (project_id,))
+        row = c.fetchone()
+        if row and os.path.exists(row[1].lstrip('/')):
+            return jsonify({
+                'success': True,
+                'cached': True,
+                'project_name': row[0],
+                'mixdown_url': row[1],
+                'duration': row[2],
+                'cues': json.loads(row[3])
+            })
+
+        return submit_dsp('mixdown', audio_tasks.mixdown_project, project_id=project_id)
     except Exception as e:
+        print(f"❌ Project playback error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/phrases', methods=['GET'])
 def api_get_phrases():
     """Get all phrases for the phrases tab"""
     try:
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
-        c.execute('''SELECT id, title, content, s3_url, duration, created_at
-                     FROM phrases
-                     ORDER BY created_at DESC''')
+        rows, next_cursor = keyset_page(
+            c, queries.PHRASES_SELECT,
+            [], [], 'created_at', page_limit(), request.args.get('cursor'))
         phrases = []
-        for row in c.fetchall():
+        for row in rows:
             phrases.append({
                 'id': row[0],
                 'title': row[1],
                 'content': row[2] or '',
                 's3_url': row[3],
+                'play_url': storage.play_url(row[3]),
                 'duration': row[4] or '0:15',
                 'created_at': row[5]
             })
-        conn.close()
-        return jsonify({'success': True, 'phrases': phrases})
+        return jsonify({'success': True, 'phrases': phrases, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+def search_match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix (so "lov" finds "love")"""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search_markup(text):
+    """HTML-escape an FTS highlight/snippet, turning the \x02/\x03 match markers into <mark> tags"""
+    return html.escape(text or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    """Ranked search over inbox items, songs, projects and phrases (?q=, ?type=inbox,song,..., ?cursor=, ?limit=)"""
+    try:
+        started = time.time()
+        query = request.args.get('q', '').strip()
+        match = search_match_expression(query)
+        if not match:
+            return jsonify({'success': False, 'error': 'Missing search query'}), 400
+
+        where = ["search_index MATCH ?"]
+        params = [match]
+        types = [t for t in request.args.get('type', '').split(',') if t]
+        unknown = [t for t in types if t not in migrations.SEARCH_KINDS]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown type: {', '.join(unknown)}"}), 400
+        if types:
+            where.append(f"kind IN ({','.join('?' * len(types))})")
+            params += types
+
+        # Ranked results have no stable sort key to seek on, so the cursor carries an
+        # offset - tied to the query text so it can't be replayed against another search
+        offset = 0
+        if request.args.get('cursor'):
+            cursor_query, offset = decode_page_cursor(request.args['cursor'])
+            if cursor_query != query:
+                raise ValueError('Invalid page cursor')
+        limit = request.args.get('limit', SEARCH_PAGE_SIZE_DEFAULT, type=int) or SEARCH_PAGE_SIZE_DEFAULT
+        limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+        conn = db.get_db()
+        c = conn.cursor()
+        # rank uses the bm25 weights configured in migrations._search_index
+        c.execute(f'''SELECT rowid, kind,
+                             highlight(search_index, 1, char(2), char(3)),
+                             snippet(search_index, 2, char(2), char(3), '…', ?),
+                             rank
+                      FROM search_index
+                      WHERE {' AND '.join(where)}
+                      ORDER BY rank
+                      LIMIT ? OFFSET ?''', [SEARCH_SNIPPET_TOKENS] + params + [limit + 1, offset])
+        rows = c.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_page_cursor(query, offset + limit)
+
+        results = []
+        for row in rows:
+            results.append({
+                'type': row[1],
+                'id': row[0] // 4,
+                'title': search_markup(row[2]),
+                'snippet': search_markup(row[3]),
+                'score': round(-row[4], 6)
+            })
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results,
+            'next_cursor': next_cursor,
+            'took_ms': round((time.time() - started) * 1000, 1)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -1900,10 +2049,11 @@ def debug_aws():
     """Debug AWS S3 configuration and connectivity"""
     try:
         # Get environment variables
-        aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-        aws_bucket = os.environ.get('AWS_BUCKET_NAME')
-        aws_region = os.environ.get('AWS_REGION', 'us-east-1')
+        settings = storage.aws_settings()
+        aws_access_key = settings['access_key']
+        aws_secret_key = settings['secret_key']
+        aws_bucket = settings['bucket']
+        aws_region = settings['region']
 
         debug_info = {
             'has_access_key': bool(aws_access_key),
@@ -1921,12 +2071,8 @@ def debug_aws():
             })
 
         # Test S3 connection
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=aws_region
-        )
+        s3_client = storage.get_s3_client()
+        debug_info['max_pool_connections'] = storage.MAX_POOL_CONNECTIONS
 
         # Try to head the bucket (check if it exists and we have access)
         try:
@@ -1964,10 +2110,11 @@ def debug_aws():
 def fix_missing_recording():
     """Add the missing recording that exists in S3 to the inbox"""
     try:
-        # The S3 URL that exists but isn't in the inbox
-        s3_url = "https://ladyembertest1.s3.us-east-1.amazonaws.com/recordings/2025-09-13/call_recording_20250913_174113.wav"
+        # The S3 object that exists but isn't in the inbox, stored by its canonical URL like every other row
+        s3_url = storage.object_url(storage.bucket_name(),
+                                    "recordings/2025-09-13/call_recording_20250913_174113.wav")
 
-        conn = sqlite3.connect('songs.db')
+        conn = db.get_db()
         c = conn.cursor()
 
         # Check if this recording already exists in the inbox
@@ -1975,7 +2122,6 @@ def fix_missing_recording():
         existing = c.fetchone()
 
         if existing:
-            conn.close()
             return jsonify({
                 'success': False,
                 'message': f'Recording already exists in inbox with ID {existing[0]}'
@@ -1990,7 +2136,6 @@ def fix_missing_recording():
 
         new_record_id = c.lastrowid
         conn.commit()
-        conn.close()
 
         return jsonify({
             'success': True,
@@ -2005,8 +2150,6 @@ def fix_missing_recording():
         })
 
 if __name__ == '__main__':
-    # Initialize database on startup (safe for production - won't drop existing data)
-    init_db()
     port = int(os.environ.get('PORT', 5002))
     debug_mode = os.environ.get('FLASK_ENV') != 'production'
     print(f"Starting The Asia Project server on port {port}...")
@@ -0,0 +1,19 @@
+# Local disk cache of source audio, shared by every process on the box
+# DSP paths (analysis, transpose, waveforms, renditions) read audio through
+# here, so analyzing and then transposing a clip downloads it once. S3 keys
+# in this app are timestamped and never rewritten, so a cached object never
+# goes stale. Fills, locking and LRU eviction live in disk_cache.py.
+
+import os
+import tempfile
+from disk_cache import DiskCache
+
+CACHE_DIR = os.environ.get('AUDIO_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'team-inbox-audio')
+MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MB', 2048)) * 1024 * 1024
+
+_cache = DiskCache(CACHE_DIR, MAX_BYTES, 'audio')
+
+fetch = _cache.fetch
+store = _cache.store
+evict = _cache.evict
+usage = _cache.usage
@@ -0,0 +1,671 @@
+# Audio DSP work run in the dsp.py process pool
+# Everything here executes in pool processes, so this module must not import
+# app (that would re-run init_db and build a Flask app in every child).
+# Heavy libraries are imported inside the functions, as elsewhere.
+
+import os
+import re
+import json
+import tempfile
+import subprocess
+from urllib.parse import urlparse
+from disk_cache import file_fingerprint
+import db
+import queries
+import analysis_cache
+import audio_cache
+import pcm_cache
+import render_cache
+import storage
+import transfer
+
+# Parameters that shape an analysis result - part of the analysis cache key
+ANALYSIS_PARAMS = {'sample_rate': 22050, 'piptrack_threshold': 0.1, 'n_mfcc': 13}
+# MIDI numbers covered by the note-name lookup table (piptrack tops out near Nyquist, ~MIDI 136 at 22050 Hz)
+PITCH_MIDI_RANGE = 144
+
+# Waveform peaks: decoded at 8 kHz mono, finest level = one min/max pair per 256 samples (~31/s),
+# each coarser level halves that until a level has at most WAVEFORM_MIN_PEAKS pairs
+WAVEFORM_SAMPLE_RATE = 8000
+WAVEFORM_BASE_BIN = 256
+WAVEFORM_MIN_PEAKS = 64
+
+# Playback renditions: 'aac' (.m4a, plays everywhere incl. iOS) or 'opus' (smaller, no older Safari)
+RENDITION_FORMAT = os.environ.get('RENDITION_FORMAT', 'aac')
+RENDITION_BITRATE = os.environ.get('RENDITION_BITRATE', '32k')
+RENDITION_FORMATS = {
+    # format: (extension, content type, ffmpeg codec args)
+    'aac': ('.m4a', 'audio/mp4', ['-c:a', 'aac', '-movflags', '+faststart']),
+    'opus': ('.ogg', 'audio/ogg', ['-c:a', 'libopus', '-application', 'voip']),
+}
+
+# Content-addressed renders never change, so players and CDNs may keep them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Transpositions: part of the render cache key - bump the version when the pitch-shift code changes
+TRANSPOSE_ALGORITHM = f"librosa.pitch_shift@{ANALYSIS_PARAMS['sample_rate']}/v1"
+# New voice notes get every whole-semitone shift within +/- this many pre-rendered (0 = off)
+TRANSPOSE_PRERENDER_SEMITONES = int(os.environ.get('TRANSPOSE_PRERENDER_SEMITONES') or 0)
+
+# Splices: inputs are resampled to 44.1 kHz stereo and encoded as VBR mp3 (LAME -q:a 2)
+SPLICE_SAMPLE_RATE = 44100
+SPLICE_MP3_QUALITY = '2'
+SPLICE_ALGORITHM = f"ffmpeg-concat@{SPLICE_SAMPLE_RATE}/mp3q{SPLICE_MP3_QUALITY}/v1"
+
+# Local audio lives under static/ (uploads, splices); /static/... locations never resolve outside it
+STATIC_DIR = 'static'
+
+# Project mixdowns: silence between consecutive voice notes on the timeline
+PROJECT_GAP_SECONDS = float(os.environ.get('PROJECT_GAP_SECONDS') or 1.0)
+# Each clip (and gap) is encoded once to a cached CBR mp3 segment - no Xing header, so every segment's
+# length is exactly its frames - and a mixdown is a stream copy of its segments plus chapter cues
+MIXDOWN_BITRATE = '192k'
+MIXDOWN_SEGMENT_ALGORITHM = f"ffmpeg-mp3@{SPLICE_SAMPLE_RATE}/cbr{MIXDOWN_BITRATE}/v1"
+MIXDOWN_ALGORITHM = f"ffmpeg-concat-copy/{MIXDOWN_SEGMENT_ALGORITHM}/chapters/v1"
+
+
+def download_url(audio_url, path):
+    """Stream audio_url over HTTP into path"""
+    import requests
+
+    with requests.get(audio_url, timeout=30, stream=True) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to download audio (HTTP {response.status_code})")
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=transfer.CHUNK_SIZE):
+                f.write(chunk)
+
+
+def static_path(location):
+    """Filesystem path of a /static/... location. Raises ValueError if it resolves outside static/."""
+    root = os.path.realpath(STATIC_DIR)
+    path = os.path.realpath(location.lstrip('/'))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Not a static file: {location}")
+    return path
+
+
+def fetch_audio(audio_url):
+    """Local path for audio_url, read through the shared disk cache (audio_cache.py).
+
+    Our S3 objects come via the S3 client, so an expired presigned URL still
+    works, and are cached by bucket/key whatever the URL's signature. Files
+    under /static are used in place. Anything else is downloaded over HTTP
+    and cached by URL. Either way concurrent requests for the same audio
+    share one download. Don't delete the returned path.
+    """
+    if audio_url.startswith('/static/'):
+        return static_path(audio_url)
+    location = storage.parse_s3_url(audio_url)
+    if location:
+        bucket, key = location
+        cache_key, suffix = f"s3/{bucket}/{key}", os.path.splitext(key)[1]
+    else:
+        cache_key, suffix = f"url/{audio_url}", os.path.splitext(urlparse(audio_url).path)[1]
+
+    def download(path):
+        if location and storage.has_credentials():
+            with open(path, 'wb') as f:
+                storage.get_s3_client().download_fileobj(bucket, key, f, Config=transfer.transfer_config())
+        else:
+            download_url(audio_url, path)
+
+    return audio_cache.fetch(cache_key, download, suffix=suffix)
+
+
+def store_waveform(inbox_id, audio_url):
+    """Runs on the DSP pool: compute an inbox item's peak pyramid and store it in waveforms"""
+    sample_rate, duration, levels, peaks = compute_waveform(fetch_audio(audio_url))
+    conn = db.get_db()
+    conn.execute('''INSERT OR REPLACE INTO waveforms (inbox_id, sample_rate, duration, levels, peaks)
+                    VALUES (?, ?, ?, ?, ?)''', (inbox_id, sample_rate, duration, json.dumps(levels), peaks))
+    conn.commit()
+    return {'duration': duration, 'levels': len(levels), 'bytes': len(peaks)}
+
+
+def compute_waveform(path):
+    """Decode once and build the min/max peak pyramid.
+
+    Returns (sample_rate, duration, levels, peaks): peaks is one bytes blob of
+    int8 (min, max) pairs for every level back to back, and levels lists
+    [samples_per_peak, count, byte_offset] from finest to coarsest.
+    """
+    import numpy as np
+
+    decoded = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', path, '-ac', '1', '-ar', str(WAVEFORM_SAMPLE_RATE), '-f', 's16le', '-'],
+        capture_output=True, check=True
+    )
+    pcm = np.frombuffer(decoded.stdout, dtype=np.int16)
+    duration = len(pcm) / WAVEFORM_SAMPLE_RATE
+    if len(pcm) == 0:
+        return WAVEFORM_SAMPLE_RATE, 0.0, [], b''
+
+    # Scale to int8 first - min/max commute with the scaling, so coarser levels can stay in int8
+    bins = -(-len(pcm) // WAVEFORM_BASE_BIN)
+    padded = np.zeros(bins * WAVEFORM_BASE_BIN, dtype=np.int16)
+    padded[:len(pcm)] = pcm
+    frames = (padded.reshape(bins, WAVEFORM_BASE_BIN).astype(np.int32) * 127 // 32767).astype(np.int8)
+    mins, maxs = frames.min(axis=1), frames.max(axis=1)
+
+    levels = []
+    chunks = []
+    offset = 0
+    samples_per_peak = WAVEFORM_BASE_BIN
+    while True:
+        pairs = np.empty(len(mins) * 2, dtype=np.int8)
+        pairs[0::2], pairs[1::2] = mins, maxs
+        levels.append([samples_per_peak, len(mins), offset])
+        chunks.append(pairs.tobytes())
+        offset += len(pairs)
+        if len(mins) <= WAVEFORM_MIN_PEAKS:
+            break
+        if len(mins) % 2:
+            mins, maxs = np.append(mins, mins[-1]), np.append(maxs, maxs[-1])
+        mins, maxs = mins.reshape(-1, 2).min(axis=1), maxs.reshape(-1, 2).max(axis=1)
+        samples_per_peak *= 2
+
+    return WAVEFORM_SAMPLE_RATE, duration, levels, b''.join(chunks)
+
+
+def probe_duration(path):
+    """Duration in seconds according to ffprobe (None if it can't tell)"""
+    probe = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', path],
+        capture_output=True, text=True
+    )
+    try:
+        return round(float(probe.stdout.strip()), 3)
+    except ValueError:
+        return None
+
+
+def transcode_rendition(path):
+    """Mono low-bitrate rendition of path in RENDITION_FORMAT. Returns (temp path, content type, extension)."""
+    extension, content_type, codec_args = RENDITION_FORMATS[RENDITION_FORMAT]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as temp_file:
+        output_path = temp_file.name
+    try:
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-i', path, '-vn', '-ac', '1', *codec_args, '-b:a', RENDITION_BITRATE,
+             output_path],
+            capture_output=True, check=True
+        )
+    except Exception:
+        os.unlink(output_path)
+        raise
+    return output_path, content_type, extension
+
+
+def extract_pitch_track(y, sr):
+    """Strongest piptrack pitch per voiced frame, as parallel (columnar) lists"""
+    import numpy as np
+    import librosa
+
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr, threshold=ANALYSIS_PARAMS['piptrack_threshold'])
+
+    # Loudest bin in every frame at once, then drop unvoiced (zero-pitch) frames
+    frames = np.arange(pitches.shape[1])
+    strongest = magnitudes.argmax(axis=0)
+    frequency = pitches[strongest, frames]
+    confidence = magnitudes[strongest, frames]
+    voiced = frequency > 0
+
+    frequency = frequency[voiced]
+    midi_note = librosa.hz_to_midi(frequency)
+    # Same names librosa.midi_to_note gives, looked up instead of formatted per frame
+    note_names = np.array(librosa.midi_to_note(np.arange(PITCH_MIDI_RANGE)))
+    note_index = np.clip(np.round(midi_note).astype(int), 0, PITCH_MIDI_RANGE - 1)
+
+    return {
+        'time': np.round(librosa.frames_to_time(frames[voiced], sr=sr), 3).tolist(),
+        'frequency': np.round(frequency, 2).tolist(),
+        'midi_note': np.round(midi_note, 2).tolist(),
+        'note_name': note_names[note_index].tolist(),
+        'confidence': np.round(confidence[voiced], 3).tolist()
+    }
+
+
+def pitch_track_points(columns):
+    """Columnar pitch track -> the original list of {time, frequency, midi_note, note_name, confidence}"""
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*(columns[key] for key in keys))]
+
+
+def format_analysis(analysis, pitch_format):
+    """Shape a (cached) analysis for the response - pitch_format 'columns' keeps the compact parallel arrays"""
+    results = analysis['analysis_results']
+    if pitch_format == 'columns' or 'pitch_track' not in results:
+        return analysis
+    return {**analysis, 'analysis_results': {**results, 'pitch_track': pitch_track_points(results['pitch_track'])}}
+
+
+def run_audio_analysis(path, analysis_type, fingerprint=None):
+    """Pitch / key / spectral analysis of an audio file. Returns the JSON-ready response fields."""
+    import numpy as np
+    import librosa
+
+    # Decoded samples come from the PCM cache (librosa.load only on the first use of this audio)
+    sr = ANALYSIS_PARAMS['sample_rate']
+    y = pcm_cache.load(path, sr, fingerprint)
+
+    results = {}
+
+    # Pitch tracking (fundamental frequency over time)
+    if analysis_type in ['pitch', 'full']:
+        results['pitch_track'] = extract_pitch_track(y, sr)
+
+    # Key detection
+    if analysis_type in ['key', 'full']:
+        # Use chroma features for key detection
+        chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+        chroma_mean = np.mean(chroma, axis=1)
+
+        # Simple key detection using chroma vector correlation
+        key_profiles = {
+            'C': [1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1],
+            'C#': [1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0],
+            'D': [0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1],
+            'D#': [1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0],
+            'E': [0, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1],
+            'F': [1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0],
+            'F#': [0, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1],
+            'G': [1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1],
+            'G#': [1, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0],
+            'A': [0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1],
+            'A#': [1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 0],
+            'B': [0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1]
+        }
+
+        correlations = {}
+        for key, profile in key_profiles.items():
+            correlation = np.corrcoef(chroma_mean, profile)[0, 1]
+            correlations[key] = float(correlation) if not np.isnan(correlation) else 0
+
+        detected_key = max(correlations, key=correlations.get)
+        key_confidence = correlations[detected_key]
+
+        results['key_detection'] = {
+            'detected_key': detected_key,
+            'confidence': key_confidence,
+            'all_correlations': correlations
+        }
+
+    # Spectral analysis
+    if analysis_type in ['spectral', 'full']:
+        # Get spectral features
+        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
+        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
+        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=ANALYSIS_PARAMS['n_mfcc'])
+
+        results['spectral_analysis'] = {
+            'spectral_centroid_mean': float(np.mean(spectral_centroids)),
+            'spectral_rolloff_mean': float(np.mean(spectral_rolloff)),
+            'mfcc_features': mfccs.tolist(),
+            'tempo': float(librosa.beat.tempo(y=y, sr=sr)[0]),
+            'duration': float(len(y) / sr)
+        }
+
+    return {
+        'analysis_results': results,
+        'sample_rate': sr,
+        'duration': float(len(y) / sr)
+    }
+
+
+def analyze(audio_url, analysis_type='full', pitch_format='points'):
+    """Pool task behind /api/analyze-audio: fetch, analyze (or reuse a cached analysis), shape the response"""
+    fingerprint = analysis_cache.s3_fingerprint(audio_url)
+    if fingerprint:
+        cache_key = analysis_cache.cache_key(fingerprint, analysis_type, ANALYSIS_PARAMS)
+        cached = analysis_cache.get(cache_key)
+        if cached:
+            return {'success': True, 'cached': True, **format_analysis(cached, pitch_format)}
+
+    path = fetch_audio(audio_url)
+    if not fingerprint:
+        fingerprint = file_fingerprint(path)
+        cache_key = analysis_cache.cache_key(fingerprint, analysis_type, ANALYSIS_PARAMS)
+        cached = analysis_cache.get(cache_key)
+        if cached:
+            return {'success': True, 'cached': True, **format_analysis(cached, pitch_format)}
+    analysis = run_audio_analysis(path, analysis_type, fingerprint)
+
+    analysis_cache.put(cache_key, fingerprint, analysis_type, analysis)
+    return {'success': True, 'cached': False, **format_analysis(analysis, pitch_format)}
+
+
+def transposition_key(fingerprint, semitones):
+    return render_cache.render_key('transpose', [fingerprint, float(semitones)], TRANSPOSE_ALGORITHM)
+
+
+def transposition_response(s3_key, semitones, cached):
+    return {
+        'success': True,
+        'cached': cached,
+        'transposed_url': storage.presign(storage.bucket_name(), s3_key),
+        'original_semitones': semitones,
+        'filename': os.path.basename(s3_key)
+    }
+
+
+def cached_transposition(fingerprint, semitones, record=True):
+    """Response for an already-rendered transposition of this audio, or None"""
+    render = render_cache.get(transposition_key(fingerprint, semitones), 'transpose', record=record)
+    return transposition_response(render['location'], semitones, cached=True) if render else None
+
+
+def prerender_transposition(audio_url, semitones):
+    """Runs on the DSP pool: render one transposition ahead of use unless it exists. True if it rendered."""
+    # Key on the ETag when there is one, so the render matches what /api/transpose-audio looks up
+    fingerprint = analysis_cache.s3_fingerprint(audio_url)
+    input_path = fetch_audio(audio_url)
+    fingerprint = fingerprint or file_fingerprint(input_path)
+    if cached_transposition(fingerprint, semitones, record=False):
+        return False
+    render_transposition(input_path, fingerprint, semitones)
+    return True
+
+
+def render_transposition(input_path, fingerprint, semitones):
+    """Pitch-shift input_path and upload it under a key derived from its content. Returns the S3 key."""
+    import librosa
+    import soundfile as sf
+
+    key = transposition_key(fingerprint, semitones)
+    # Same source + shift + algorithm always lands on the same object, so repeats never duplicate files
+    s3_key = f"transposed/{key[:2]}/{key}/transposed_{float(semitones):+g}st.wav"
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_output:
+        output_path = temp_output.name
+    try:
+        # Load audio (librosa's default 22050 Hz, the same rate analysis decodes at)
+        sr = ANALYSIS_PARAMS['sample_rate']
+        y = pcm_cache.load(input_path, sr, fingerprint)
+
+        # Apply pitch shifting
+        y_shifted = librosa.effects.pitch_shift(y, sr=sr, n_steps=semitones)
+        sf.write(output_path, y_shifted, sr)
+
+        size_bytes = os.path.getsize(output_path)
+        transfer.upload_path_to_s3(storage.get_s3_client(), output_path, storage.bucket_name(), s3_key,
+                                   content_type='audio/wav', cache_control=IMMUTABLE_CACHE_CONTROL)
+    finally:
+        os.unlink(output_path)
+
+    render_cache.put(key, 'transpose', s3_key, 'audio/wav', size_bytes)
+    return s3_key
+
+
+def transpose(audio_url, semitones):
+    """Pool task behind /api/transpose-audio: pitch-shift (or reuse an earlier render) and return a signed URL"""
+    fingerprint = analysis_cache.s3_fingerprint(audio_url)
+    if fingerprint:
+        cached = cached_transposition(fingerprint, semitones)
+        if cached:
+            return cached
+
+    input_path = fetch_audio(audio_url)
+    if not fingerprint:
+        fingerprint = file_fingerprint(input_path)
+        cached = cached_transposition(fingerprint, semitones)
+        if cached:
+            return cached
+
+    s3_key = render_transposition(input_path, fingerprint, semitones)
+    return transposition_response(s3_key, semitones, cached=False)
+
+
+def splice_filter_graph(segments, crossfade):
+    """ffmpeg input args and filter_complex that join segments in order.
+
+    Every input is resampled to one format, then joined pairwise: acrossfade
+    between two adjacent clips when crossfade > 0, otherwise (and around
+    silences) the concat filter. ffmpeg streams through the graph, so only
+    the crossfade window is ever buffered.
+    """
+    input_args, filters = [], []
+    joined, previous = None, None
+    for index, segment in enumerate(segments):
+        if 'silence' in segment:
+            input_args += ['-f', 'lavfi', '-t', f"{float(segment['silence']):.3f}",
+                           '-i', f'anullsrc=r={SPLICE_SAMPLE_RATE}:cl=stereo']
+        else:
+            input_args += ['-i', segment['path']]
+        filters.append(f'[{index}:a]aresample={SPLICE_SAMPLE_RATE},'
+                       f'aformat=sample_fmts=fltp:channel_layouts=stereo[s{index}]')
+        label = f'[s{index}]'
+        if joined is None:
+            joined = label
+        elif crossfade and 'silence' not in segment and 'silence' not in previous:
+            # acrossfade fails if a clip is shorter than the overlap - never overlap more than the shorter one
+            overlap = min([crossfade] + [clip['duration'] for clip in (previous, segment) if clip.get('duration')])
+            filters.append(f'{joined}{label}acrossfade=d={overlap:.3f}[j{index}]')
+            joined = f'[j{index}]'
+        else:
+            filters.append(f'{joined}{label}concat=n=2:v=0:a=1[j{index}]')
+            joined = f'[j{index}]'
+        previous = segment
+    return input_args, ';'.join(filters), joined
+
+
+def ffmpeg_render(output_path, args):
+    """Run ffmpeg with args into a partial file next to output_path, then move it into place"""
+    fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(output_path),
+                                        suffix='.partial' + os.path.splitext(output_path)[1])
+    os.close(fd)
+    try:
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', *args, partial_path], capture_output=True, check=True)
+        os.replace(partial_path, output_path)
+    except Exception:
+        os.unlink(partial_path)
+        raise
+
+
+def splice_key(segments, crossfade=0.0, kind='splice'):
+    """Render-cache key of a splice: the clips' content fingerprints, the gaps and the crossfade, in order"""
+    inputs = [{'silence': round(float(segment['silence']), 3)} if 'silence' in segment
+              else segment.get('fingerprint') or file_fingerprint(segment['path'])
+              for segment in segments]
+    return render_cache.render_key(kind, [inputs, float(crossfade or 0)], SPLICE_ALGORITHM)
+
+
+def render_splice(segments, crossfade=0.0, kind='splice'):
+    """Join segments into one mp3 under static/spliced, reusing an identical earlier render.
+
+    segments is an ordered list of {'path': ..., 'fingerprint': optional} clips
+    and {'silence': seconds} gaps; see splice_key. Returns (render row, cached).
+    """
+    crossfade = max(0.0, float(crossfade or 0))
+    key = splice_key(segments, crossfade, kind)
+    render = render_cache.get(key, kind)
+    if render and os.path.exists(render['location'].lstrip('/')):
+        return render, True
+
+    output_filename = f'spliced_{key[:32]}.mp3'
+    output_path = os.path.join('static/spliced', output_filename)
+    if crossfade:
+        for segment in segments:
+            if 'path' in segment and 'duration' not in segment:
+                segment['duration'] = probe_duration(segment['path'])
+    input_args, filter_graph, output_label = splice_filter_graph(segments, crossfade)
+    ffmpeg_render(output_path, [*input_args, '-filter_complex', filter_graph, '-map', output_label,
+                                '-c:a', 'libmp3lame', '-q:a', SPLICE_MP3_QUALITY])
+
+    location = f'/static/spliced/{output_filename}'
+    render_cache.put(key, kind, location, 'audio/mpeg', os.path.getsize(output_path))
+    return render_cache.get(key, kind, record=False), False
+
+
+def splice(files, crossfade=0.0):
+    """Pool task behind /api/splice: join uploaded files (and {'silence': seconds} gaps) into static/spliced"""
+    segments = []
+    for file_info in files:
+        if isinstance(file_info, dict) and 'silence' in file_info:
+            segments.append({'silence': file_info['silence']})
+            continue
+        # Handle both path string and file object
+        if isinstance(file_info, str):
+            location = '/' + file_info.lstrip('/')
+        else:
+            location = f"/static/uploads/{file_info.get('saved_name', '')}"
+        try:
+            filepath = static_path(location)
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+        if os.path.isfile(filepath):
+            segments.append({'path': filepath})
+        else:
+            print(f"⚠️ Splice input not found, skipping: {filepath}")
+
+    if not any('path' in segment for segment in segments):
+        return {'success': False, 'error': 'None of the files to splice exist'}
+
+    render, cached = render_splice(segments, crossfade)
+    return {
+        'success': True,
+        'cached': cached,
+        'spliced_file': render['location'],
+        'filename': os.path.basename(render['location'])
+    }
+
+
+def audio_fingerprint(audio_url):
+    """Cheap content identity for mixdown keys: our S3 keys are never rewritten, static files are hashed"""
+    location = storage.parse_s3_url(audio_url)
+    if location:
+        return 's3/{}/{}'.format(*location)
+    if audio_url.startswith('/static/'):
+        return file_fingerprint(static_path(audio_url))
+    return audio_url
+
+
+def project_playlist(project_id, conn=None):
+    """(project name, playable items in position order), or (None, []) for an unknown project"""
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT name FROM projects WHERE id = ?", (project_id,))
+    row = c.fetchone()
+    if not row:
+        return None, []
+    c.execute(queries.PROJECT_PLAYLIST_SQL, (project_id,))
+    items = [{'inbox_id': item[0], 'title': item[1], 'audio_url': item[2], 'fingerprint': audio_fingerprint(item[2])}
+             for item in c.fetchall()]
+    return row[0], items
+
+
+def mixdown_key(items):
+    """Render-cache key of a project mixdown: its clips in order, the gap between them and the cue titles"""
+    return render_cache.render_key('mixdown', [[item['fingerprint'] for item in items], PROJECT_GAP_SECONDS,
+                                               [item['title'] for item in items]], MIXDOWN_ALGORITHM)
+
+
+def mixdown_segment(segment):
+    """Local path of one timeline segment - {'silence': seconds} or a playlist item - as a mixdown mp3.
+
+    Each clip is encoded once per content fingerprint (each gap once per
+    length) and kept in the render cache, so after an edit only the clips the
+    project didn't have before are downloaded and encoded.
+    """
+    if 'silence' in segment:
+        seconds = round(float(segment['silence']), 3)
+        key = render_cache.render_key('mixdown-segment', {'silence': seconds}, MIXDOWN_SEGMENT_ALGORITHM)
+    else:
+        key = render_cache.render_key('mixdown-segment', segment['fingerprint'], MIXDOWN_SEGMENT_ALGORITHM)
+    render = render_cache.get(key, 'mixdown-segment')
+    if render and os.path.exists(render['location'].lstrip('/')):
+        return render['location'].lstrip('/')
+
+    if 'silence' in segment:
+        input_args = ['-f', 'lavfi', '-t', f"{seconds:.3f}", '-i', f'anullsrc=r={SPLICE_SAMPLE_RATE}:cl=stereo']
+    else:
+        input_args = ['-i', fetch_audio(segment['audio_url'])]
+    output_filename = f'segment_{key[:32]}.mp3'
+    output_path = os.path.join('static/spliced', output_filename)
+    ffmpeg_render(output_path, [*input_args, '-ar', str(SPLICE_SAMPLE_RATE), '-ac', '2', '-c:a', 'libmp3lame',
+                                '-b:a', MIXDOWN_BITRATE, '-write_xing', '0', '-id3v2_version', '0'])
+    render_cache.put(key, 'mixdown-segment', f'/static/spliced/{output_filename}', 'audio/mpeg',
+                     os.path.getsize(output_path))
+    return output_path
+
+
+def ffmetadata_chapters(cues):
+    """ffmpeg metadata file text with one chapter per cue"""
+    lines = [';FFMETADATA1']
+    for cue in cues:
+        start = round(cue['start'] * 1000)
+        title = re.sub(r'([=;#\\\n])', r'\\\1', cue['title'] or 'Voice note')
+        lines += ['[CHAPTER]', 'TIMEBASE=1/1000', f"START={start}", f"END={start + round(cue['duration'] * 1000)}",
+                  f"title={title}"]
+    return '\n'.join(lines) + '\n'
+
+
+def render_mixdown(key, segment_paths, cues):
+    """Join cached segments into one mp3 (stream copy, no re-encode) with the cues as ID3 chapters"""
+    output_filename = f'mixdown_{key[:32]}.mp3'
+    output_path = os.path.join('static/spliced', output_filename)
+    with tempfile.TemporaryDirectory() as work_dir:
+        playlist = os.path.join(work_dir, 'segments.txt')
+        with open(playlist, 'w') as f:
+            for path in segment_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        chapters = os.path.join(work_dir, 'chapters.txt')
+        with open(chapters, 'w') as f:
+            f.write(ffmetadata_chapters(cues))
+        ffmpeg_render(output_path, ['-f', 'concat', '-safe', '0', '-i', playlist, '-i', chapters,
+                                    '-map', '0:a', '-map_chapters', '1', '-c', 'copy', '-id3v2_version', '3'])
+    render_cache.put(key, 'mixdown', f'/static/spliced/{output_filename}', 'audio/mpeg',
+                     os.path.getsize(output_path))
+    return render_cache.get(key, 'mixdown', record=False)
+
+
+def mixdown_project(project_id):
+    """Pool task behind /api/play-project: one mp3 of a project's voice notes in order, with cue points.
+
+    Clips are encoded to cached segments (mixdown_segment) and identical
+    mixdowns come from the render cache, so adding, removing or reordering
+    items only encodes new clips and re-copies the segments. The cues are
+    returned and also written into the mp3 as chapters.
+    """
+    name, items = project_playlist(project_id)
+    if name is None:
+        return {'success': False, 'error': 'Project not found'}
+    if not items:
+        return {'success': False, 'error': 'Project has no audio yet'}
+
+    segment_paths, cues, position = [], [], 0.0
+    for item in items:
+        if segment_paths and PROJECT_GAP_SECONDS > 0:
+            path = mixdown_segment({'silence': PROJECT_GAP_SECONDS})
+            segment_paths.append(path)
+            position += probe_duration(path) or PROJECT_GAP_SECONDS
+        path = mixdown_segment(item)
+        duration = probe_duration(path) or 0.0
+        cues.append({'inbox_id': item['inbox_id'], 'title': item['title'], 'start': round(position, 3),
+                     'duration': duration})
+        position += duration
+        segment_paths.append(path)
+
+    key = mixdown_key(items)
+    render = render_cache.get(key, 'mixdown')
+    cached = bool(render and os.path.exists(render['location'].lstrip('/')))
+    if not cached:
+        render = render_mixdown(key, segment_paths, cues)
+    duration = round(position, 3)
+
+    # Only record it as current if the project wasn't edited while this rendered
+    conn = db.get_db()
+    if mixdown_key(project_playlist(project_id, conn)[1]) == render['cache_key']:
+        conn.execute('''INSERT OR REPLACE INTO project_mixdowns (project_id, render_key, location, duration, cues)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     (project_id, render['cache_key'], render['location'], duration, json.dumps(cues)))
+        conn.commit()
+
+    return {
+        'success': True,
+        'cached': cached,
+        'project_name': name,
+        'mixdown_url': render['location'],
+        'duration': duration,
+        'cues': cues
+    }
@@ -0,0 +1,81 @@
+# SQLite connection management
+# Each thread keeps one connection to songs.db and reuses it across requests
+# and background jobs. WAL lets readers (the inbox poll) run alongside a
+# writer (Twilio webhooks) instead of failing with "database is locked".
+
+import os
+import atexit
+import sqlite3
+import threading
+
+DB_PATH = os.environ.get('DATABASE_PATH', 'songs.db')
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_MB', 256)) * 1024 * 1024
+CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_MB', 16)) * 1024
+
+_local = threading.local()
+_all_connections = []
+_all_lock = threading.Lock()
+
+
+def connect(db_path=None):
+    """Open a new connection with the tuned pragmas applied"""
+    # check_same_thread=False only so close_all() can close other threads' connections at exit
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    c.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    c.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    c.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_db():
+    """Return this thread's reusable connection, opening it on first use.
+
+    Don't close it - call release() (done automatically at request teardown).
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    conn = connect()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    with _all_lock:
+        _all_connections.append(conn)
+    return conn
+
+
+def release(exception=None):
+    """Roll back anything a handler left uncommitted so the next user starts clean"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
+
+def close_all():
+    """Close every connection this process opened (app shutdown)"""
+    with _all_lock:
+        for conn in _all_connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        _all_connections.clear()
+
+
+def _after_fork():
+    # Connections must never cross a fork - drop the parent's without closing them
+    global _local, _all_lock
+    _local = threading.local()
+    _all_lock = threading.Lock()
+    _all_connections.clear()
+
+
+atexit.register(close_all)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
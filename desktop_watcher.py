@@ -0,0 +1,206 @@
+# Background import of audio files dropped into a watched folder
+# One watcher per machine (the gunicorn worker that wins an flock) scans
+# DESKTOP_IMPORT_DIR whenever inotify reports a change - or every
+# DESKTOP_POLL_SECONDS where inotify isn't available - and compares each
+# file's size and mtime with the desktop_files index, so an unchanged folder
+# costs one stat per file. New or changed files are hashed and uploaded on a
+# small thread pool; audio already in the inbox (by content_hash) is indexed
+# without uploading.
+
+import os
+import time
+import fcntl
+import select
+import tempfile
+import threading
+import sqlite3
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import db
+import storage
+import transfer
+from disk_cache import file_fingerprint
+
+# os.pathsep-separated folders to watch; set it empty to turn the importer off
+WATCH_DIRS = [os.path.expanduser(path) for path in
+              os.environ.get('DESKTOP_IMPORT_DIR', '~/Desktop').split(os.pathsep) if path]
+POLL_SECONDS = float(os.environ.get('DESKTOP_POLL_SECONDS') or 30)
+UPLOAD_CONCURRENCY = int(os.environ.get('DESKTOP_UPLOAD_CONCURRENCY') or 2)
+# Files modified more recently than this may still be being written - picked up on a later scan
+SETTLE_SECONDS = 2
+CONTENT_TYPES = {'.mp3': 'audio/mpeg', '.wav': 'audio/wav', '.m4a': 'audio/mp4'}
+LOCK_PATH = os.path.join(tempfile.gettempdir(), 'team-inbox-desktop-watcher.lock')
+
+# inotify(7) event bits: a file finished writing, or was moved/renamed into the folder
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+_watcher_pid = None
+_watcher_lock = threading.Lock()
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def _inotify_fd(dirs):
+    """An inotify descriptor watching dirs, or None where inotify isn't available (macOS, old kernels)"""
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for path in dirs:
+        if libc.inotify_add_watch(fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+def _import_file(path, size, mtime_ns, legacy_names):
+    """Runs on the upload pool: hash, dedupe, upload and index one file"""
+    filename = os.path.basename(path)
+    content_key = f"Desktop: {filename}"
+    conn = db.get_db()
+    c = conn.cursor()
+    try:
+        content_hash = file_fingerprint(path)
+        c.execute("SELECT id FROM inbox WHERE content_hash = ?", (content_hash,))
+        row = c.fetchone()
+        inbox_id = row[0] if row else legacy_names.get(content_key)
+        if inbox_id is None:
+            s3_client = storage.get_s3_client()
+            aws_bucket = storage.bucket_name()
+            date_folder = datetime.now().strftime('%Y-%m-%d')
+            s3_key = f"recordings/{date_folder}/desktop_{content_hash[7:19]}_{filename}"
+            # Stream from disk instead of reading the whole file into memory
+            transfer.upload_path_to_s3(s3_client, path, aws_bucket, s3_key,
+                                       CONTENT_TYPES[os.path.splitext(filename)[1].lower()])
+            # A copy of the same audio may finish uploading first; if that row is deleted before
+            # it's read back, insert ours after all
+            for attempt in range(3):
+                c.execute("""INSERT OR IGNORE INTO inbox
+                             (sender_name, sender_phone, content_type, title, content, s3_url, date_folder, content_hash)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                          ('Desktop Import', 'LOCAL', 'voice', content_key, content_key, storage.object_url(aws_bucket, s3_key), date_folder,
+                           content_hash))
+                if c.rowcount:
+                    inbox_id = c.lastrowid
+                    print(f"✅ Auto-imported: {filename}")
+                    break
+                c.execute("SELECT id FROM inbox WHERE content_hash = ?", (content_hash,))
+                row = c.fetchone()
+                if row:
+                    # Keep the copy that landed first
+                    inbox_id = row[0]
+                    s3_client.delete_object(Bucket=aws_bucket, Key=s3_key)
+                    break
+            else:
+                raise sqlite3.IntegrityError(f"Insert ignored but no inbox row has {content_hash}")
+        c.execute("""INSERT OR REPLACE INTO desktop_files (path, size, mtime_ns, content_hash, inbox_id, error)
+                     VALUES (?, ?, ?, ?, ?, NULL)""", (path, size, mtime_ns, content_hash, inbox_id))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Import failed {filename}: {e}")
+        # No size/mtime recorded, so the next scan tries again
+        c.execute("""INSERT OR REPLACE INTO desktop_files (path, size, mtime_ns, error)
+                     VALUES (?, NULL, NULL, ?)""", (path, f"{type(e).__name__}: {str(e)}"))
+        conn.commit()
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(path)
+
+
+def scan(conn, pool, legacy_names):
+    """Queue every new or changed audio file in the watched folders. Returns how many were queued."""
+    c = conn.cursor()
+    c.execute("SELECT path, size, mtime_ns FROM desktop_files")
+    indexed = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+    settled_before = time.time() - SETTLE_SECONDS
+    queued = 0
+    for directory in WATCH_DIRS:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() not in CONTENT_TYPES or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if indexed.get(entry.path) == (stat.st_size, stat.st_mtime_ns) or stat.st_mtime > settled_before:
+                continue
+            with _in_flight_lock:
+                if entry.path in _in_flight:
+                    continue
+                _in_flight.add(entry.path)
+            # Name matches only count for files the index has never seen; a changed file is new audio
+            pool.submit(_import_file, entry.path, stat.st_size, stat.st_mtime_ns,
+                        {} if entry.path in indexed else legacy_names)
+            queued += 1
+    return queued
+
+
+def _watch():
+    # Only one process imports; the others wait here in case the owner exits
+    lock_file = open(LOCK_PATH, 'a')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+    conn = db.connect()
+    # Files imported by name before the index existed - index them instead of uploading them again
+    c = conn.cursor()
+    c.execute("SELECT content, MIN(id) FROM inbox WHERE sender_name = 'Desktop Import' GROUP BY content")
+    legacy_names = {row[0]: row[1] for row in c.fetchall()}
+
+    fd = _inotify_fd([path for path in WATCH_DIRS if os.path.isdir(path)])
+    print(f"📁 Watching {', '.join(WATCH_DIRS)} for audio ({'inotify' if fd is not None else 'polling'}, "
+          f"pid {os.getpid()})")
+    pool = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix='desktop-upload')
+    while True:
+        try:
+            queued = scan(conn, pool, legacy_names)
+            if queued:
+                print(f"📁 Queued {queued} desktop files for import")
+        except Exception as e:
+            print(f"❌ Desktop watcher error: {e}")
+        if fd is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        # Wake on the next event (or after POLL_SECONDS, to catch files that were still settling)
+        readable, _, _ = select.select([fd], [], [], POLL_SECONDS)
+        if readable:
+            time.sleep(SETTLE_SECONDS)
+            try:
+                while os.read(fd, 64 * 1024):
+                    pass
+            except BlockingIOError:
+                pass
+
+
+def start():
+    """Start the watcher thread in this process (once per pid) if there is anything to watch"""
+    global _watcher_pid
+    with _watcher_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+        dirs = [path for path in WATCH_DIRS if os.path.isdir(path)]
+        if not dirs:
+            return
+        if not storage.has_credentials():
+            print("⚠️  Desktop import disabled: missing AWS credentials")
+            return
+        threading.Thread(target=_watch, name='desktop-watcher', daemon=True).start()
+
+
+def _after_fork():
+    global _watcher_lock, _in_flight_lock, _watcher_pid
+    _watcher_lock = threading.Lock()
+    _in_flight_lock = threading.Lock()
+    _watcher_pid = None
+    _in_flight.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,154 @@
+# Size-bounded file cache shared by every process on the box
+# Entries are files named after a hash of their key; a file's mtime is its
+# last use, and the least recently used files are removed once the cache
+# passes its size budget. Used by audio_cache.py (source audio) and
+# pcm_cache.py (decoded PCM).
+
+import os
+import time
+import fcntl
+import hashlib
+import tempfile
+import analysis_cache
+
+# Fills lock one of this many stripe files (by key hash) so lock files don't pile up per key
+LOCK_STRIPES = 64
+
+
+def file_fingerprint(path):
+    """'sha256:...' of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return 'sha256:' + digest.hexdigest()
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class DiskCache:
+    def __init__(self, directory, max_bytes, name):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Hit/miss counters are kept under this name in cache_stats
+        self.name = name
+
+    def _path_for(self, key, suffix=''):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + suffix)
+
+    def _lock_path(self, key):
+        stripe = int(hashlib.sha256(key.encode()).hexdigest(), 16) % LOCK_STRIPES
+        return os.path.join(self.directory, 'locks', f'{stripe}.lock')
+
+    def fetch(self, key, fill, suffix=''):
+        """Path of the cached file for `key`, calling fill(path) to create it on a miss.
+
+        fill writes the object to the path it's given. It runs at most once per key
+        at a time across all processes (others wait and then reuse the result), and
+        the finished file is moved into place atomically, so readers never see a
+        partial write. Don't delete the returned path.
+        """
+        path = self._path_for(key, suffix)
+        if _touch(path):
+            analysis_cache.record_lookup(self.name, True)
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(os.path.dirname(self._lock_path(key)), exist_ok=True)
+        with open(self._lock_path(key), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Someone else may have filled it while we waited for the lock
+                if _touch(path):
+                    analysis_cache.record_lookup(self.name, True)
+                    return path
+
+                analysis_cache.record_lookup(self.name, False)
+                fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.partial')
+                os.close(fd)
+                try:
+                    fill(partial_path)
+                    os.replace(partial_path, path)
+                except Exception:
+                    os.unlink(partial_path)
+                    raise
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self.evict()
+        return path
+
+    def store(self, key, source_path, suffix=''):
+        """Move an already-written file into the cache under `key`. Returns the cached path."""
+        path = self._path_for(key, suffix)
+        if _touch(path):
+            os.unlink(source_path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source_path, path)
+        except OSError:
+            # Different filesystem (temp dir elsewhere) - copy via a partial file in the cache dir
+            import shutil
+            fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.partial')
+            os.close(fd)
+            shutil.move(source_path, partial_path)
+            os.replace(partial_path, path)
+        self.evict()
+        return path
+
+    def _entries(self):
+        """(mtime, size, path) of every cached file"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir() or shard.name == 'locks':
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith('.partial'):
+                    # Left behind by a process that died mid-fill
+                    if stat.st_mtime < time.time() - 3600:
+                        os.unlink(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self, max_bytes=None):
+        """Remove least recently used files until the cache fits in max_bytes. Returns the count removed."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self._entries()
+        excess = sum(size for _, size, _ in entries) - max_bytes
+        removed = 0
+        for _, size, path in sorted(entries):
+            if excess <= 0:
+                break
+            try:
+                # Processes that already opened (or mmapped) the file keep reading it after the unlink
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            excess -= size
+        return removed
+
+    def usage(self):
+        entries = self._entries()
+        return {
+            'dir': self.directory,
+            'entries': len(entries),
+            'size_bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'oldest_use': time.ctime(min(mtime for mtime, _, _ in entries)) if entries else None
+        }
@@ -0,0 +1,186 @@
+# Process pool for CPU-heavy audio work (librosa, pydub)
+# Request handlers submit a task and return straight away; the work runs in
+# separate processes so a long pitch shift can't hold a gunicorn thread or
+# the GIL. Task state lives in the dsp_tasks table, so whichever gunicorn
+# worker receives the poll can answer it.
+
+import os
+import json
+import time
+import signal
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import db
+import jobs
+
+# Each gunicorn worker (WEB_CONCURRENCY of them) owns a pool, so split the cores between them
+WORKERS = int(os.environ.get('DSP_WORKERS') or 0) or max(1, (os.cpu_count() or 2) // int(os.environ.get('WEB_CONCURRENCY', 2)))
+# Tasks a process accepts (running + waiting) before submissions are refused with 429
+MAX_PENDING = int(os.environ.get('DSP_MAX_PENDING') or WORKERS * 4)
+TIMEOUT_SECONDS = int(os.environ.get('DSP_TIMEOUT_SECONDS', 300))
+RETRY_AFTER_SECONDS = 5
+# Finished tasks are kept this long for polling
+KEEP_SECONDS = 24 * 3600
+
+_pool = None
+_pool_pid = None
+_pending = 0
+_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    """Raised by submit() when this process already has MAX_PENDING tasks"""
+
+    def __init__(self, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(f"DSP queue is full ({MAX_PENDING} tasks pending)")
+        self.retry_after = retry_after
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        # spawn, not fork: forking a threaded gunicorn worker can copy held locks into the child
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _run(task_id, func, kwargs, timeout):
+    """Runs inside a pool process: mark the task running, then call func under a timeout"""
+    conn = db.connect()
+    try:
+        conn.execute("UPDATE dsp_tasks SET status = 'running', started_at = ? WHERE id = ?", (time.time(), task_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+    def on_alarm(signum, frame):
+        raise TaskTimeout(f"Task exceeded {timeout}s")
+
+    signal.signal(signal.SIGALRM, on_alarm)
+    signal.alarm(timeout)
+    try:
+        return func(**kwargs)
+    finally:
+        signal.alarm(0)
+
+
+def _finish(task_id, status, result=None, error=None):
+    conn = db.connect()
+    try:
+        conn.execute('''UPDATE dsp_tasks SET status = ?, result = ?, error = ?, finished_at = ?
+                        WHERE id = ?''',
+                     (status, json.dumps(result) if result is not None else None, error, time.time(), task_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _done(task_id, future):
+    global _pending
+    with _lock:
+        _pending -= 1
+    try:
+        _finish(task_id, 'done', result=future.result())
+    except TaskTimeout as e:
+        print(f"⏱️ DSP task {task_id} timed out")
+        _finish(task_id, 'timeout', error=str(e))
+    except Exception as e:
+        print(f"❌ DSP task {task_id} failed: {e}")
+        traceback.print_exception(type(e), e, e.__traceback__)
+        _finish(task_id, 'failed', error=f"{type(e).__name__}: {str(e)}")
+
+
+def submit(kind, func, timeout=None, **kwargs):
+    """Queue func(**kwargs) on the pool and return the task id.
+
+    func must be a module-level function in a module that doesn't import app
+    (pool processes import it fresh). Its return value must be JSON-serializable.
+    Raises QueueFull when this process already has MAX_PENDING tasks.
+    """
+    return _submit(kind, func, timeout, kwargs)[0]
+
+
+def call(kind, func, timeout=None, **kwargs):
+    """Run func(**kwargs) on the pool and wait for its result.
+
+    For background job threads: they may block, but the CPU work belongs in
+    the pool, not in the gunicorn worker. Raises QueueFull, TaskTimeout or
+    whatever func raised.
+    """
+    return _submit(kind, func, timeout, kwargs)[1].result()
+
+
+def _submit(kind, func, timeout, kwargs):
+    global _pending, _pool
+    with _lock:
+        if _pending >= MAX_PENDING:
+            raise QueueFull()
+        _pending += 1
+
+    try:
+        conn = db.get_db()
+        c = conn.cursor()
+        c.execute("DELETE FROM dsp_tasks WHERE finished_at < ?", (time.time() - KEEP_SECONDS,))
+        c.execute('''INSERT INTO dsp_tasks (kind, params, status, owner_pid, submitted_at)
+                     VALUES (?, ?, 'queued', ?, ?)''',
+                  (kind, json.dumps(kwargs), os.getpid(), time.time()))
+        task_id = c.lastrowid
+        conn.commit()
+
+        args = (_run, task_id, func, kwargs, timeout or TIMEOUT_SECONDS)
+        with _lock:
+            try:
+                future = _get_pool().submit(*args)
+            except BrokenProcessPool:
+                # A pool process died (e.g. OOM-killed) - start a fresh pool
+                _pool = None
+                future = _get_pool().submit(*args)
+    except Exception:
+        with _lock:
+            _pending -= 1
+        raise
+
+    future.add_done_callback(lambda f: _done(task_id, f))
+    return task_id, future
+
+
+def get_task(task_id, conn=None):
+    """Task state as a dict (with the decoded result once done), or None"""
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute('''SELECT id, kind, status, result, error, owner_pid, submitted_at, started_at, finished_at
+                 FROM dsp_tasks WHERE id = ?''', (task_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    task = dict(row)
+    if task['status'] in ('queued', 'running') and not jobs._pid_alive(task['owner_pid']):
+        # The gunicorn worker that owned the pool exited, taking the task with it
+        _finish(task_id, 'failed', error='Worker process exited before the task finished')
+        return get_task(task_id, conn)
+    task['result'] = json.loads(task['result']) if task['result'] else None
+    return task
+
+
+def pool_status():
+    return {'workers': WORKERS, 'pending': _pending, 'max_pending': MAX_PENDING, 'timeout_seconds': TIMEOUT_SECONDS}
+
+
+def _after_fork():
+    global _pool, _pool_pid, _pending, _lock
+    _lock = threading.Lock()
+    _pool = None
+    _pool_pid = None
+    _pending = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,113 @@
+# Inbox change notifications for Server-Sent Events
+# One watcher thread per process tails the inbox_changes log (written by
+# triggers, so it sees commits from every gunicorn worker) and wakes the
+# waiting SSE streams. N open tabs cost one tiny query per interval, not N.
+# The same thread trims the log to the replay window every PRUNE_INTERVAL;
+# a client whose cursor falls before the window reloads instead of syncing.
+
+import os
+import time
+import threading
+import db
+
+POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 1.0))
+# How far back /api/inbox/sync and the stream can replay changes
+RETENTION_SECONDS = int(os.environ.get('INBOX_CHANGES_RETENTION_SECONDS') or 7 * 24 * 3600)
+PRUNE_INTERVAL = 3600
+
+OLDEST_CHANGE_SQL = "SELECT COALESCE(MIN(seq), 0) FROM inbox_changes"
+
+_condition = threading.Condition()
+_latest_seq = 0
+_watcher_pid = None
+_watcher_lock = threading.Lock()
+
+
+def _read_latest_seq(conn):
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(seq), 0) FROM inbox_changes")
+    return c.fetchone()[0]
+
+
+def prune_changes(conn, max_age_seconds=None):
+    """Delete change log rows older than the replay window. Returns the count removed.
+
+    The latest row is always kept so MAX(seq) - every client's cursor - never goes back.
+    Rows are in changed_at order, so finding the first one inside the window walks
+    only the rows about to be deleted.
+    """
+    max_age_seconds = RETENTION_SECONDS if max_age_seconds is None else max_age_seconds
+    c = conn.cursor()
+    c.execute('''DELETE FROM inbox_changes WHERE seq < COALESCE(
+                     (SELECT seq FROM inbox_changes WHERE changed_at >= datetime('now', ?) ORDER BY seq LIMIT 1),
+                     (SELECT MAX(seq) FROM inbox_changes))''', (f'-{int(max_age_seconds)} seconds',))
+    pruned = c.rowcount
+    conn.commit()
+    return pruned
+
+
+def oldest_seq(conn):
+    """Sequence number of the oldest change still in the log (0 if empty)"""
+    c = conn.cursor()
+    c.execute(OLDEST_CHANGE_SQL)
+    return c.fetchone()[0]
+
+
+def replayable(conn, since):
+    """Whether every change after cursor `since` is still in the log"""
+    return since <= 0 or since >= oldest_seq(conn) - 1
+
+
+def _watch():
+    global _latest_seq
+    conn = db.connect()
+    last_prune = 0
+    while True:
+        try:
+            seq = _read_latest_seq(conn)
+            if seq != _latest_seq:
+                with _condition:
+                    _latest_seq = seq
+                    _condition.notify_all()
+            if time.time() - last_prune > PRUNE_INTERVAL:
+                last_prune = time.time()
+                pruned = prune_changes(conn)
+                if pruned:
+                    print(f"🧹 Pruned {pruned} inbox changes older than {RETENTION_SECONDS}s")
+        except Exception as e:
+            print(f"❌ Inbox change watcher error: {e}")
+        time.sleep(POLL_INTERVAL)
+
+
+def start_watcher():
+    """Start the change watcher thread in this process (once per pid)"""
+    global _watcher_pid, _latest_seq
+    with _watcher_lock:
+        if _watcher_pid == os.getpid():
+            return
+        conn = db.connect()
+        try:
+            _latest_seq = _read_latest_seq(conn)
+        finally:
+            conn.close()
+        threading.Thread(target=_watch, name='inbox-change-watcher', daemon=True).start()
+        _watcher_pid = os.getpid()
+
+
+def wait_for_change(last_seq, timeout):
+    """Block until the change log moves past `last_seq` or `timeout` elapses. Returns the latest seq."""
+    start_watcher()
+    with _condition:
+        _condition.wait_for(lambda: _latest_seq > last_seq, timeout=timeout)
+        return _latest_seq
+
+
+def _after_fork():
+    global _condition, _watcher_lock, _watcher_pid
+    _condition = threading.Condition()
+    _watcher_lock = threading.Lock()
+    _watcher_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
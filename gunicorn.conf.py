@@ -1,7 +1,13 @@
 # Gunicorn configuration for production
+import os
+
 bind = "0.0.0.0:8080"
-workers = 2
-worker_class = "sync"
+# dsp.py reads the same variable to split CPU cores between the workers' DSP pools
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threaded workers: a long-lived SSE stream (/api/inbox/stream) holds a thread, not a whole worker
+# (app.py reads GUNICORN_THREADS too, to size its cap on open streams)
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -0,0 +1,128 @@
+# Ingest event log (the ingest_events table)
+# What happened to each Twilio recording or MMS attachment (queued, not ready
+# yet, uploaded, duplicate, failed), keyed by the Twilio sid and the job id so
+# any worker process can look up one recording's history with an index seek.
+# record() only appends to an in-process buffer; a writer thread flushes it
+# in one transaction every FLUSH_SECONDS (sooner once BATCH_SIZE events are
+# waiting), so reporting an event never adds a commit to a webhook or a job.
+
+import os
+import time
+import atexit
+import threading
+import db
+
+FLUSH_SECONDS = float(os.environ.get('INGEST_EVENTS_FLUSH_SECONDS') or 0.5)
+BATCH_SIZE = 200
+
+_COLUMNS = 'id, created_at, source, sid, job_id, inbox_id, level, event, message'
+# One index seek per key (an OR across both would sort); history() merges the results
+HISTORY_SQL = {key: f"SELECT {_COLUMNS} FROM ingest_events WHERE {key} = ? ORDER BY id DESC LIMIT ?"
+               for key in ('sid', 'job_id')}
+RECENT_ERRORS_SQL = f"SELECT {_COLUMNS} FROM ingest_events WHERE level = 'error' ORDER BY id DESC LIMIT ?"
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_flush_wanted = threading.Event()
+_writer_pid = None
+
+
+def record(event, message=None, level='info', sid=None, job_id=None, inbox_id=None, source=None):
+    """Queue an event for the next batched write"""
+    _start_writer()
+    with _buffer_lock:
+        _buffer.append((time.time(), source, sid, job_id, inbox_id, level, event, message))
+        full = len(_buffer) >= BATCH_SIZE
+    if full:
+        _flush_wanted.set()
+
+
+def flush(conn=None):
+    """Write everything buffered in this process in one transaction. Returns how many events were written."""
+    with _buffer_lock:
+        batch = _buffer[:]
+        _buffer.clear()
+    if not batch:
+        return 0
+    own_conn = conn is None
+    if own_conn:
+        conn = db.connect()
+    try:
+        conn.executemany('''INSERT INTO ingest_events (created_at, source, sid, job_id, inbox_id, level, event, message)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        # Keep them for the next flush rather than losing them
+        with _buffer_lock:
+            _buffer[:0] = batch
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return len(batch)
+
+
+def history(sid=None, job_id=None, limit=50, conn=None):
+    """Events for one sid and/or job, oldest first (this process's buffered ones included)"""
+    flush()
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    events = {}
+    for key, value in (('sid', sid), ('job_id', job_id)):
+        if value:
+            c.execute(HISTORY_SQL[key], (value, limit))
+            events.update((row['id'], dict(row)) for row in c.fetchall())
+    return [events[event_id] for event_id in sorted(events)[-limit:]]
+
+
+def recent_errors(limit=20, conn=None):
+    """Latest error events across every source, newest first"""
+    flush()
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute(RECENT_ERRORS_SQL, (limit,))
+    return [dict(row) for row in c.fetchall()]
+
+
+def _write_loop():
+    conn = db.connect()
+    while True:
+        _flush_wanted.wait(FLUSH_SECONDS)
+        _flush_wanted.clear()
+        try:
+            flush(conn)
+        except Exception as e:
+            print(f"❌ Ingest event writer error: {e}")
+
+
+def _start_writer():
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _buffer_lock:
+        if _writer_pid == os.getpid():
+            return
+        threading.Thread(target=_write_loop, name='ingest-event-writer', daemon=True).start()
+        _writer_pid = os.getpid()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception as e:
+        print(f"❌ Could not write {len(_buffer)} ingest events at exit: {e}")
+
+
+def _after_fork():
+    # The parent's buffered events are the parent's to write
+    global _buffer_lock, _flush_wanted, _writer_pid
+    _buffer_lock = threading.Lock()
+    _flush_wanted = threading.Event()
+    _writer_pid = None
+    _buffer.clear()
+
+
+atexit.register(_flush_at_exit)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,297 @@
+# Background job queue backed by SQLite
+# Jobs live in the `jobs` table so they survive worker restarts and are
+# shared by every gunicorn worker process.
+
+import os
+import json
+import time
+import threading
+import traceback
+import db
+
+# How long a claimed job may stay 'running' before another worker assumes
+# its owner died and puts it back on the queue
+LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 600))
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+
+# Latest job for an inbox item (queries.py checks its plan)
+LATEST_JOB_SQL = '''SELECT id, kind, status, attempts, max_attempts, run_after, last_error, result, updated_at
+                    FROM jobs WHERE inbox_id = ? ORDER BY id DESC LIMIT 1'''
+# Latest job of a kind for a payload (trigger-queued jobs carry their inbox id only in the payload)
+LATEST_PAYLOAD_JOB_SQL = '''SELECT id, status, attempts, max_attempts, last_error FROM jobs
+                            WHERE kind = ? AND payload = ? ORDER BY id DESC LIMIT 1'''
+
+_handlers = {}
+_wakeup = threading.Event()
+_workers = []
+_workers_pid = None
+_workers_lock = threading.Lock()
+_db_path = db.DB_PATH
+
+
+class RetryLater(Exception):
+    """Raised by a handler to reschedule its job without counting it as a crash"""
+
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+def register(kind):
+    """Decorator registering a function as the handler for a job kind"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def _connect(db_path=None):
+    return db.connect(db_path or _db_path)
+
+
+def enqueue(kind, payload, inbox_id=None, max_attempts=5, delay=0, conn=None):
+    """Add a job to the queue and wake the local workers. Returns the job id.
+
+    Pass `conn` to insert inside the caller's transaction (the caller commits).
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = _connect()
+    try:
+        c = conn.cursor()
+        c.execute("""INSERT INTO jobs (kind, payload, inbox_id, max_attempts, run_after)
+                     VALUES (?, ?, ?, ?, ?)""",
+                  (kind, json.dumps(payload), inbox_id, max_attempts, time.time() + delay))
+        job_id = c.lastrowid
+        if own_conn:
+            conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    _wakeup.set()
+    return job_id
+
+
+def set_setting(name, value, conn):
+    """Store a value the job-queueing triggers in migrations.py consult (job_settings), in conn's transaction"""
+    conn.execute("INSERT OR REPLACE INTO job_settings (name, value) VALUES (?, ?)", (name, value))
+
+
+def backoff_delay(attempts, base=3, cap=300):
+    """Exponential backoff: 3s, 6s, 12s, 24s... capped at `cap` seconds"""
+    return min(cap, base * (2 ** max(0, attempts - 1)))
+
+
+def get_job_status(inbox_id, conn=None):
+    """Return the most recent job for an inbox item as a dict, or None"""
+    own_conn = conn is None
+    if own_conn:
+        conn = _connect()
+    try:
+        c = conn.cursor()
+        c.execute(LATEST_JOB_SQL, (inbox_id,))
+        row = c.fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        if job['status'] == 'queued' and job['run_after'] > time.time():
+            job['retry_in'] = round(job['run_after'] - time.time(), 1)
+        return job
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def latest_for_payload(kind, payload, conn):
+    """Most recent job of `kind` with exactly this payload as a dict, or None"""
+    c = conn.cursor()
+    c.execute(LATEST_PAYLOAD_JOB_SQL, (kind, json.dumps(payload)))
+    row = c.fetchone()
+    return dict(row) if row else None
+
+
+def heartbeat(job_id, conn=None):
+    """Renew a running job's lease - call periodically from handlers that can outlive LEASE_SECONDS"""
+    own_conn = conn is None
+    if own_conn:
+        conn = _connect()
+    try:
+        conn.execute("UPDATE jobs SET locked_at = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def recover_stale_jobs(conn=None):
+    """Requeue jobs whose worker died mid-run (lease expired). Returns the count."""
+    own_conn = conn is None
+    if own_conn:
+        conn = _connect()
+    try:
+        c = conn.cursor()
+        c.execute("""UPDATE jobs SET status = 'queued', locked_by = NULL, locked_at = NULL,
+                                    updated_at = CURRENT_TIMESTAMP
+                     WHERE status = 'running' AND locked_at < ?""",
+                  (time.time() - LEASE_SECONDS,))
+        recovered = c.rowcount
+        conn.commit()
+        if recovered:
+            print(f"♻️  Recovered {recovered} in-flight jobs")
+        return recovered
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recover_orphaned_jobs(conn):
+    """Requeue running jobs whose owning process has exited (e.g. a gunicorn worker restart)"""
+    c = conn.cursor()
+    c.execute("SELECT id, locked_by FROM jobs WHERE status = 'running'")
+    orphaned = []
+    for row in c.fetchall():
+        try:
+            pid = int((row['locked_by'] or '').split('-')[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _pid_alive(pid):
+            orphaned.append(row['id'])
+    for job_id in orphaned:
+        c.execute("""UPDATE jobs SET status = 'queued', locked_by = NULL, locked_at = NULL,
+                                    updated_at = CURRENT_TIMESTAMP
+                     WHERE id = ? AND status = 'running'""", (job_id,))
+    conn.commit()
+    if orphaned:
+        print(f"♻️  Requeued {len(orphaned)} jobs left behind by exited workers")
+    return len(orphaned)
+
+
+def _claim_next(conn, worker_id):
+    """Atomically move the next due job from queued to running"""
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute("""SELECT id, kind, payload, attempts, max_attempts, inbox_id FROM jobs
+                     WHERE status = 'queued' AND run_after <= ?
+                     ORDER BY run_after, id LIMIT 1""", (time.time(),))
+        row = c.fetchone()
+        if row:
+            c.execute("""UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                                        locked_by = ?, locked_at = ?, updated_at = CURRENT_TIMESTAMP
+                         WHERE id = ?""", (worker_id, time.time(), row['id']))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row
+
+
+def _finish(conn, job_id, status, error=None, run_after=None, result=None):
+    c = conn.cursor()
+    if result is not None:
+        c.execute("""UPDATE jobs SET status = ?, last_error = ?, result = ?, locked_by = NULL,
+                                    locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                     WHERE id = ?""", (status, error, json.dumps(result), job_id))
+    elif run_after is not None:
+        c.execute("""UPDATE jobs SET status = ?, last_error = ?, run_after = ?, locked_by = NULL,
+                                    locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                     WHERE id = ?""", (status, error, run_after, job_id))
+    else:
+        c.execute("""UPDATE jobs SET status = ?, last_error = ?, locked_by = NULL,
+                                    locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                     WHERE id = ?""", (status, error, job_id))
+    conn.commit()
+
+
+def run_job(conn, row):
+    """Execute one claimed job and record its outcome"""
+    job_id = row['id']
+    attempts = row['attempts'] + 1
+    handler = _handlers.get(row['kind'])
+    if handler is None:
+        _finish(conn, job_id, 'failed', f"No handler registered for {row['kind']}")
+        return
+
+    job = {'id': job_id, 'kind': row['kind'], 'attempts': attempts,
+           'max_attempts': row['max_attempts'], 'inbox_id': row['inbox_id']}
+    try:
+        # Handlers may return a JSON-serializable dict (e.g. transfer stats) to keep with the job
+        result = handler(json.loads(row['payload'] or '{}'), job)
+        _finish(conn, job_id, 'done', result=result)
+    except Exception as e:
+        error_msg = f"{type(e).__name__}: {str(e)}"
+        if attempts < row['max_attempts']:
+            delay = e.delay if isinstance(e, RetryLater) and e.delay else backoff_delay(attempts)
+            print(f"⏳ Job {job_id} ({row['kind']}) attempt {attempts} failed, retrying in {delay}s: {error_msg}")
+            _finish(conn, job_id, 'queued', error_msg, run_after=time.time() + delay)
+        else:
+            print(f"❌ Job {job_id} ({row['kind']}) failed after {attempts} attempts: {error_msg}")
+            if not isinstance(e, RetryLater):
+                traceback.print_exc()
+            _finish(conn, job_id, 'failed', error_msg)
+            on_failure = getattr(handler, 'on_failure', None)
+            if on_failure:
+                try:
+                    on_failure(json.loads(row['payload'] or '{}'), job, error_msg)
+                except Exception:
+                    traceback.print_exc()
+
+
+def _worker_loop(worker_id):
+    conn = _connect()
+    last_recovery = 0
+    while True:
+        try:
+            if time.time() - last_recovery > LEASE_SECONDS / 2:
+                recover_stale_jobs(conn)
+                last_recovery = time.time()
+
+            row = _claim_next(conn, worker_id)
+            if row is None:
+                _wakeup.wait(POLL_INTERVAL)
+                _wakeup.clear()
+                continue
+            run_job(conn, row)
+            # Handlers write through the thread's shared connection - never leave it mid-transaction
+            db.release()
+        except Exception as e:
+            print(f"❌ Job worker {worker_id} error: {e}")
+            traceback.print_exc()
+            time.sleep(POLL_INTERVAL)
+
+
+def start_workers(count=2, db_path=None):
+    """Start `count` daemon worker threads in this process (once per pid)"""
+    global _workers_pid, _db_path
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        if db_path:
+            _db_path = db_path
+
+        # The jobs table itself is created by migrations.py
+        conn = _connect()
+        try:
+            recover_orphaned_jobs(conn)
+        finally:
+            conn.close()
+
+        _workers.clear()
+        for i in range(count):
+            worker_id = f"{os.getpid()}-{i}"
+            t = threading.Thread(target=_worker_loop, args=(worker_id,), name=f"job-worker-{worker_id}", daemon=True)
+            t.start()
+            _workers.append(t)
+        _workers_pid = os.getpid()
+        print(f"👷 Started {count} background job workers (pid {os.getpid()})")
@@ -0,0 +1,485 @@
+# Versioned schema migrations for songs.db
+# Each migration runs once, in order, inside its own transaction, and is
+# recorded in schema_migrations. To change the schema, append a new entry to
+# MIGRATIONS - never edit one that has already shipped.
+
+
+def _baseline(c):
+    """Tables that used to be created by hand in init_db"""
+    c.execute('''CREATE TABLE IF NOT EXISTS songs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  title TEXT,
+                  lyrics TEXT,
+                  notes TEXT,
+                  audio_files TEXT,
+                  voice_notes TEXT,
+                  spliced_file TEXT,
+                  source TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS inbox
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  sender_name TEXT,
+                  sender_phone TEXT,
+                  content_type TEXT,
+                  title TEXT,
+                  content TEXT,
+                  s3_url TEXT,
+                  date_folder TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS projects
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT NOT NULL,
+                  notes TEXT,
+                  lyrics TEXT,
+                  track_count INTEGER DEFAULT 0,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS phrases
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  title TEXT NOT NULL,
+                  content TEXT,
+                  s3_url TEXT,
+                  duration TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS project_items
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  project_id INTEGER NOT NULL,
+                  inbox_id INTEGER NOT NULL,
+                  position INTEGER DEFAULT 0,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (project_id) REFERENCES projects (id),
+                  FOREIGN KEY (inbox_id) REFERENCES inbox (id))''')
+
+    # Background ingest queue
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  kind TEXT NOT NULL,
+                  payload TEXT,
+                  status TEXT DEFAULT 'queued',
+                  attempts INTEGER DEFAULT 0,
+                  max_attempts INTEGER DEFAULT 5,
+                  run_after REAL DEFAULT 0,
+                  last_error TEXT,
+                  result TEXT,
+                  inbox_id INTEGER,
+                  locked_by TEXT,
+                  locked_at REAL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    # Queues created before job results were kept
+    c.execute("PRAGMA table_info(jobs)")
+    if 'result' not in [row[1] for row in c.fetchall()]:
+        c.execute("ALTER TABLE jobs ADD COLUMN result TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_inbox_id ON jobs(inbox_id)")
+
+    # Change log for incremental inbox sync - filled by triggers so every
+    # writer (webhooks, imports, UI edits, other workers) is captured
+    c.execute('''CREATE TABLE IF NOT EXISTS inbox_changes
+                 (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                  inbox_id INTEGER NOT NULL,
+                  op TEXT NOT NULL,
+                  changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inbox_changes_inbox_id ON inbox_changes(inbox_id)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_changes_insert AFTER INSERT ON inbox
+                 BEGIN INSERT INTO inbox_changes (inbox_id, op) VALUES (NEW.id, 'upsert'); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_changes_update AFTER UPDATE ON inbox
+                 BEGIN INSERT INTO inbox_changes (inbox_id, op) VALUES (NEW.id, 'upsert'); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_changes_delete AFTER DELETE ON inbox
+                 BEGIN INSERT INTO inbox_changes (inbox_id, op) VALUES (OLD.id, 'delete'); END''')
+
+
+def _listing_indexes(c):
+    """Indexes matching the listing, filter and lookup queries in app.py"""
+    # Inbox grid: newest first, optionally filtered by sender / type / date folder.
+    # id rides along implicitly (rowid), so ORDER BY created_at DESC, id DESC needs no sort.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inbox_created_at ON inbox(created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inbox_sender_created ON inbox(sender_name, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inbox_type_created ON inbox(content_type, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inbox_date_created ON inbox(date_folder, created_at)")
+    # fix_missing_recording looks rows up by URL
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inbox_s3_url ON inbox(s3_url)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_songs_created_at ON songs(created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_projects_updated_at ON projects(updated_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_phrases_created_at ON phrases(created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_project_items_project_position ON project_items(project_id, position)")
+
+
+# Full-text search: one FTS5 table for every searchable entity. rowid is
+# id * 4 + kind code so triggers can replace or drop a row without a scan.
+SEARCH_KINDS = {'inbox': 0, 'song': 1, 'project': 2, 'phrase': 3}
+
+SEARCH_SOURCES = [
+    # (kind, table, title column, body columns)
+    ('inbox', 'inbox', 'title', ['content']),
+    ('song', 'songs', 'title', ['lyrics', 'notes']),
+    ('project', 'projects', 'name', ['notes', 'lyrics']),
+    ('phrase', 'phrases', 'title', ['content']),
+]
+
+
+def _search_text(columns, row=''):
+    return " || ' ' || ".join(f"COALESCE({row}{column}, '')" for column in columns)
+
+
+def _search_index(c):
+    """FTS5 index over inbox, songs, projects and phrases, kept in sync by triggers"""
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5
+                 (kind UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2')''')
+    # Title matches count for more than body matches (kind column is never searched)
+    c.execute("INSERT INTO search_index (search_index, rank) VALUES ('rank', 'bm25(0.0, 10.0, 1.0)')")
+
+    for kind, table, title, body in SEARCH_SOURCES:
+        code = SEARCH_KINDS[kind]
+        insert = f'''INSERT INTO search_index (rowid, kind, title, body)
+                     VALUES (NEW.id * 4 + {code}, '{kind}', {_search_text([title], 'NEW.')}, {_search_text(body, 'NEW.')});'''
+        delete = f"DELETE FROM search_index WHERE rowid = OLD.id * 4 + {code};"
+
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END")
+        columns = ', '.join([title] + body)
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {columns} ON {table} "
+                  f"BEGIN {delete} {insert} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END")
+
+        c.execute(f'''INSERT INTO search_index (rowid, kind, title, body)
+                      SELECT id * 4 + {code}, '{kind}', {_search_text([title])}, {_search_text(body)} FROM {table}''')
+
+
+def _analysis_cache(c):
+    """Stored /api/analyze-audio results plus hit/miss counters (see analysis_cache.py)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_cache
+                 (cache_key TEXT PRIMARY KEY,
+                  fingerprint TEXT NOT NULL,
+                  analysis_type TEXT,
+                  result TEXT NOT NULL,
+                  size_bytes INTEGER NOT NULL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  last_used_at REAL NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache(last_used_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_fingerprint ON analysis_cache(fingerprint)")
+    c.execute('''CREATE TABLE IF NOT EXISTS cache_stats
+                 (name TEXT PRIMARY KEY,
+                  hits INTEGER DEFAULT 0,
+                  misses INTEGER DEFAULT 0)''')
+
+
+def _dsp_tasks(c):
+    """State of work queued on the DSP process pool (see dsp.py)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS dsp_tasks
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  kind TEXT NOT NULL,
+                  params TEXT,
+                  status TEXT DEFAULT 'queued',
+                  result TEXT,
+                  error TEXT,
+                  owner_pid INTEGER,
+                  submitted_at REAL,
+                  started_at REAL,
+                  finished_at REAL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dsp_tasks_finished_at ON dsp_tasks(finished_at)")
+
+
+def _waveforms(c):
+    """Precomputed waveform peaks per inbox item, queued for every voice row that gets audio"""
+    c.execute('''CREATE TABLE IF NOT EXISTS waveforms
+                 (inbox_id INTEGER PRIMARY KEY,
+                  sample_rate INTEGER,
+                  duration REAL,
+                  levels TEXT,
+                  peaks BLOB,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    # Payload matches json.dumps({'inbox_id': id}) so app code can spot an already-queued job
+    queue_job = '''INSERT INTO jobs (kind, payload, max_attempts)
+                   VALUES ('waveform', '{"inbox_id": ' || NEW.id || '}', 3);'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inbox_waveform_insert AFTER INSERT ON inbox
+                  WHEN NEW.content_type = 'voice' AND NEW.s3_url IS NOT NULL
+                  BEGIN {queue_job} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inbox_waveform_update AFTER UPDATE OF s3_url ON inbox
+                  WHEN NEW.content_type = 'voice' AND OLD.s3_url IS NULL AND NEW.s3_url IS NOT NULL
+                  BEGIN {queue_job} END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_waveform_delete AFTER DELETE ON inbox
+                 BEGIN DELETE FROM waveforms WHERE inbox_id = OLD.id; END''')
+
+
+def _renditions(c):
+    """Compact playback renditions of inbox audio, queued like waveforms"""
+    c.execute('''CREATE TABLE IF NOT EXISTS renditions
+                 (inbox_id INTEGER PRIMARY KEY,
+                  original_key TEXT,
+                  original_bytes INTEGER,
+                  original_duration REAL,
+                  rendition_key TEXT,
+                  content_type TEXT,
+                  rendition_bytes INTEGER,
+                  rendition_duration REAL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    queue_job = '''INSERT INTO jobs (kind, payload, max_attempts)
+                   VALUES ('rendition', '{"inbox_id": ' || NEW.id || '}', 3);'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inbox_rendition_insert AFTER INSERT ON inbox
+                  WHEN NEW.content_type = 'voice' AND NEW.s3_url IS NOT NULL
+                  BEGIN {queue_job} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inbox_rendition_update AFTER UPDATE OF s3_url ON inbox
+                  WHEN NEW.content_type = 'voice' AND OLD.s3_url IS NULL AND NEW.s3_url IS NOT NULL
+                  BEGIN {queue_job} END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_rendition_delete AFTER DELETE ON inbox
+                 BEGIN DELETE FROM renditions WHERE inbox_id = OLD.id; END''')
+    # A new rendition changes the item's play_url, so tell syncing clients about it
+    c.execute('''CREATE TRIGGER IF NOT EXISTS renditions_changes_insert AFTER INSERT ON renditions
+                 BEGIN INSERT INTO inbox_changes (inbox_id, op) VALUES (NEW.inbox_id, 'upsert'); END''')
+
+
+def _renders(c):
+    """Content-keyed render index, plus transpose pre-render jobs for new voice notes"""
+    c.execute('''CREATE TABLE IF NOT EXISTS renders
+                 (cache_key TEXT PRIMARY KEY,
+                  kind TEXT NOT NULL,
+                  location TEXT NOT NULL,
+                  content_type TEXT,
+                  size_bytes INTEGER,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  last_used_at REAL)''')
+    # The handler is a no-op unless TRANSPOSE_PRERENDER_SEMITONES is set
+    queue_job = '''INSERT INTO jobs (kind, payload, max_attempts)
+                   VALUES ('transpose_prerender', '{"inbox_id": ' || NEW.id || '}', 2);'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inbox_prerender_insert AFTER INSERT ON inbox
+                  WHEN NEW.content_type = 'voice' AND NEW.s3_url IS NOT NULL
+                  BEGIN {queue_job} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inbox_prerender_update AFTER UPDATE OF s3_url ON inbox
+                  WHEN NEW.content_type = 'voice' AND OLD.s3_url IS NULL AND NEW.s3_url IS NOT NULL
+                  BEGIN {queue_job} END''')
+
+
+def _project_mixdowns(c):
+    """Current mixdown of each project, dropped by triggers whenever what it was made from changes"""
+    c.execute('''CREATE TABLE IF NOT EXISTS project_mixdowns
+                 (project_id INTEGER PRIMARY KEY,
+                  render_key TEXT NOT NULL,
+                  location TEXT NOT NULL,
+                  duration REAL,
+                  cues TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    # Items added, removed or moved
+    c.execute('''CREATE TRIGGER IF NOT EXISTS project_items_mixdown_insert AFTER INSERT ON project_items
+                 BEGIN DELETE FROM project_mixdowns WHERE project_id = NEW.project_id; END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS project_items_mixdown_delete AFTER DELETE ON project_items
+                 BEGIN DELETE FROM project_mixdowns WHERE project_id = OLD.project_id; END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS project_items_mixdown_update
+                 AFTER UPDATE OF project_id, inbox_id, position ON project_items
+                 BEGIN DELETE FROM project_mixdowns WHERE project_id IN (OLD.project_id, NEW.project_id); END''')
+    # An item's audio arriving, changing or going away
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_mixdown_update AFTER UPDATE OF s3_url ON inbox
+                 BEGIN DELETE FROM project_mixdowns
+                       WHERE project_id IN (SELECT project_id FROM project_items WHERE inbox_id = NEW.id); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_mixdown_delete AFTER DELETE ON inbox
+                 BEGIN DELETE FROM project_mixdowns
+                       WHERE project_id IN (SELECT project_id FROM project_items WHERE inbox_id = OLD.id); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS projects_mixdown_delete AFTER DELETE ON projects
+                 BEGIN DELETE FROM project_mixdowns WHERE project_id = OLD.id; END''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_project_items_inbox_id ON project_items(inbox_id)")
+
+
+def _zip_imports(c):
+    """Bulk zip imports and the per-member outcome that lets a re-run skip finished files"""
+    c.execute('''CREATE TABLE IF NOT EXISTS zip_imports
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  zip_key TEXT NOT NULL,
+                  status TEXT DEFAULT 'queued',
+                  job_id INTEGER,
+                  total_files INTEGER,
+                  error TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  finished_at TIMESTAMP)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS zip_import_files
+                 (import_id INTEGER NOT NULL,
+                  member TEXT NOT NULL,
+                  status TEXT DEFAULT 'pending',
+                  attempts INTEGER DEFAULT 0,
+                  s3_key TEXT,
+                  inbox_id INTEGER,
+                  bytes INTEGER,
+                  error TEXT,
+                  PRIMARY KEY (import_id, member))''')
+
+
+def _ingest_dedupe(c):
+    """Content hash and Twilio RecordingSid on inbox rows, each unique so re-ingesting can't duplicate"""
+    c.execute("PRAGMA table_info(inbox)")
+    columns = {row[1] for row in c.fetchall()}
+    if 'content_hash' not in columns:
+        c.execute("ALTER TABLE inbox ADD COLUMN content_hash TEXT")
+    if 'recording_sid' not in columns:
+        c.execute("ALTER TABLE inbox ADD COLUMN recording_sid TEXT")
+    # Partial: rows from before hashing (and non-audio rows) stay NULL
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_inbox_content_hash ON inbox(content_hash)
+                 WHERE content_hash IS NOT NULL''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_inbox_recording_sid ON inbox(recording_sid)
+                 WHERE recording_sid IS NOT NULL''')
+
+
+def _desktop_files(c):
+    """Size/mtime index of the folders desktop_watcher.py imports from"""
+    c.execute('''CREATE TABLE IF NOT EXISTS desktop_files
+                 (path TEXT PRIMARY KEY,
+                  size INTEGER,
+                  mtime_ns INTEGER,
+                  content_hash TEXT,
+                  inbox_id INTEGER,
+                  error TEXT,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+
+def _canonical_s3_urls(c):
+    """Store object URLs, not presigned ones - storage.presign signs them when they're served"""
+    # Dropping the query string of a presigned URL leaves the plain object URL
+    for table in ('inbox', 'phrases'):
+        c.execute(f'''UPDATE {table} SET s3_url = substr(s3_url, 1, instr(s3_url, '?') - 1)
+                      WHERE s3_url LIKE 'https://%amazonaws.com/%?%' ''')
+
+
+def _ingest_events(c):
+    """Ingest event log (ingest_events.py), replacing the error rows upload_to_s3 wrote into inbox"""
+    c.execute('''CREATE TABLE IF NOT EXISTS ingest_events
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  created_at REAL NOT NULL,
+                  source TEXT,
+                  sid TEXT,
+                  job_id INTEGER,
+                  inbox_id INTEGER,
+                  level TEXT NOT NULL DEFAULT 'info',
+                  event TEXT NOT NULL,
+                  message TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ingest_events_sid ON ingest_events(sid) WHERE sid IS NOT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ingest_events_job ON ingest_events(job_id) WHERE job_id IS NOT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ingest_events_level ON ingest_events(level, id)")
+    # Move the old 'Last Error' row (id 99999) and the System/DEBUG upload errors out of the inbox
+    old_errors = '''FROM inbox WHERE content_type = 'error' AND
+                    ((id = 99999 AND sender_name = 'SYSTEM') OR (sender_name = 'System' AND sender_phone = 'DEBUG'))'''
+    c.execute(f'''INSERT INTO ingest_events (created_at, source, level, event, message)
+                  SELECT COALESCE(CAST(strftime('%s', created_at) AS REAL), 0), 'legacy', 'error', 'upload_failed',
+                         content
+                  {old_errors}''')
+    c.execute(f"DELETE {old_errors}")
+
+
+def _job_settings(c):
+    """Settings the job-queueing triggers read, so they only queue work that is switched on"""
+    c.execute('''CREATE TABLE IF NOT EXISTS job_settings
+                 (name TEXT PRIMARY KEY,
+                  value INTEGER NOT NULL)''')
+    # app.init_db stores TRANSPOSE_PRERENDER_SEMITONES here; with it unset or 0 no pre-render job is queued
+    enabled = "(SELECT value FROM job_settings WHERE name = 'transpose_prerender_semitones') > 0"
+    queue_job = '''INSERT INTO jobs (kind, payload, max_attempts)
+                   VALUES ('transpose_prerender', '{"inbox_id": ' || NEW.id || '}', 2);'''
+    c.execute("DROP TRIGGER IF EXISTS inbox_prerender_insert")
+    c.execute("DROP TRIGGER IF EXISTS inbox_prerender_update")
+    c.execute(f'''CREATE TRIGGER inbox_prerender_insert AFTER INSERT ON inbox
+                  WHEN NEW.content_type = 'voice' AND NEW.s3_url IS NOT NULL AND {enabled}
+                  BEGIN {queue_job} END''')
+    c.execute(f'''CREATE TRIGGER inbox_prerender_update AFTER UPDATE OF s3_url ON inbox
+                  WHEN NEW.content_type = 'voice' AND OLD.s3_url IS NULL AND NEW.s3_url IS NOT NULL AND {enabled}
+                  BEGIN {queue_job} END''')
+
+
+def _jobs_payload_index(c):
+    """Latest-job lookups by kind and payload (waveform state, backfills)"""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_kind_payload ON jobs(kind, payload)")
+
+
+def _message_dedupe(c):
+    """Twilio MessageSid and part index on inbox rows, unique so a redelivered SMS/MMS webhook can't duplicate"""
+    c.execute("PRAGMA table_info(inbox)")
+    columns = {row[1] for row in c.fetchall()}
+    if 'message_sid' not in columns:
+        c.execute("ALTER TABLE inbox ADD COLUMN message_sid TEXT")
+    if 'message_part' not in columns:
+        c.execute("ALTER TABLE inbox ADD COLUMN message_part INTEGER")
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_inbox_message_part ON inbox(message_sid, message_part)
+                 WHERE message_sid IS NOT NULL''')
+
+
+def _mixdown_title_trigger(c):
+    """Mixdowns carry their voice notes' titles as chapters - drop a project's mixdown when one is renamed"""
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inbox_mixdown_title AFTER UPDATE OF title ON inbox
+                 BEGIN DELETE FROM project_mixdowns
+                       WHERE project_id IN (SELECT project_id FROM project_items WHERE inbox_id = NEW.id); END''')
+
+
+# (version, description, function taking a cursor) - append only
+MIGRATIONS = [
+    (1, 'baseline tables, job queue and inbox change log', _baseline),
+    (2, 'listing and lookup indexes', _listing_indexes),
+    (3, 'full-text search index', _search_index),
+    (4, 'audio analysis cache', _analysis_cache),
+    (5, 'DSP task table', _dsp_tasks),
+    (6, 'waveform peaks', _waveforms),
+    (7, 'playback renditions', _renditions),
+    (8, 'render cache and transpose pre-renders', _renders),
+    (9, 'project mixdowns', _project_mixdowns),
+    (10, 'zip import progress', _zip_imports),
+    (11, 'inbox content hash and recording sid', _ingest_dedupe),
+    (12, 'desktop import index', _desktop_files),
+    (13, 'canonical S3 object URLs', _canonical_s3_urls),
+    (14, 'ingest event log', _ingest_events),
+    (15, 'job settings for trigger-queued work', _job_settings),
+    (16, 'job lookup by kind and payload', _jobs_payload_index),
+    (17, 'inbox message sid dedupe', _message_dedupe),
+    (18, 'drop mixdowns when a voice note is renamed', _mixdown_title_trigger),
+]
+
+
+def current_version(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations
+                 (version INTEGER PRIMARY KEY,
+                  description TEXT,
+                  applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.commit()
+    c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return c.fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration. Safe to call on each startup and from several processes."""
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        c = conn.cursor()
+        # IMMEDIATE takes the write lock up front so two workers can't run the same step
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,))
+            if c.fetchone():
+                conn.rollback()
+                continue
+            step(c)
+            c.execute("INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                      (version, description))
+            conn.commit()
+            applied.append(version)
+            print(f"🗄️  Applied migration {version}: {description}")
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN details for a query, plus whether every table access uses an index"""
+    c = conn.cursor()
+    c.execute("EXPLAIN QUERY PLAN " + sql, params)
+    details = [row[3] for row in c.fetchall()]
+    # A bare "SCAN <table>" is a full table scan; "SCAN <table> USING INDEX" walks an index in order.
+    # Temp B-trees mean SQLite had to sort rows itself instead of reading them in index order.
+    full_scans = [d for d in details if d.startswith('SCAN') and 'USING' not in d]
+    sorts = [d for d in details if 'TEMP B-TREE' in d]
+    return {
+        'plan': details,
+        'uses_index': not full_scans and not sorts
+    }
+
@@ -0,0 +1,34 @@
+# Decoded-PCM cache: mono float32 audio at a given sample rate, stored as .npy
+# librosa.load (decode + resample) is often the slowest step of an analysis or
+# transpose. Each (content hash, sample rate) is decoded once; after that DSP
+# starts from a memory-mapped np.load, which costs no decode and no copy.
+# See disk_cache.py for fills, locking and LRU eviction.
+
+import os
+import tempfile
+from disk_cache import DiskCache, file_fingerprint
+
+CACHE_DIR = os.environ.get('PCM_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'team-inbox-pcm')
+MAX_BYTES = int(os.environ.get('PCM_CACHE_MB', 2048)) * 1024 * 1024
+
+_cache = DiskCache(CACHE_DIR, MAX_BYTES, 'pcm')
+
+evict = _cache.evict
+usage = _cache.usage
+
+
+def load(path, sr, fingerprint=None):
+    """Read-only memory-mapped mono float32 samples of `path` at `sr` (decoding only on a miss)"""
+    import numpy as np
+
+    fingerprint = fingerprint or file_fingerprint(path)
+
+    def decode(out_path):
+        import librosa
+        y, _ = librosa.load(path, sr=sr, mono=True)
+        # Write through a file object - np.save would append .npy to a bare path
+        with open(out_path, 'wb') as f:
+            np.save(f, y.astype(np.float32, copy=False))
+
+    cached_path = _cache.fetch(f"{fingerprint}:{sr}", decode, suffix='.npy')
+    return np.load(cached_path, mmap_mode='r')
@@ -0,0 +1,143 @@
+# SQL for the hot read paths
+# app.py runs these and /test/query-plans (plus tests/test_query_plans.py)
+# explains exactly the same strings, so a query that stops being served by an
+# index - a full scan or a temp B-tree sort - shows up in the check instead of
+# only in production latency.
+
+import json
+import base64
+import jobs
+import events
+import ingest_events
+
+# Columns for an inbox item as the page and the APIs see it (latest job status, playback rendition)
+INBOX_ITEM_COLUMNS = '''id, sender_name, sender_phone, content_type, title, content, s3_url, date_folder, created_at,
+    (SELECT status FROM jobs WHERE jobs.inbox_id = inbox.id ORDER BY jobs.id DESC LIMIT 1) AS job_status,
+    (SELECT rendition_key FROM renditions WHERE renditions.inbox_id = inbox.id) AS rendition_key,
+    (SELECT content_type FROM renditions WHERE renditions.inbox_id = inbox.id) AS rendition_type'''
+INBOX_SELECT = f"SELECT {INBOX_ITEM_COLUMNS} FROM inbox"
+SONGS_SELECT = "SELECT * FROM songs"
+PROJECTS_SELECT = "SELECT id, name, notes, lyrics, track_count, created_at, updated_at FROM projects"
+PHRASES_SELECT = "SELECT id, title, content, s3_url, duration, created_at FROM phrases"
+
+LATEST_CHANGE_SQL = "SELECT COALESCE(MAX(seq), 0) FROM inbox_changes"
+# In seq order straight off the primary key; the latest op per item is picked in Python
+# (a GROUP BY inbox_id here sorts the whole window in a temp B-tree)
+CHANGES_BETWEEN_SQL = "SELECT inbox_id, op, seq FROM inbox_changes WHERE seq > ? AND seq <= ? ORDER BY seq"
+
+PROJECT_MIXDOWN_SQL = '''SELECT p.name, m.location, m.duration, m.cues FROM project_mixdowns m
+                         JOIN projects p ON p.id = m.project_id WHERE m.project_id = ?'''
+PROJECT_PLAYLIST_SQL = '''SELECT pi.inbox_id, i.title, i.s3_url FROM project_items pi
+                          JOIN inbox i ON i.id = pi.inbox_id
+                          WHERE pi.project_id = ? AND i.s3_url IS NOT NULL
+                          ORDER BY pi.position, pi.id'''
+
+
+def encode_page_cursor(sort_value, row_id):
+    """Opaque keyset cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+
+def decode_page_cursor(cursor):
+    """Inverse of encode_page_cursor - raises ValueError on a malformed cursor"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError('Invalid page cursor')
+
+
+def keyset_sql(select_sql, where, params, sort_column, limit, cursor=None):
+    """(sql, params) for one newest-first page of select_sql on (sort_column, id), fetching limit + 1 rows"""
+    where = list(where)
+    params = list(params)
+    if cursor:
+        sort_value, row_id = decode_page_cursor(cursor)
+        # First term bounds the index range scan; second breaks ties on equal timestamps
+        where.append(f"{sort_column} <= ? AND ({sort_column} < ? OR id < ?)")
+        params += [sort_value, sort_value, row_id]
+
+    sql = select_sql
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_column} DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
+def keyset_page(c, select_sql, where, params, sort_column, limit, cursor=None):
+    """Run select_sql newest-first on (sort_column, id), one page at a time.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    sql, params = keyset_sql(select_sql, where, params, sort_column, limit, cursor)
+    c.execute(sql, params)
+    rows = c.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_page_cursor(rows[-1][sort_column], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def inbox_filters(args):
+    """SQL conditions for ?sender=, ?content_type=, ?date_from= and ?date_to= (YYYY-MM-DD)"""
+    where, params = [], []
+    if args.get('sender'):
+        where.append("sender_name = ?")
+        params.append(args['sender'])
+    if args.get('content_type'):
+        where.append("content_type = ?")
+        params.append(args['content_type'])
+    # An index on date_folder can't also return rows in created_at order, so the date range
+    # bounds the created_at index instead (a day of slack each side covers date_folder being
+    # local time and created_at UTC) and date_folder is checked exactly on the rows it yields.
+    # The unary + keeps the planner from picking the date_folder index and sorting.
+    if args.get('date_from'):
+        where.append("created_at >= date(?, '-1 day') AND +date_folder >= ?")
+        params += [args['date_from'], args['date_from']]
+    if args.get('date_to'):
+        where.append("created_at < date(?, '+2 days') AND +date_folder <= ?")
+        params += [args['date_to'], args['date_to']]
+    return where, params
+
+
+def hot_queries():
+    """{name: (sql, params)} for every hot read path, built exactly as the handlers build them"""
+    cursor = encode_page_cursor('2025-09-13 12:00:00', 100)
+    dates = {'date_from': '2025-09-01', 'date_to': '2025-09-30'}
+
+    def inbox_page(args, page_cursor=None):
+        return keyset_sql(INBOX_SELECT, *inbox_filters(args), 'created_at', 50, page_cursor)
+
+    queries = {
+        'inbox_page': inbox_page({}),
+        'inbox_next_page': inbox_page({}, cursor),
+        'inbox_by_sender': inbox_page({'sender': 'Asia'}),
+        'inbox_by_type': inbox_page({'content_type': 'voice'}),
+        'inbox_by_date_range': inbox_page(dates),
+        'inbox_by_date_range_next_page': inbox_page(dates, cursor),
+        'inbox_by_date_from': inbox_page({'date_from': '2025-09-01'}),
+        'inbox_by_sender_and_dates': inbox_page({'sender': 'Asia', **dates}),
+        'inbox_by_type_and_dates': inbox_page({'content_type': 'voice', **dates}),
+        'inbox_items_by_id': (f"{INBOX_SELECT} WHERE id IN (?, ?, ?)", (1, 2, 3)),
+        'inbox_latest_change': (LATEST_CHANGE_SQL, ()),
+        'inbox_oldest_change': (events.OLDEST_CHANGE_SQL, ()),
+        'inbox_changes_between': (CHANGES_BETWEEN_SQL, (10, 20)),
+        'inbox_job_status': (jobs.LATEST_JOB_SQL, (1,)),
+        'waveform_job': (jobs.LATEST_PAYLOAD_JOB_SQL, ('waveform', '{"inbox_id": 1}')),
+        'inbox_by_message_part': ("SELECT id FROM inbox WHERE message_sid = ? AND message_part = ?", ('MM123', 0)),
+        'inbox_by_s3_url': ("SELECT id FROM inbox WHERE s3_url = ?", ('https://example.com/x.wav',)),
+        'songs_page': keyset_sql(SONGS_SELECT, [], [], 'created_at', 50),
+        'songs_next_page': keyset_sql(SONGS_SELECT, [], [], 'created_at', 50, cursor),
+        'projects_page': keyset_sql(PROJECTS_SELECT, [], [], 'updated_at', 50),
+        'projects_next_page': keyset_sql(PROJECTS_SELECT, [], [], 'updated_at', 50, cursor),
+        'phrases_page': keyset_sql(PHRASES_SELECT, [], [], 'created_at', 50),
+        'phrases_next_page': keyset_sql(PHRASES_SELECT, [], [], 'created_at', 50, cursor),
+        'project_playlist': (PROJECT_PLAYLIST_SQL, (1,)),
+        'project_mixdown': (PROJECT_MIXDOWN_SQL, (1,)),
+        'ingest_recent_errors': (ingest_events.RECENT_ERRORS_SQL, (20,)),
+    }
+    for key, sql in ingest_events.HISTORY_SQL.items():
+        queries[f"ingest_events_by_{key}"] = (sql, ('RE123', 50))
+    return queries
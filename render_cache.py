@@ -0,0 +1,51 @@
+# Index of rendered audio (transpositions, splices, mixdowns)
+# A render is keyed by what it was made from - content fingerprints of the
+# inputs, the render parameters and the algorithm version - so asking for the
+# same render twice returns the stored file instead of redoing the DSP work.
+# Rows live in songs.db so every process shares them; `location` is an S3
+# key or a local path, depending on the kind.
+
+import json
+import time
+import hashlib
+import db
+import analysis_cache
+
+
+def render_key(kind, inputs, algorithm):
+    """Content key of a render: the kind, its ordered inputs/parameters and the algorithm version"""
+    raw = json.dumps([kind, inputs, algorithm], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get(key, kind, record=True, conn=None):
+    """Stored render for `key` as a dict (its last_used_at refreshed by the next stats flush), or None.
+
+    Counts a hit/miss under `kind` in cache_stats unless record is False
+    (background pre-renders shouldn't skew the hit rate users see).
+    """
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT cache_key, kind, location, content_type, size_bytes FROM renders WHERE cache_key = ?", (key,))
+    row = c.fetchone()
+    if row:
+        analysis_cache.record_use('renders', key)
+    if record:
+        analysis_cache.record_lookup(kind, bool(row))
+    return dict(row) if row else None
+
+
+def put(key, kind, location, content_type, size_bytes, conn=None):
+    conn = conn or db.get_db()
+    conn.execute('''INSERT OR REPLACE INTO renders (cache_key, kind, location, content_type, size_bytes, last_used_at)
+                    VALUES (?, ?, ?, ?, ?, ?)''',
+                 (key, kind, location, content_type, size_bytes, time.time()))
+    conn.commit()
+
+
+def usage(conn=None):
+    """{kind: {'entries', 'size_bytes'}} for every kind of stored render"""
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT kind, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM renders GROUP BY kind")
+    return {row[0]: {'entries': row[1], 'size_bytes': row[2]} for row in c.fetchall()}
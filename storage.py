@@ -0,0 +1,150 @@
+# Shared S3 access layer
+# One pooled boto3 client per process. boto3 clients are thread-safe once
+# built, but sessions are not, so creation happens under a lock. The client
+# is dropped after fork so each gunicorn worker (preload_app=True) opens its
+# own connection pool instead of sharing sockets with the master.
+#
+# The database stores canonical object URLs (object_url), never presigned
+# ones. Playable URLs are signed on the way out by presign(), which keeps one
+# signed URL per object and reuses it until it is close to expiring - signing
+# a page of items is a dict lookup each, and a URL handed out always has at
+# least PRESIGN_REFRESH_SECONDS left.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote, quote
+import boto3
+from botocore.config import Config
+
+MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 20))
+# Lifetime of presigned GET URLs; a cached one is re-signed once less than half of it is left
+PRESIGN_SECONDS = int(os.environ.get('S3_PRESIGN_SECONDS') or 3600)
+PRESIGN_REFRESH_SECONDS = PRESIGN_SECONDS // 2
+PRESIGN_CACHE_ENTRIES = 10000
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+_signed = OrderedDict()
+_signed_lock = threading.Lock()
+
+
+def aws_settings():
+    """Credentials, bucket and region from the environment (read at call time, after load_dotenv)"""
+    return {
+        'access_key': os.environ.get('AWS_ACCESS_KEY_ID'),
+        'secret_key': os.environ.get('AWS_SECRET_ACCESS_KEY'),
+        'bucket': os.environ.get('AWS_BUCKET_NAME'),
+        'region': os.environ.get('AWS_REGION', 'us-east-1')
+    }
+
+
+def has_credentials():
+    """True when access key, secret key and bucket are all configured"""
+    settings = aws_settings()
+    return all([settings['access_key'], settings['secret_key'], settings['bucket']])
+
+
+def bucket_name():
+    return aws_settings()['bucket']
+
+
+def parse_s3_url(url):
+    """(bucket, key) for an S3 object URL - plain or presigned, virtual-host or path style - else None"""
+    parsed = urlparse(url or '')
+    host = parsed.netloc.lower()
+    if not host.endswith('.amazonaws.com'):
+        return None
+    path = unquote(parsed.path.lstrip('/'))
+    virtual_host = re.match(r'^(.+)\.s3[.-]', host)
+    if virtual_host:
+        bucket, key = virtual_host.group(1), path
+    else:
+        bucket, _, key = path.partition('/')
+    if not bucket or not key:
+        return None
+    return bucket, key
+
+
+def object_url(bucket, key):
+    """Canonical (unsigned) URL of an object - what the database stores; parse_s3_url reverses it"""
+    return f"https://{bucket}.s3.amazonaws.com/{quote(key)}"
+
+
+def presign(bucket, key):
+    """Presigned GET URL for an object, from the in-process cache unless it is near expiry"""
+    now = time.time()
+    with _signed_lock:
+        cached = _signed.get((bucket, key))
+        if cached and cached[1] - now > PRESIGN_REFRESH_SECONDS:
+            _signed.move_to_end((bucket, key))
+            return cached[0]
+    # Signing is local (no request to S3), so it happens outside the lock
+    url = get_s3_client().generate_presigned_url(
+        'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=PRESIGN_SECONDS)
+    with _signed_lock:
+        _signed[(bucket, key)] = (url, now + PRESIGN_SECONDS)
+        _signed.move_to_end((bucket, key))
+        while len(_signed) > PRESIGN_CACHE_ENTRIES:
+            _signed.popitem(last=False)
+    return url
+
+
+def play_url(url):
+    """Playable URL for a stored s3_url: signed for our S3 objects, anything else (/static/..., None) as is"""
+    location = parse_s3_url(url)
+    if not location or not has_credentials():
+        return url
+    return presign(*location)
+
+
+def get_s3_client():
+    """Return the process-wide pooled S3 client, creating it on first use"""
+    global _client, _client_pid
+    client = _client
+    if client is not None and _client_pid == os.getpid():
+        return client
+
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            settings = aws_settings()
+            session = boto3.session.Session(
+                aws_access_key_id=settings['access_key'],
+                aws_secret_access_key=settings['secret_key'],
+                region_name=settings['region']
+            )
+            _client = session.client(
+                's3',
+                config=Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={'max_attempts': 3, 'mode': 'standard'}
+                )
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def reset_client():
+    """Forget the cached client and the URLs it signed (e.g. when credentials change)"""
+    global _client, _client_pid
+    with _lock:
+        _client = None
+        _client_pid = None
+    with _signed_lock:
+        _signed.clear()
+
+
+def _after_fork():
+    # The parent's locks may have been held mid-fork, so start fresh (cached signed URLs stay valid)
+    global _client, _client_pid, _lock, _signed_lock
+    _lock = threading.Lock()
+    _signed_lock = threading.Lock()
+    _client = None
+    _client_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
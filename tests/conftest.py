@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+import pytest
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py imported against a scratch songs.db, with the ingest workers and desktop watcher off"""
+    pytest.importorskip('flask')
+    pytest.importorskip('boto3')
+    pytest.importorskip('dotenv')
+    db_path = str(tmp_path_factory.mktemp('app') / 'songs.db')
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ['INGEST_WORKERS'] = '0'
+    os.environ['DESKTOP_IMPORT_DIR'] = ''
+    os.environ.pop('SSE_MAX_CLIENTS', None)
+    import db
+    db.DB_PATH = db_path
+    import app
+    return app
+
+
+@pytest.fixture
+def app_client(app_module):
+    app_module.app.config['TESTING'] = True
+    with app_module.app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    """This thread's db.get_db() connection, to a migrated songs.db in tmp_path"""
+    import db
+    import migrations
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'songs.db'))
+    monkeypatch.setattr(db, '_local', threading.local())
+    conn = db.get_db()
+    migrations.migrate(conn)
+    conn.commit()
+    yield conn
+    # Write pending cache counters here - left for the exit flush they'd go to the real songs.db
+    if 'analysis_cache' in sys.modules:
+        sys.modules['analysis_cache'].flush_stats(conn)
+    conn.close()
@@ -0,0 +1,138 @@
+import json
+import pytest
+
+pytest.importorskip('boto3')
+import audio_tasks  # noqa: E402
+
+
+def test_static_path_stays_inside_static(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'static' / 'uploads').mkdir(parents=True)
+    (tmp_path / 'static' / 'uploads' / 'a.wav').write_bytes(b'RIFF')
+    (tmp_path / 'songs.db').write_bytes(b'')
+
+    assert audio_tasks.static_path('/static/uploads/a.wav') == str((tmp_path / 'static/uploads/a.wav').resolve())
+    for location in ('/static/../songs.db', '/static/uploads/../../songs.db', '/static/../static_evil/x.wav'):
+        with pytest.raises(ValueError):
+            audio_tasks.static_path(location)
+        with pytest.raises(ValueError):
+            audio_tasks.fetch_audio(location)
+
+    result = audio_tasks.splice(['/static/uploads/a.wav', '/static/../songs.db'])
+    assert not result['success']
+
+
+def test_crossfade_never_exceeds_the_shorter_clip():
+    segments = [{'path': 'a.wav', 'duration': 2.0}, {'path': 'b.wav', 'duration': 8.0},
+                {'path': 'c.wav', 'duration': 9.0}]
+    input_args, graph, output = audio_tasks.splice_filter_graph(segments, 5.0)
+    assert '[s0][s1]acrossfade=d=2.000[j1]' in graph
+    assert '[j1][s2]acrossfade=d=5.000[j2]' in graph
+    assert output == '[j2]'
+
+
+@pytest.fixture
+def project_db(scratch_db, tmp_path, monkeypatch):
+    """scratch_db, run from tmp_path with an empty static/ dir"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'static' / 'uploads').mkdir(parents=True)
+    (tmp_path / 'static' / 'spliced').mkdir()
+    return scratch_db
+
+
+def test_mixdown_reuses_clip_segments_and_writes_chapters(project_db, tmp_path):
+    import json
+    import shutil
+    import subprocess
+    if not shutil.which('ffmpeg'):
+        pytest.skip('ffmpeg not installed')
+    conn = project_db
+    conn.execute("INSERT INTO projects (id, name) VALUES (1, 'Song')")
+    for inbox_id, frequency in ((1, 440), (2, 660)):
+        subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'sine=f={frequency}:d=1',
+                        f'static/uploads/{inbox_id}.wav'], check=True)
+        conn.execute("INSERT INTO inbox (id, sender_name, content_type, title, s3_url) VALUES (?, 'Asia', 'voice', ?, ?)",
+                     (inbox_id, f"Take {inbox_id}", f"/static/uploads/{inbox_id}.wav"))
+        conn.execute("INSERT INTO project_items (project_id, inbox_id, position) VALUES (1, ?, ?)", (inbox_id, inbox_id))
+    conn.commit()
+
+    def segments():
+        return conn.execute("SELECT COUNT(*) FROM renders WHERE kind = 'mixdown-segment'").fetchone()[0]
+
+    first = audio_tasks.mixdown_project(1)
+    assert first['success'] and not first['cached']
+    assert [cue['title'] for cue in first['cues']] == ['Take 1', 'Take 2']
+    assert segments() == 3  # two clips and one gap
+
+    # Reordering re-joins the cached segments - nothing is encoded again
+    conn.execute("UPDATE project_items SET position = 3 - position")
+    conn.commit()
+    second = audio_tasks.mixdown_project(1)
+    assert not second['cached'] and second['mixdown_url'] != first['mixdown_url']
+    assert [cue['title'] for cue in second['cues']] == ['Take 2', 'Take 1']
+    assert segments() == 3
+
+    probe = subprocess.run(['ffprobe', '-v', 'error', '-show_chapters', '-of', 'json',
+                            second['mixdown_url'].lstrip('/')], capture_output=True, text=True, check=True)
+    chapters = json.loads(probe.stdout)['chapters']
+    assert [chapter['tags']['title'] for chapter in chapters] == ['Take 2', 'Take 1']
+    assert float(chapters[1]['start_time']) == pytest.approx(second['cues'][1]['start'], abs=0.05)
+
+
+def waveform_of(monkeypatch, pcm):
+    """compute_waveform on `pcm` (int16 samples) in place of ffmpeg's decode"""
+    monkeypatch.setattr(audio_tasks.subprocess, 'run',
+                        lambda *args, **kwargs: audio_tasks.subprocess.CompletedProcess(args, 0, pcm.tobytes(), b''))
+    return audio_tasks.compute_waveform('clip.wav')
+
+
+def test_waveform_levels_halve_down_to_the_minimum(monkeypatch):
+    np = pytest.importorskip('numpy')
+    rng = np.random.default_rng(0)
+    pcm = rng.integers(-32767, 32768, 256 * 300 + 100).astype(np.int16)
+    sample_rate, duration, levels, peaks = waveform_of(monkeypatch, pcm)
+
+    assert sample_rate == audio_tasks.WAVEFORM_SAMPLE_RATE
+    assert duration == len(pcm) / sample_rate
+    assert [level[:2] for level in levels] == [[256, 301], [512, 151], [1024, 76], [2048, 38]]
+    assert [level[2] for level in levels] == [0, 602, 904, 1056] and len(peaks) == 1056 + 76
+
+    base = np.frombuffer(peaks, dtype=np.int8, count=301 * 2)
+    for samples_per_peak, count, offset in levels[1:]:
+        pairs = np.frombuffer(peaks, dtype=np.int8, count=count * 2, offset=offset)
+        span = samples_per_peak // 256
+        # Every coarse peak covers exactly its span of base peaks
+        for i in (0, count // 2, count - 1):
+            assert pairs[2 * i] == base[0::2][i * span:(i + 1) * span].min()
+            assert pairs[2 * i + 1] == base[1::2][i * span:(i + 1) * span].max()
+
+
+def test_waveform_of_a_short_clip_is_one_level(monkeypatch):
+    np = pytest.importorskip('numpy')
+    sample_rate, duration, levels, peaks = waveform_of(monkeypatch, np.full(1000, 32767, dtype=np.int16))
+    assert levels == [[256, 4, 0]]
+    assert peaks == bytes([127]) * 8
+    assert waveform_of(monkeypatch, np.zeros(0, dtype=np.int16))[1:] == (0.0, [], b'')
+
+
+def test_waveform_api_reads_the_coarsest_level_wide_enough(monkeypatch, app_module, app_client):
+    np = pytest.importorskip('numpy')
+    pcm = np.repeat(np.arange(300, dtype=np.int16) * 100, 256)
+    sample_rate, duration, levels, peaks = waveform_of(monkeypatch, pcm)
+    conn = app_module.db.get_db()
+    item_id = conn.execute("INSERT INTO inbox (sender_name, content_type, title) "
+                           "VALUES ('Asia', 'voice', 'waveform')").lastrowid
+    conn.execute("INSERT INTO waveforms (inbox_id, sample_rate, duration, levels, peaks) VALUES (?, ?, ?, ?, ?)",
+                 (item_id, sample_rate, duration, json.dumps(levels), peaks))
+    conn.commit()
+
+    response = app_client.get(f'/api/waveform/{item_id}?width=100')
+    body = response.get_json()
+    assert body['status'] == 'ready' and body['width'] == 100
+    # Read from the 150-peak level, so each bucket spans 1-2 of its peaks
+    level_150 = np.frombuffer(peaks, dtype=np.int8, count=300, offset=levels[1][2])
+    assert body['min'] == app_module.resample_peaks(list(level_150[0::2]), list(level_150[1::2]), 100)[0]
+    assert body['max'][-1] == 127 * 29900 // 32767
+
+    assert app_client.get(f'/api/waveform/{item_id}?width=100',
+                          headers={'If-None-Match': response.headers['ETag']}).status_code == 304
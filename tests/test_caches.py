@@ -0,0 +1,111 @@
+import os
+import sys
+import types
+import time
+import threading
+import pytest
+
+pytest.importorskip('boto3')
+import analysis_cache  # noqa: E402
+from disk_cache import DiskCache  # noqa: E402
+
+
+@pytest.fixture
+def conn(scratch_db):
+    return scratch_db
+
+
+def test_analysis_cache_evicts_least_recently_used(conn):
+    for key in ('a', 'b', 'c'):
+        analysis_cache.put(key, 'fp', 'full', {'key': key}, conn)
+        time.sleep(0.01)
+    # A hit moves 'a' to the back of the line (written by the flush put() does first)
+    assert analysis_cache.get('a', conn) == {'key': 'a'}
+    time.sleep(0.01)
+    analysis_cache.flush_stats(conn)
+
+    entry_size = conn.execute("SELECT size_bytes FROM analysis_cache WHERE cache_key = 'a'").fetchone()[0]
+    assert analysis_cache.evict(conn, max_bytes=2 * entry_size) == 1
+    conn.commit()
+    assert analysis_cache.get('b', conn) is None
+    assert analysis_cache.get('a', conn) == {'key': 'a'}
+    assert analysis_cache.get('c', conn) == {'key': 'c'}
+
+
+def test_analysis_cache_hit_costs_no_write(conn):
+    analysis_cache.put('a', 'fp', 'full', {'key': 'a'}, conn)
+    changes = conn.total_changes
+    assert analysis_cache.get('a', conn) == {'key': 'a'}
+    assert conn.total_changes == changes and not conn.in_transaction
+
+
+def test_disk_cache_fills_once_for_concurrent_callers(conn, tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), 1024 * 1024, 'test')
+    fills = []
+
+    def fill(path):
+        fills.append(path)
+        time.sleep(0.2)
+        with open(path, 'wb') as f:
+            f.write(b'audio')
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch('s3/bucket/a.wav', fill, '.wav')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fills) == 1
+    assert len(set(results)) == 1 and len(results) == 8
+    with open(results[0], 'rb') as f:
+        assert f.read() == b'audio'
+
+
+def test_disk_cache_evicts_least_recently_used_files(conn, tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), 10, 'test')
+
+    def filler(data):
+        def fill(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return fill
+
+    first = cache.fetch('first', filler(b'12345'))
+    second = cache.fetch('second', filler(b'12345'))
+    past = time.time() - 60
+    os.utime(first, (past, past))
+    os.utime(second, (past - 60, past - 60))
+    # Using 'second' again makes 'first' the least recently used
+    assert cache.fetch('second', filler(b'never')) == second
+
+    cache.fetch('third', filler(b'12345'))
+    assert os.path.exists(second) and not os.path.exists(first)
+    assert cache.usage()['size_bytes'] == 10
+
+
+def test_pcm_cache_decodes_once_per_sample_rate(conn, tmp_path, monkeypatch):
+    np = pytest.importorskip('numpy')
+    import pcm_cache
+    decodes = []
+
+    def load(path, sr, mono):
+        decodes.append(sr)
+        return np.linspace(-1, 1, sr, dtype=np.float64), sr
+
+    monkeypatch.setitem(sys.modules, 'librosa', types.SimpleNamespace(load=load))
+    monkeypatch.setattr(pcm_cache, '_cache', DiskCache(str(tmp_path / 'pcm'), 1024 * 1024, 'pcm'))
+    source = tmp_path / 'a.wav'
+    source.write_bytes(b'RIFF')
+
+    first = pcm_cache.load(str(source), 100)
+    again = pcm_cache.load(str(source), 100)
+    assert decodes == [100]
+    assert isinstance(again, np.memmap) and again.dtype == np.float32 and not again.flags.writeable
+    assert np.array_equal(first, again) and again[0] == -1 and again[-1] == 1
+
+    assert len(pcm_cache.load(str(source), 50)) == 50
+    # A caller's fingerprint (e.g. the content hash) is the key, whatever the file is called
+    pcm_cache.load(str(source), 100, fingerprint='sha256:other')
+    assert decodes == [100, 50, 100]
@@ -0,0 +1,25 @@
+def test_stream_cap_defaults_to_a_quarter_of_the_threads(app_module):
+    assert app_module.SSE_MAX_CLIENTS == max(1, app_module.GUNICORN_THREADS // 4)
+    assert app_module.SSE_MAX_CLIENTS < app_module.GUNICORN_THREADS
+
+
+def test_streams_over_the_cap_get_503_and_webhooks_still_answer(app_module, app_client):
+    streams = [app_client.get('/api/inbox/stream', buffered=False) for _ in range(app_module.SSE_MAX_CLIENTS)]
+    try:
+        assert all(response.status_code == 200 for response in streams)
+
+        refused = app_client.get('/api/inbox/stream', buffered=False)
+        assert refused.status_code == 503
+        assert refused.headers['Retry-After']
+
+        # A Twilio webhook is a plain request - it never waits on a stream slot
+        webhook = app_client.post('/twilio/sms', data={'From': '+15550100', 'Body': 'hi', 'NumMedia': '0'})
+        assert webhook.status_code == 200
+    finally:
+        for response in streams:
+            response.close()
+
+    # Closing a stream gives its slot back
+    reopened = app_client.get('/api/inbox/stream', buffered=False)
+    assert reopened.status_code == 200
+    reopened.close()
@@ -0,0 +1,59 @@
+import pytest
+import db
+import events
+import migrations
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = db.connect(str(tmp_path / 'songs.db'))
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+def add_inbox(conn, title):
+    c = conn.execute("INSERT INTO inbox (sender_name, content_type, title) VALUES ('Asia', 'text', ?)", (title,))
+    conn.commit()
+    return c.lastrowid
+
+
+def latest_seq(conn):
+    return conn.execute("SELECT MAX(seq) FROM inbox_changes").fetchone()[0]
+
+
+def test_pruning_keeps_the_window_and_the_latest_change(conn):
+    for title in ('a', 'b', 'c'):
+        add_inbox(conn, title)
+    conn.execute("UPDATE inbox_changes SET changed_at = datetime('now', '-2 days')")
+    conn.commit()
+    newest = latest_seq(conn)
+
+    assert events.prune_changes(conn, max_age_seconds=3600) == 2
+    # The latest row stays so cursors never go backwards
+    assert latest_seq(conn) == newest
+    assert events.replayable(conn, newest) and events.replayable(conn, newest - 1)
+    assert not events.replayable(conn, newest - 2)
+
+
+def test_sync_answers_304_until_the_inbox_changes(app_module, app_client):
+    add_inbox(db.get_db(), 'before')
+    first = app_client.get('/api/inbox/sync?since=0')
+    assert first.status_code == 200
+    cursor, etag = first.get_json()['cursor'], first.headers['ETag']
+    assert cursor > 0
+
+    assert app_client.get(f'/api/inbox/sync?since={cursor}').status_code == 304
+    # An older cursor still gets a 304 if the client already holds the latest response
+    unchanged = app_client.get(f'/api/inbox/sync?since={cursor - 1}', headers={'If-None-Match': etag})
+    assert unchanged.status_code == 304 and unchanged.headers['ETag'] == etag
+
+    item_id = add_inbox(db.get_db(), 'after')
+    changed = app_client.get(f'/api/inbox/sync?since={cursor}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert [item['id'] for item in changed.get_json()['items']] == [item_id]
+
+
+def test_sync_from_a_future_cursor_resets(app_client):
+    response = app_client.get('/api/inbox/sync?since=999999999')
+    assert response.get_json()['reset'] is True
@@ -0,0 +1,102 @@
+import io
+import hashlib
+import pytest
+import db
+
+
+class FakeS3:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append((Bucket, Key))
+
+
+def rows(sql, params=()):
+    conn = db.connect()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def insert_inbox(content_hash):
+    conn = db.connect()
+    try:
+        c = conn.execute("INSERT INTO inbox (sender_name, content_type, title, content_hash) "
+                         "VALUES ('Asia', 'voice', 'other copy', ?)", (content_hash,))
+        conn.commit()
+        return c.lastrowid
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def s3(app_module, monkeypatch):
+    """Uploads 'land' at s3://bucket/<filename> without a request to S3"""
+    s3 = FakeS3()
+
+    def upload(fileobj, filename, content_type='audio/wav'):
+        data = fileobj.read()
+        return (app_module.storage.object_url('bucket', filename),
+                {'bytes': len(data), 'content_hash': 'sha256:' + hashlib.sha256(data).hexdigest()})
+
+    monkeypatch.setattr(app_module, 'stream_recording_to_s3', upload)
+    monkeypatch.setattr(app_module.storage, 'get_s3_client', lambda: s3)
+    return s3
+
+
+def run_recording(app_module, monkeypatch, sid, audio):
+    """Queue a recording with this RecordingSid and run its job against a download of `audio`"""
+    monkeypatch.setattr(app_module, 'open_twilio_download', lambda url: io.BytesIO(audio))
+    record_id, job = app_module.queue_recording_ingest('Asia', '+15550100', f"https://api.twilio.com/{sid}",
+                                                       sid, 'test')
+    payload = {'download_url': f"https://api.twilio.com/{sid}.wav", 'recording_sid': sid,
+               'filename': f"{sid}.wav", 'sender_name': 'Asia', 'received_at': '10:00'}
+    job = {'id': job['id'], 'kind': 'twilio_recording', 'attempts': 1, 'max_attempts': 6, 'inbox_id': record_id}
+    return record_id, app_module.process_recording_job(payload, job)
+
+
+def test_repeated_recording_sid_queues_one_download(app_client):
+    data = {'From': '+15550100', 'RecordingUrl': 'https://api.twilio.com/RE-repeat', 'RecordingSid': 'RE-repeat'}
+    for _ in range(2):
+        assert app_client.post('/twilio/recording', data=data).status_code == 200
+    inbox = rows("SELECT id FROM inbox WHERE recording_sid = 'RE-repeat'")
+    assert len(inbox) == 1
+    assert len(rows("SELECT id FROM jobs WHERE inbox_id = ?", (inbox[0]['id'],))) == 1
+
+
+def test_repeated_message_sid_queues_one_download(app_client):
+    data = {'From': '+15550100', 'Body': '', 'NumMedia': '1', 'MessageSid': 'MM-repeat',
+            'MediaUrl0': 'https://api.twilio.com/MM-repeat/0', 'MediaContentType0': 'audio/mp4'}
+    for _ in range(2):
+        assert app_client.post('/twilio/sms', data=data).status_code == 200
+    inbox = rows("SELECT id FROM inbox WHERE message_sid = 'MM-repeat' AND message_part = 0")
+    assert len(inbox) == 1
+    assert len(rows("SELECT id FROM jobs WHERE inbox_id = ?", (inbox[0]['id'],))) == 1
+
+
+def test_repeated_content_hash_is_not_uploaded_again(app_module, monkeypatch, s3):
+    first_id, first = run_recording(app_module, monkeypatch, 'RE-hash-1', b'RIFF same audio twice')
+    second_id, second = run_recording(app_module, monkeypatch, 'RE-hash-2', b'RIFF same audio twice')
+    assert 'duplicate_of' not in first
+    assert second['duplicate_of'] == first_id
+    assert rows("SELECT id FROM inbox WHERE id = ?", (second_id,)) == []
+    assert s3.deleted == []
+
+
+def test_content_hash_stored_during_upload_discards_our_copy(app_module, monkeypatch, s3):
+    audio = b'RIFF raced by another job'
+    upload = app_module.stream_recording_to_s3
+
+    def racing_upload(fileobj, filename, content_type='audio/wav'):
+        url, stats = upload(fileobj, filename, content_type)
+        # Another job finishes the same audio while ours is uploading
+        racing_upload.other_id = insert_inbox(stats['content_hash'])
+        return url, stats
+
+    monkeypatch.setattr(app_module, 'stream_recording_to_s3', racing_upload)
+    record_id, result = run_recording(app_module, monkeypatch, 'RE-race', audio)
+    assert result['duplicate_of'] == racing_upload.other_id
+    assert rows("SELECT id FROM inbox WHERE id = ?", (record_id,)) == []
+    assert s3.deleted == [('bucket', 'RE-race.wav')]
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import subprocess
+import sys
+import pytest
+import db
+import jobs
+import migrations
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    path = str(tmp_path / 'songs.db')
+    monkeypatch.setattr(jobs, '_db_path', path)
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+def handler(monkeypatch, kind, func):
+    monkeypatch.setitem(jobs._handlers, kind, func)
+    return func
+
+
+def run_next(conn, worker_id='test-0'):
+    row = jobs._claim_next(conn, worker_id)
+    assert row is not None, 'no job was due'
+    jobs.run_job(conn, row)
+    return job_row(conn, row['id'])
+
+
+def job_row(conn, job_id):
+    return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def make_due(conn, job_id):
+    conn.execute("UPDATE jobs SET run_after = 0 WHERE id = ?", (job_id,))
+    conn.commit()
+
+
+def test_finished_job_keeps_its_result(conn, monkeypatch):
+    handler(monkeypatch, 'echo', lambda payload, job: {'echo': payload['value'], 'attempt': job['attempts']})
+    job_id = jobs.enqueue('echo', {'value': 7})
+
+    row = run_next(conn)
+    assert row['id'] == job_id
+    assert row['status'] == 'done' and row['attempts'] == 1
+    assert json.loads(row['result']) == {'echo': 7, 'attempt': 1}
+    assert jobs._claim_next(conn, 'test-0') is None
+
+
+def test_retry_later_reschedules_after_its_delay(conn, monkeypatch):
+    def not_ready(payload, job):
+        raise jobs.RetryLater('not ready', delay=42)
+
+    handler(monkeypatch, 'not_ready', not_ready)
+    jobs.enqueue('not_ready', {})
+    before = time.time()
+    row = run_next(conn)
+    assert row['status'] == 'queued' and row['attempts'] == 1
+    assert 'not ready' in row['last_error']
+    assert before + 42 <= row['run_after'] <= time.time() + 42
+    # Not due yet
+    assert jobs._claim_next(conn, 'test-0') is None
+
+
+def test_failures_back_off_exponentially(conn, monkeypatch):
+    def crash(payload, job):
+        raise RuntimeError('boom')
+
+    handler(monkeypatch, 'crash', crash)
+    job_id = jobs.enqueue('crash', {}, max_attempts=5)
+    delays = []
+    for attempt in range(3):
+        started = time.time()
+        row = run_next(conn)
+        delays.append(round(row['run_after'] - started))
+        make_due(conn, job_id)
+    assert delays == [jobs.backoff_delay(1), jobs.backoff_delay(2), jobs.backoff_delay(3)] == [3, 6, 12]
+
+
+def test_job_fails_once_it_reaches_max_attempts(conn, monkeypatch):
+    failures = []
+
+    def crash(payload, job):
+        raise jobs.RetryLater('still 404')
+
+    crash.on_failure = lambda payload, job, error: failures.append((payload, job['attempts'], error))
+    handler(monkeypatch, 'crash', crash)
+    job_id = jobs.enqueue('crash', {'sid': 'RE1'}, max_attempts=2)
+
+    assert run_next(conn)['status'] == 'queued'
+    assert failures == []
+    make_due(conn, job_id)
+    row = run_next(conn)
+    assert row['status'] == 'failed' and row['attempts'] == 2
+    assert failures == [({'sid': 'RE1'}, 2, 'RetryLater: still 404')]
+    assert jobs._claim_next(conn, 'test-0') is None
+
+
+def test_expired_lease_is_requeued_and_heartbeat_renews_it(conn):
+    stale = jobs.enqueue('slow', {})
+    fresh = jobs.enqueue('slow', {})
+    assert jobs._claim_next(conn, 'test-0')['id'] == stale
+    assert jobs._claim_next(conn, 'test-1')['id'] == fresh
+    long_ago = time.time() - jobs.LEASE_SECONDS - 1
+    conn.execute("UPDATE jobs SET locked_at = ?", (long_ago,))
+    conn.commit()
+
+    jobs.heartbeat(fresh)
+    assert jobs.recover_stale_jobs(conn) == 1
+    assert job_row(conn, stale)['status'] == 'queued' and job_row(conn, stale)['locked_by'] is None
+    assert job_row(conn, fresh)['status'] == 'running'
+    # The requeued job runs again; its earlier attempt still counts
+    assert jobs._claim_next(conn, 'test-2')['attempts'] == 1
+
+
+def test_jobs_of_exited_workers_are_requeued(conn):
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    owners = {f"{exited.pid}-0": 'queued', f"{os.getpid()}-0": 'running', f"{os.getppid()}-0": 'running'}
+    ids = {}
+    for owner in owners:
+        ids[owner] = jobs.enqueue('slow', {})
+        jobs._claim_next(conn, owner)
+
+    assert jobs.recover_orphaned_jobs(conn) == 1
+    assert {owner: job_row(conn, ids[owner])['status'] for owner in owners} == owners
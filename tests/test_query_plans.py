@@ -0,0 +1,48 @@
+import sqlite3
+import pytest
+import migrations
+import queries
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'songs.db'))
+    conn.row_factory = sqlite3.Row
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('name', sorted(queries.hot_queries()))
+def test_hot_query_uses_index_without_sorting(conn, name):
+    sql, params = queries.hot_queries()[name]
+    result = migrations.explain(conn, sql, params)
+    assert result['uses_index'], result['plan']
+
+
+def test_date_filter_matches_date_folder(conn):
+    rows = [
+        ('2025-08-31', '2025-08-31 23:30:00'),
+        ('2025-09-01', '2025-08-31 22:30:00'),  # date_folder is local time, created_at UTC
+        ('2025-09-15', '2025-09-15 12:00:00'),
+        ('2025-09-30', '2025-10-01 01:00:00'),
+        ('2025-10-01', '2025-10-01 09:00:00'),
+    ]
+    conn.executemany("INSERT INTO inbox (sender_name, content_type, title, date_folder, created_at) "
+                     "VALUES ('Asia', 'voice', 't', ?, ?)", rows)
+    where, params = queries.inbox_filters({'date_from': '2025-09-01', 'date_to': '2025-09-30'})
+    rows, next_cursor = queries.keyset_page(conn.cursor(), queries.INBOX_SELECT, where, params, 'created_at', 50)
+    assert sorted(row['date_folder'] for row in rows) == ['2025-09-01', '2025-09-15', '2025-09-30']
+    assert next_cursor is None
+
+
+def test_keyset_pages_cover_every_row_once(conn):
+    conn.executemany("INSERT INTO phrases (title, created_at) VALUES (?, ?)",
+                     [(f"p{i}", f"2025-09-{1 + i % 3:02d} 10:00:00") for i in range(7)])
+    seen, cursor = [], None
+    while True:
+        rows, cursor = queries.keyset_page(conn.cursor(), queries.PHRASES_SELECT, [], [], 'created_at', 3, cursor)
+        seen += [row['id'] for row in rows]
+        if cursor is None:
+            break
+    assert sorted(seen) == list(range(1, 8))
@@ -0,0 +1,48 @@
+import types
+import pytest
+
+pytest.importorskip('boto3')
+import storage  # noqa: E402
+
+
+class SigningClient:
+    def __init__(self):
+        self.signed = 0
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self.signed += 1
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?Signature={self.signed}"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = SigningClient()
+    monkeypatch.setattr(storage, 'get_s3_client', lambda: client)
+    storage._signed.clear()
+    yield client
+    storage._signed.clear()
+
+
+def test_presign_reuses_the_url_until_it_nears_expiry(client, monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(storage, 'time', types.SimpleNamespace(time=lambda: now[0]))
+
+    first = storage.presign('bucket', 'recordings/a.wav')
+    now[0] += storage.PRESIGN_SECONDS - storage.PRESIGN_REFRESH_SECONDS - 1
+    assert storage.presign('bucket', 'recordings/a.wav') == first
+    assert client.signed == 1
+
+    # Past the half-life: re-signed, so a URL handed out always has PRESIGN_REFRESH_SECONDS left
+    now[0] += 2
+    assert storage.presign('bucket', 'recordings/a.wav') != first
+    assert client.signed == 2
+
+
+def test_presign_cache_is_per_object(client):
+    assert storage.presign('bucket', 'a.wav') != storage.presign('bucket', 'b.wav')
+    assert client.signed == 2
+
+
+def test_object_url_round_trips_through_parse_s3_url():
+    url = storage.object_url('bucket', 'recordings/2025-09-13/a b.wav')
+    assert storage.parse_s3_url(url) == ('bucket', 'recordings/2025-09-13/a b.wav')
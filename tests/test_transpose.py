@@ -0,0 +1,80 @@
+import sys
+import types
+import pytest
+import jobs
+
+
+def prerender_jobs(conn):
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE kind = 'transpose_prerender'").fetchone()[0]
+
+
+def add_voice(conn, s3_url):
+    c = conn.execute("INSERT INTO inbox (sender_name, content_type, title, s3_url) VALUES ('Asia', 'voice', 'v', ?)",
+                     (s3_url,))
+    conn.commit()
+    return c.lastrowid
+
+
+def test_prerenders_are_queued_only_when_enabled(scratch_db):
+    conn = scratch_db
+    add_voice(conn, 'https://bucket.s3.amazonaws.com/a.wav')
+    assert prerender_jobs(conn) == 0
+
+    jobs.set_setting('transpose_prerender_semitones', 3, conn)
+    conn.commit()
+    add_voice(conn, 'https://bucket.s3.amazonaws.com/b.wav')
+    assert prerender_jobs(conn) == 1
+    # A voice note queued before its upload finished gets one once s3_url is filled in
+    item_id = add_voice(conn, None)
+    assert prerender_jobs(conn) == 1
+    conn.execute("UPDATE inbox SET s3_url = 'https://bucket.s3.amazonaws.com/c.wav' WHERE id = ?", (item_id,))
+    conn.commit()
+    assert prerender_jobs(conn) == 2
+
+
+@pytest.fixture
+def renderer(scratch_db, tmp_path, monkeypatch):
+    """audio_tasks with pitch_shift and S3 faked out; returns the list of uploaded keys"""
+    pytest.importorskip('boto3')
+    import audio_tasks
+    uploads = []
+    source = tmp_path / 'a.wav'
+    source.write_bytes(b'RIFF source audio')
+
+    def write(path, y, sr):
+        with open(path, 'wb') as f:
+            f.write(b'RIFF shifted')
+
+    monkeypatch.setitem(sys.modules, 'librosa', types.SimpleNamespace(
+        effects=types.SimpleNamespace(pitch_shift=lambda y, sr, n_steps: y)))
+    monkeypatch.setitem(sys.modules, 'soundfile', types.SimpleNamespace(write=write))
+    monkeypatch.setattr(audio_tasks.pcm_cache, 'load', lambda path, sr, fingerprint=None: [0.0])
+    monkeypatch.setattr(audio_tasks, 'fetch_audio', lambda audio_url: str(source))
+    monkeypatch.setattr(audio_tasks.analysis_cache, 's3_fingerprint', lambda audio_url: None)
+    monkeypatch.setattr(audio_tasks.storage, 'get_s3_client', lambda: None)
+    monkeypatch.setattr(audio_tasks.storage, 'bucket_name', lambda: 'bucket')
+    monkeypatch.setattr(audio_tasks.storage, 'presign', lambda bucket, key: f"https://signed/{key}")
+    monkeypatch.setattr(audio_tasks.transfer, 'upload_path_to_s3',
+                        lambda client, path, bucket, key, **kwargs: uploads.append(key))
+    return audio_tasks, uploads
+
+
+def test_repeated_transposition_reuses_the_render(renderer):
+    audio_tasks, uploads = renderer
+    first = audio_tasks.transpose('https://example.com/a.wav', 2)
+    again = audio_tasks.transpose('https://example.com/a.wav', 2)
+    assert first['cached'] is False and again['cached'] is True
+    assert again['transposed_url'] == first['transposed_url'] == f"https://signed/{uploads[0]}"
+    assert len(uploads) == 1 and uploads[0].endswith('transposed_+2st.wav')
+
+    assert audio_tasks.transpose('https://example.com/a.wav', -1)['cached'] is False
+    assert len(uploads) == 2
+
+
+def test_prerender_skips_shifts_already_rendered(renderer):
+    audio_tasks, uploads = renderer
+    assert audio_tasks.prerender_transposition('https://example.com/a.wav', 3) is True
+    assert audio_tasks.prerender_transposition('https://example.com/a.wav', 3) is False
+    assert len(uploads) == 1
+    # The interactive request finds the pre-render
+    assert audio_tasks.transpose('https://example.com/a.wav', 3)['cached'] is True
@@ -0,0 +1,75 @@
+import io
+import zipfile
+import pytest
+
+pytest.importorskip('boto3')
+import zip_import  # noqa: E402
+
+
+class FakeS3:
+    """The archive download and member uploads, failing uploads whose key contains `fail`"""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.fail = None
+        self.uploaded = []
+
+    def download_fileobj(self, bucket, key, fileobj, Config=None):
+        fileobj.write(self.archive)
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        fileobj.read()
+        if self.fail and self.fail in key:
+            raise ConnectionError('upload interrupted')
+        self.uploaded.append(key)
+
+    def delete_object(self, Bucket, Key):
+        pass
+
+
+@pytest.fixture
+def conn(scratch_db):
+    return scratch_db
+
+
+def archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def files(conn, import_id):
+    rows = conn.execute("SELECT member, status, attempts, s3_key, inbox_id FROM zip_import_files "
+                        "WHERE import_id = ?", (import_id,)).fetchall()
+    return {row['member']: dict(row) for row in rows}
+
+
+def test_rerun_retries_only_failed_members(conn, monkeypatch):
+    s3 = FakeS3(archive({'a.mp3': b'audio a', 'b.wav': b'audio b', 'notes/c.m4a': b'audio c',
+                         'copy-of-a.mp3': b'audio a', 'readme.txt': b'not audio'}))
+    monkeypatch.setattr(zip_import.storage, 'get_s3_client', lambda: s3)
+    monkeypatch.setattr(zip_import.storage, 'bucket_name', lambda: 'bucket')
+    import_id = zip_import.create('imports/export.zip', conn)
+    job_id = conn.execute("SELECT job_id FROM zip_imports WHERE id = ?", (import_id,)).fetchone()[0]
+
+    s3.fail = 'b.wav'
+    first = zip_import.run(import_id, job_id)
+    assert first['status'] == 'partial'
+    assert first['files'] == {'done': 2, 'duplicate': 1, 'failed': 1}
+    before = files(conn, import_id)
+    assert before['b.wav']['status'] == 'failed'
+    assert before['copy-of-a.mp3']['inbox_id'] == before['a.mp3']['inbox_id']
+
+    s3.fail, s3.uploaded = None, []
+    second = zip_import.run(import_id, job_id)
+    assert second['status'] == 'done'
+    assert second['attempted'] == 1
+    assert len(s3.uploaded) == 1 and s3.uploaded[0].endswith('_b.wav')
+
+    after = files(conn, import_id)
+    assert after['b.wav']['status'] == 'done' and after['b.wav']['attempts'] == 2
+    for member in ('a.mp3', 'notes/c.m4a', 'copy-of-a.mp3'):
+        assert after[member] == before[member]
+    assert conn.execute("SELECT COUNT(*) FROM inbox WHERE sender_phone = 'IMPORTED'").fetchone()[0] == 3
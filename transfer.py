@@ -0,0 +1,103 @@
+# Streaming S3 transfers
+# Pipes file-like objects (HTTP responses, zip members, local files) into S3
+# in fixed-size chunks so memory per transfer stays constant.
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+from boto3.s3.transfer import TransferConfig
+
+# Each in-flight part is held in memory, so peak memory per transfer is
+# roughly CHUNK_SIZE * MAX_CONCURRENCY
+CHUNK_SIZE = int(os.environ.get('S3_MULTIPART_CHUNK_MB', 8)) * 1024 * 1024
+MAX_CONCURRENCY = int(os.environ.get('S3_TRANSFER_CONCURRENCY', 2))
+
+
+class CountingReader:
+    """File-like wrapper that counts and sha256-hashes the bytes read through it"""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.bytes_read = 0
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self.bytes_read += len(data)
+        self.digest.update(data)
+        return data
+
+    @property
+    def content_hash(self):
+        """'sha256:...' of everything read so far - the same form as disk_cache.file_fingerprint"""
+        return 'sha256:' + self.digest.hexdigest()
+
+
+def transfer_config():
+    """TransferConfig giving a bounded multipart upload buffer"""
+    return TransferConfig(
+        multipart_threshold=CHUNK_SIZE,
+        multipart_chunksize=CHUNK_SIZE,
+        max_concurrency=MAX_CONCURRENCY,
+        use_threads=MAX_CONCURRENCY > 1
+    )
+
+
+def transfer_stats(bytes_transferred, started):
+    """Bytes, elapsed seconds and throughput for a finished transfer"""
+    elapsed = max(time.monotonic() - started, 1e-6)
+    return {
+        'bytes': bytes_transferred,
+        'seconds': round(elapsed, 3),
+        'throughput_kbps': round(bytes_transferred / 1024 / elapsed, 1)
+    }
+
+
+def stream_to_s3(s3_client, fileobj, bucket, key, content_type):
+    """Stream a file-like object into S3 (multipart above CHUNK_SIZE). Returns transfer stats plus content_hash."""
+    reader = CountingReader(fileobj)
+    started = time.monotonic()
+    s3_client.upload_fileobj(
+        reader, bucket, key,
+        ExtraArgs={'ContentType': content_type},
+        Config=transfer_config()
+    )
+    stats = transfer_stats(reader.bytes_read, started)
+    stats['content_hash'] = reader.content_hash
+    print(f"📤 Streamed {stats['bytes']} bytes to s3://{bucket}/{key} in {stats['seconds']}s ({stats['throughput_kbps']} KB/s)")
+    return stats
+
+
+def spool(fileobj):
+    """Copy a file-like object into a temp file (in memory up to CHUNK_SIZE), hashing it on the way.
+
+    Returns (temp file rewound to the start, bytes, content_hash) so a caller can check the
+    hash for duplicates before uploading anything. The caller closes the temp file.
+    """
+    reader = CountingReader(fileobj)
+    spooled = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+    try:
+        shutil.copyfileobj(reader, spooled, CHUNK_SIZE)
+        spooled.seek(0)
+    except Exception:
+        spooled.close()
+        raise
+    return spooled, reader.bytes_read, reader.content_hash
+
+
+def upload_path_to_s3(s3_client, path, bucket, key, content_type, cache_control=None):
+    """Upload a local file from disk without reading it into memory. Returns transfer stats."""
+    extra_args = {'ContentType': content_type}
+    if cache_control:
+        extra_args['CacheControl'] = cache_control
+    started = time.monotonic()
+    s3_client.upload_file(
+        path, bucket, key,
+        ExtraArgs=extra_args,
+        Config=transfer_config()
+    )
+    stats = transfer_stats(os.path.getsize(path), started)
+    print(f"📤 Uploaded {stats['bytes']} bytes to s3://{bucket}/{key} in {stats['seconds']}s ({stats['throughput_kbps']} KB/s)")
+    return stats
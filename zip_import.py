@@ -0,0 +1,290 @@
+# Bulk import of audio files from a zip archive in S3
+# Runs as a 'zip_import' job. The archive is downloaded once (zipfile needs
+# random access to read the central directory), then members stream out of
+# it into S3 on a bounded thread pool while the job thread records finished
+# files in batched transactions. Members are hashed first, and audio whose
+# content_hash is already in the inbox is marked 'duplicate' without being
+# uploaded. Each member has a row in zip_import_files, so a re-run - a job
+# retry or POST /import/s3-zip/<id>/retry - only redoes the files that
+# haven't succeeded.
+# Uploaded members are read from the archive twice (hash, then upload)
+# rather than spooled between the passes: keeping every member's bytes until
+# the duplicate check would need disk for the whole unpacked archive, and
+# re-reading a local member is cheap next to the upload (audio barely
+# compresses, so most members are stored rather than deflated anyway).
+
+import os
+import time
+import hashlib
+import zipfile
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.exceptions import ClientError
+import db
+import jobs
+import storage
+import transfer
+
+# Concurrent member uploads; each holds up to S3_MULTIPART_CHUNK_MB * S3_TRANSFER_CONCURRENCY in memory
+UPLOAD_CONCURRENCY = int(os.environ.get('ZIP_IMPORT_CONCURRENCY') or 8)
+# Finished files recorded per transaction
+BATCH_SIZE = 100
+
+CONTENT_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.m4a': 'audio/mp4',
+    '.flac': 'audio/flac',
+    '.ogg': 'audio/ogg',
+}
+
+class ArchiveMissing(Exception):
+    """The import can't run: its zip_imports row or its archive in S3 is gone"""
+
+
+def create(zip_key, conn=None):
+    """Record a new import and queue its job (in the caller's transaction if conn is given). Returns the import id."""
+    own_conn = conn is None
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute("INSERT INTO zip_imports (zip_key) VALUES (?)", (zip_key,))
+    import_id = c.lastrowid
+    queue(import_id, conn)
+    if own_conn:
+        conn.commit()
+    return import_id
+
+
+def queue(import_id, conn):
+    job_id = jobs.enqueue('zip_import', {'import_id': import_id}, max_attempts=3, conn=conn)
+    conn.execute("UPDATE zip_imports SET status = 'queued', job_id = ?, error = NULL WHERE id = ?", (job_id, import_id))
+    return job_id
+
+
+class _ArchiveReaders:
+    """One ZipFile per pool thread for a run - a shared one serializes every read behind its file lock"""
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self._local = threading.local()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def open(self, member):
+        archive = getattr(self._local, 'archive', None)
+        if archive is None:
+            archive = self._local.archive = zipfile.ZipFile(self.archive_path)
+            with self._lock:
+                self._opened.append(archive)
+        return archive.open(member)
+
+    def close(self):
+        """Close every thread's ZipFile (once the pool is done with them)"""
+        with self._lock:
+            for archive in self._opened:
+                archive.close()
+            self._opened.clear()
+
+
+def _hash_member(archives, member):
+    """Runs on the pool: 'sha256:...' of one member, so duplicates are known before anything is uploaded"""
+    try:
+        digest = hashlib.sha256()
+        with archives.open(member) as member_file:
+            for chunk in iter(lambda: member_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return {'member': member, 'content_hash': 'sha256:' + digest.hexdigest(), 'error': None}
+    except Exception as e:
+        return {'member': member, 'error': f"{type(e).__name__}: {str(e)}"}
+
+
+def _upload_member(archives, member, content_hash, s3_client, bucket, date_folder):
+    """Runs on the pool: stream one member into S3. Never raises - failures come back in the result."""
+    original_name = os.path.basename(member)
+    # The hash in the key keeps same-named files from different folders (or archives) apart
+    s3_key = f"recordings/{date_folder}/imported_{content_hash[7:19]}_{original_name}"
+    try:
+        with archives.open(member) as member_file:
+            stats = transfer.stream_to_s3(
+                s3_client, member_file, bucket, s3_key,
+                CONTENT_TYPES.get(os.path.splitext(original_name)[1].lower(), 'application/octet-stream')
+            )
+        return {'member': member, 'name': original_name, 's3_key': s3_key,
+                's3_url': storage.object_url(bucket, s3_key), 'bytes': stats['bytes'],
+                'content_hash': content_hash, 'error': None}
+    except Exception as e:
+        return {'member': member, 'error': f"{type(e).__name__}: {str(e)}"}
+
+
+def _existing_hashes(conn, hashes):
+    """The subset of `hashes` already in the inbox"""
+    hashes = list(hashes)
+    found = set()
+    c = conn.cursor()
+    for start in range(0, len(hashes), 500):
+        chunk = hashes[start:start + 500]
+        c.execute(f"SELECT content_hash FROM inbox WHERE content_hash IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(row[0] for row in c.fetchall())
+    return found
+
+
+def _mark_duplicate(c, import_id, result):
+    c.execute("SELECT id FROM inbox WHERE content_hash = ?", (result['content_hash'],))
+    original = c.fetchone()
+    if original:
+        c.execute("""UPDATE zip_import_files SET status = 'duplicate', attempts = attempts + 1, inbox_id = ?, error = NULL
+                     WHERE import_id = ? AND member = ?""", (original[0], import_id, result['member']))
+    else:
+        # Same audio as another member of this archive whose upload failed - leave it for the re-run
+        c.execute("""UPDATE zip_import_files SET status = 'failed', attempts = attempts + 1, error = ?
+                     WHERE import_id = ? AND member = ?""",
+                  (f"Same audio as {result['duplicate']}, which didn't import", import_id, result['member']))
+
+
+def _record(conn, import_id, results, date_folder, s3_client, bucket):
+    """Insert the inbox rows for a batch of finished uploads and mark every file, in one transaction"""
+    c = conn.cursor()
+    orphaned = []
+    for result in results:
+        if result['error']:
+            c.execute("""UPDATE zip_import_files SET status = 'failed', attempts = attempts + 1, error = ?
+                         WHERE import_id = ? AND member = ?""", (result['error'], import_id, result['member']))
+            continue
+        if result.get('duplicate'):
+            _mark_duplicate(c, import_id, result)
+            continue
+        c.execute("""INSERT OR IGNORE INTO inbox
+                     (sender_name, sender_phone, content_type, title, content, s3_url, date_folder, content_hash)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                  ('Lady Ember', 'IMPORTED', 'voice',
+                   f"Imported: {result['name']}",
+                   f"Imported from zip archive - {result['name']}",
+                   result['s3_url'], date_folder, result['content_hash']))
+        if not c.rowcount:
+            # Another import added the same audio since we checked - our upload is a stray copy
+            _mark_duplicate(c, import_id, {**result, 'duplicate': 'another import'})
+            orphaned.append(result['s3_key'])
+            continue
+        c.execute("""UPDATE zip_import_files
+                     SET status = 'done', attempts = attempts + 1, s3_key = ?, inbox_id = ?, bytes = ?, error = NULL
+                     WHERE import_id = ? AND member = ?""",
+                  (result['s3_key'], c.lastrowid, result['bytes'], import_id, result['member']))
+    conn.commit()
+    for s3_key in orphaned:
+        try:
+            s3_client.delete_object(Bucket=bucket, Key=s3_key)
+        except Exception as e:
+            print(f"⚠️  Could not delete duplicate upload {s3_key}: {e}")
+
+
+def progress(import_id, conn=None):
+    """Import row plus per-status file counts and the failed files, or None"""
+    conn = conn or db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT * FROM zip_imports WHERE id = ?", (import_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    result = dict(row)
+    c.execute("SELECT status, COUNT(*) FROM zip_import_files WHERE import_id = ? GROUP BY status", (import_id,))
+    result['files'] = {status: count for status, count in c.fetchall()}
+    c.execute("""SELECT member, attempts, error FROM zip_import_files
+                 WHERE import_id = ? AND status = 'failed' ORDER BY member LIMIT 100""", (import_id,))
+    result['failed_files'] = [dict(failed) for failed in c.fetchall()]
+    c.execute("SELECT status, attempts, last_error FROM jobs WHERE id = ?", (row['job_id'],))
+    job = c.fetchone()
+    result['job'] = dict(job) if job else None
+    return result
+
+
+def run(import_id, job_id):
+    """Import every member of the archive that hasn't been imported yet. Returns a summary for the job."""
+    conn = db.get_db()
+    c = conn.cursor()
+    c.execute("SELECT zip_key FROM zip_imports WHERE id = ?", (import_id,))
+    row = c.fetchone()
+    if row is None:
+        # The import row was deleted (or never committed) - nothing to import, and retrying won't change that
+        raise ArchiveMissing(f"Zip import {import_id} not found")
+    zip_key = row[0]
+    c.execute("UPDATE zip_imports SET status = 'running', error = NULL WHERE id = ?", (import_id,))
+    conn.commit()
+
+    s3_client = storage.get_s3_client()
+    bucket = storage.bucket_name()
+    started = time.monotonic()
+    print(f"📦 Zip import {import_id}: downloading {zip_key} from {bucket}")
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_zip:
+        archive_path = temp_zip.name
+        try:
+            s3_client.download_fileobj(bucket, zip_key, temp_zip, Config=transfer.transfer_config())
+        except ClientError as e:
+            os.unlink(archive_path)
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                raise ArchiveMissing(f"File not found in S3: {zip_key}")
+            raise
+
+    archives = _ArchiveReaders(archive_path)
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [info.filename for info in archive.infolist()
+                       if not info.is_dir() and os.path.splitext(info.filename)[1].lower() in CONTENT_TYPES]
+        c.executemany("INSERT OR IGNORE INTO zip_import_files (import_id, member) VALUES (?, ?)",
+                      [(import_id, member) for member in members])
+        c.execute("UPDATE zip_imports SET total_files = ? WHERE id = ?", (len(members), import_id))
+        conn.commit()
+
+        c.execute("""SELECT member FROM zip_import_files
+                     WHERE import_id = ? AND status NOT IN ('done', 'duplicate')""", (import_id,))
+        todo = [row[0] for row in c.fetchall()]
+        date_folder = datetime.now().strftime('%Y-%m-%d')
+
+        with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as pool:
+            # Hash first: audio already in the inbox (a re-run, an overlapping export) is never uploaded
+            hashed = list(pool.map(lambda member: _hash_member(archives, member), todo))
+            existing = _existing_hashes(conn, {h['content_hash'] for h in hashed if not h['error']})
+            first_with_hash = {}
+            ready, later = [], []
+            for result in hashed:
+                if result['error']:
+                    ready.append(result)
+                elif result['content_hash'] in existing:
+                    ready.append({**result, 'duplicate': 'existing inbox item'})
+                elif result['content_hash'] in first_with_hash:
+                    # Recorded after the first copy's upload has finished
+                    later.append({**result, 'duplicate': first_with_hash[result['content_hash']]})
+                else:
+                    first_with_hash[result['content_hash']] = result['member']
+            _record(conn, import_id, ready, date_folder, s3_client, bucket)
+
+            futures = [pool.submit(_upload_member, archives, member, content_hash, s3_client, bucket, date_folder)
+                       for content_hash, member in first_with_hash.items()]
+            batch = []
+            for future in as_completed(futures):
+                batch.append(future.result())
+                if len(batch) >= BATCH_SIZE:
+                    _record(conn, import_id, batch, date_folder, s3_client, bucket)
+                    jobs.heartbeat(job_id, conn)
+                    batch = []
+            _record(conn, import_id, batch + later, date_folder, s3_client, bucket)
+    finally:
+        archives.close()
+        os.unlink(archive_path)
+
+    summary = progress(import_id, conn)['files']
+    status = 'partial' if summary.get('failed') else 'done'
+    c.execute("UPDATE zip_imports SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?", (status, import_id))
+    conn.commit()
+    seconds = round(time.monotonic() - started, 1)
+    print(f"📦 Zip import {import_id} {status}: {summary} in {seconds}s")
+    return {'status': status, 'files': summary, 'attempted': len(todo), 'seconds': seconds}
+
+
+def failed(import_id, error_msg):
+    """Mark the import failed once its job runs out of attempts (or the archive doesn't exist)"""
+    conn = db.get_db()
+    conn.execute("UPDATE zip_imports SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                 (error_msg, import_id))
+    conn.commit()